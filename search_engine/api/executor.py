@@ -0,0 +1,51 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+class Overloaded(Exception):
+    """Raised when a BoundedExecutor has no room for another call."""
+
+
+class BoundedExecutor:
+    """
+    A dedicated thread pool for blocking calls made from async endpoints,
+    with admission control: at most max_in_flight calls are running or
+    queued, and further calls are rejected straight away rather than left
+    to pile up. A call that exceeds its timeout is abandoned by the caller
+    but keeps its slot until its thread actually finishes, so timeouts
+    can't be used to queue unbounded work.
+    """
+    def __init__(self, workers, max_in_flight, timeout, name):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.in_flight = 0  # only touched from the event loop thread
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    async def run(self, fn, *args, **kwargs):
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise Overloaded(f"{self.in_flight} calls in flight")
+        self.in_flight += 1
+        future = asyncio.wrap_future(self.pool.submit(functools.partial(fn, *args, **kwargs)))
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def _release(self, future):
+        self.in_flight -= 1
+        self.completed += 1
+        if not future.cancelled():
+            future.exception()  # retrieved, so a timed-out failure isn't logged as unhandled
+
+    def stats(self):
+        return {'in_flight': self.in_flight, 'max_in_flight': self.max_in_flight,
+                'completed': self.completed, 'rejected': self.rejected, 'timeouts': self.timeouts}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,96 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    One background crawl or index run. progress is an optional callable the
+    task sets once it has something to report; it is read when the job is
+    shown, so live counters cost nothing until someone looks.
+    """
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.result = None
+        self.progress = None
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        info = {'id': self.id, 'kind': self.kind, 'params': self.params, 'state': self.state,
+                'submitted_at': self.submitted_at, 'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'duration': end - self.started_at if self.started_at else None}
+        if self.error:
+            info['error'] = self.error
+        if self.result is not None:
+            info['result'] = self.result
+        if self.progress and self.state == "running":
+            try:
+                info['progress'] = self.progress()
+            except Exception as e:  # a half torn-down task; not worth failing the status page for
+                info['progress'] = {'error': str(e)}
+        return info
+
+
+class JobTracker:
+    """
+    Runs admin jobs on an executor and remembers how they went. At most
+    one job of each kind is queued or running at a time, and the last
+    JOB_HISTORY finished ones are kept for /admin/status.
+    """
+    def __init__(self, executor, history=None):
+        self.executor = executor
+        self.active = {}  # kind -> Job
+        self.finished = deque(maxlen=history or config.JOB_HISTORY)
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(self, kind, fn, *args, **params):
+        """
+        Run fn(job, *args, **params) in the background, or return None if a
+        job of this kind is already queued or running.
+        """
+        with self.lock:
+            if kind in self.active:
+                return None
+            job = self.active[kind] = Job(next(self._ids), kind, params)
+        self.executor.submit(self._run, job, fn, args, params)
+        return job
+
+    def _run(self, job, fn, args, params):
+        job.state = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **params)
+            job.state = "succeeded"
+        except Exception as e:
+            logger.exception(f"{job.kind} job {job.id} failed")
+            job.error = f"{type(e).__name__}: {e}"
+            job.state = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.progress = None
+            with self.lock:
+                del self.active[job.kind]
+                self.finished.appendleft(job)
+
+    def is_running(self, kind):
+        return kind in self.active
+
+    def stats(self):
+        with self.lock:
+            active, finished = list(self.active.values()), list(self.finished)
+        return {'active': [job.to_dict() for job in active],
+                'finished': [job.to_dict() for job in finished]}
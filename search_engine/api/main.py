@@ -1,78 +1,292 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException
-from ..indexer.ranker import Ranker
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import Body, FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from .executor import BoundedExecutor, Overloaded
+from .jobs import JobTracker
+from .suggest import Suggester
+from ..indexer.ranker import Ranker, ranking_params, decode_cursor
 from ..indexer.inverted_index import InvertedIndex
 from ..indexer.pagerank import PageRank
+from ..indexer.segments import SegmentMerger
+from ..indexer.snapshot import export_snapshot
 from ..crawler.crawler_worker import CrawlerWorker
-from ..crawler.url_queue import URLQueue
+from ..crawler.frontier import create_frontier
 from ..crawler.seed_manager import SeedManager
 from ..crawler.fetcher import Fetcher
 from ..crawler.parser import Parser
-from .. import config
+from ..crawler.page_writer import PageWriter
+from ..crawler.async_crawler import AsyncCrawler
+from ..crawler.freshness import FreshnessScheduler
+from ..crawler.dedup import Deduplicator
+from .. import config, metrics
 import uvicorn
 import threading
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("SearchEngineAPI")
 
-app = FastAPI(title="Mini Google Search Engine")
-ranker = Ranker()
-inverted_index = InvertedIndex()
-pagerank = PageRank()
-crawler_running = False
-crawler_thread = None
+@asynccontextmanager
+async def lifespan(app):
+    if segment_merger:
+        segment_merger.start()
+    suggester.refresh_in_background()
+    yield
+    if segment_merger:
+        segment_merger.stop()
+    search_executor.shutdown()
+    job_executor.shutdown(wait=False)
+    suggest_executor.shutdown(wait=False)
+
+app = FastAPI(title="Mini Google Search Engine", lifespan=lifespan)
+if config.REPLICA_SNAPSHOT_PATH:
+    # A replica serves the snapshot alone: no database, index or merger of its own
+    ranker = Ranker(snapshot=config.REPLICA_SNAPSHOT_PATH)
+    inverted_index = pagerank = None
+else:
+    ranker = Ranker()
+    inverted_index = InvertedIndex()
+    pagerank = PageRank()
+# Searches get their own bounded pool; crawls and index builds run on
+# another, so neither can starve the other or the admin endpoints
+search_executor = BoundedExecutor(config.SEARCH_WORKERS, config.SEARCH_MAX_IN_FLIGHT,
+                                  config.SEARCH_TIMEOUT, "search")
+job_executor = ThreadPoolExecutor(max_workers=config.ADMIN_JOB_WORKERS, thread_name_prefix="admin-job")
+jobs = JobTracker(job_executor)
+# Its own worker, so dictionary rebuilds never wait behind a crawl
+suggest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="suggest")
+suggester = Suggester(ranker.vocabulary, suggest_executor)
+segment_merger = SegmentMerger(inverted_index.segments) if inverted_index and inverted_index.segments else None
+if config.MEMORY_INDEX and not config.REPLICA_SNAPSHOT_PATH:
+    ranker.load_posting_index()
+
+# Figures kept by the components themselves, read when /metrics is scraped
+metrics.Gauge('search_in_flight', 'Searches running or queued').set_function(lambda: search_executor.in_flight)
+metrics.Counter('search_rejected_total', 'Searches turned away with 503').set_function(
+    lambda: search_executor.rejected)
+metrics.Counter('search_timeouts_total', 'Searches that got 504').set_function(lambda: search_executor.timeouts)
+metrics.Counter('search_cache_lookups_total', 'Result cache lookups by outcome', ['result']).set_function(
+    lambda: {('hit',): ranker.cache.hits, ('miss',): ranker.cache.misses})
+metrics.Gauge('search_cache_bytes', 'Estimated size of cached results').set_function(lambda: ranker.cache.bytes)
+metrics.Gauge('suggest_dictionary_terms', 'Words in the /suggest term dictionary').set_function(
+    lambda: len(suggester.dictionary) if suggester.dictionary else 0)
+metrics.Gauge('jobs_running', 'Admin jobs queued or running, by kind', ['kind']).set_function(
+    lambda: {(kind,): int(jobs.is_running(kind)) for kind in ("crawl", "index", "snapshot")})
+if segment_merger:
+    metrics.Counter('segment_merges_total', 'Segment merges done by the background merger').set_function(
+        lambda: segment_merger.merges)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Mini Google API. Use /search?q=query to search."}
 
+def check_limit(limit):
+    if not 0 < limit <= config.SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {config.SEARCH_MAX_LIMIT}")
+
 @app.get("/search")
-def search(q: str):
-    if not q:
+async def search(q: str = None, limit: int = 10, cursor: str = None, model: str = None, k1: float = None,
+           b: float = None, title_boost: float = None, text_weight: float = None, pagerank_weight: float = None,
+           proximity_weight: float = None):
+    """A page of results and the cursor for the next; a cursor carries its query and ranking parameters."""
+    check_limit(limit)
+    if cursor:
+        try:
+            q = decode_cursor(cursor)['query']
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif not q:
         raise HTTPException(status_code=400, detail="Query parameter 'q' is required")
-    
-    results = ranker.search(q)
+    try:
+        params = ranking_params(model, k1, b, title_boost, text_weight, pagerank_weight, proximity_weight)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        results, next_cursor = await search_executor.run(ranker.search_page, q, limit, params, cursor)
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Too many searches in progress",
+                            headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Search timed out")
     return {
         "query": q,
         "count": len(results),
-        "results": results
+        "results": results,
+        "next_cursor": next_cursor
     }
 
-def run_crawler_task():
-    global crawler_running
-    logger.info("Starting crawler task...")
+@app.post("/search/batch")
+async def search_batch(queries: List[str] = Body(..., embed=True), limit: int = 10, model: str = None,
+                       k1: float = None, b: float = None, title_boost: float = None, text_weight: float = None,
+                       pagerank_weight: float = None, proximity_weight: float = None):
+    """
+    Results for every query of a JSON body {"queries": [...]}, streamed as
+    one JSON line per query in order. Each query takes a search worker in
+    turn; a line with an "error" ends the stream early.
+    """
+    check_limit(limit)
+    if not 0 < len(queries) <= config.SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400,
+                            detail=f"queries must hold between 1 and {config.SEARCH_BATCH_MAX_QUERIES} queries")
+    try:
+        params = ranking_params(model, k1, b, title_boost, text_weight, pagerank_weight, proximity_weight)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    batch = ranker.search_batch(queries, limit, params)
+
+    async def lines():
+        for query in queries:
+            try:
+                results = await search_executor.run(next, batch)
+            except Overloaded:
+                error = "Too many searches in progress"
+            except asyncio.TimeoutError:
+                error = "Search timed out"
+            else:
+                yield json.dumps({"query": query, "count": len(results), "results": results}) + "\n"
+                continue
+            yield json.dumps({"query": query, "error": error}) + "\n"
+            return
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/suggest")
+async def suggest(prefix: str = "", limit: int = None):
+    limit = config.SUGGEST_LIMIT if limit is None else limit
+    if not 0 < limit <= config.SUGGEST_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {config.SUGGEST_MAX_RESULTS}")
+    # Microseconds of in-memory work: answered on the event loop, not a worker pool
+    suggestions = suggester.suggest(prefix, limit)
+    if suggestions is None:
+        raise HTTPException(status_code=503, detail="Term dictionary is still loading",
+                            headers={"Retry-After": "1"})
+    return {"prefix": prefix, "suggestions": suggestions}
+
+def run_crawler_task(job=None, engine=None, recrawl=False):
+    engine = engine or config.CRAWLER_ENGINE
+    logger.info(f"Starting {'re-crawl' if recrawl else 'crawler'} task ({engine} engine)...")
     
-    queue = URLQueue()
+    queue = create_frontier()
     fetcher = Fetcher()
     parser = Parser()
-    for url in SeedManager.get_seed_urls():
-        queue.add_url(url)
-        
-    workers = []
-    for _ in range(5): # 5 threads
-        worker = CrawlerWorker(queue, fetcher, parser)
-        worker.start()
-        workers.append(worker)
-    pass
+    writer = PageWriter()
+    writer.start()
+    dedup = Deduplicator() if config.NEAR_DUPLICATE_DETECTION else None
+    if recrawl:
+        # Revisit pages whose refresh interval has elapsed; conditional
+        # requests keep unchanged ones cheap
+        for url in FreshnessScheduler().due_urls():
+            queue.requeue(url)
+    else:
+        for url in SeedManager.get_seed_urls():
+            queue.add_url(url)
+
+    metrics.FRONTIER_SIZE.set_function(queue.size)
+    metrics.WRITER_QUEUE_DEPTH.set_function(writer.queue.qsize)
+    if job:
+        job.progress = lambda: {'pages_written': writer.pages_written, 'frontier': queue.size(),
+                                'near_duplicates': dedup.duplicates if dedup else 0}
+    try:
+        if engine == "async":
+            AsyncCrawler(queue, fetcher, parser, writer, dedup=dedup).run()
+        else:
+            workers = []
+            for _ in range(5): # 5 threads
+                worker = CrawlerWorker(queue, fetcher, parser, writer, dedup)
+                worker.start()
+                workers.append(worker)
+
+            for worker in workers:
+                worker.join()
+    finally:
+        writer.close()
+        queue.close()
+        metrics.FRONTIER_SIZE.set_function(None)
+        metrics.WRITER_QUEUE_DEPTH.set_function(None)
+    logger.info(f"Crawler task finished, {writer.pages_written} pages written.")
+    return {'pages_written': writer.pages_written, 'near_duplicates': dedup.duplicates if dedup else 0}
+
+def reject_on_replica():
+    if config.REPLICA_SNAPSHOT_PATH:
+        raise HTTPException(status_code=409, detail="This replica serves a snapshot; run this on the primary")
 
 @app.post("/admin/crawl")
-def trigger_crawl(background_tasks: BackgroundTasks):
-    global crawler_running
-    if crawler_running:
+def trigger_crawl(engine: str = None, recrawl: bool = False):
+    reject_on_replica()
+    if engine not in (None, "threaded", "async"):
+        raise HTTPException(status_code=400, detail="engine must be 'threaded' or 'async'")
+    job = jobs.submit("crawl", run_crawler_task, engine=engine, recrawl=recrawl)
+    if job is None:
          return {"message": "Crawler already running"}
-    
-    background_tasks.add_task(run_crawler_task)
-    crawler_running = True # This state mgmt is simplistic
-    return {"message": "Crawler started in background"}
+    return {"message": "Crawler started in background", "job": job.id}
+
+def run_index_task(job=None, full=False):
+    indexed = inverted_index.build_index(full=full)
+    pagerank.calculate_pagerank()
+    if segment_merger:
+        inverted_index.segments.update_pageranks()
+        segment_merger.wake()
+    elif config.MEMORY_INDEX:
+        ranker.load_posting_index(build=True)
+    ranker.cache.bump_generation()
+    suggester.refresh()
+    logger.info("Indexing and PageRank complete.")
+    return {'indexed': indexed, 'pagerank_iterations': pagerank.iterations, 'pagerank_residual': pagerank.residual}
 
 @app.post("/admin/index")
-def trigger_indexing(background_tasks: BackgroundTasks):
-    def index_task():
-        inverted_index.build_index()
-        pagerank.calculate_pagerank()
-        logger.info("Indexing and PageRank complete.")
-        
-    background_tasks.add_task(index_task)
-    return {"message": "Indexing started in background"}
+def trigger_indexing(full: bool = False):
+    reject_on_replica()
+    job = jobs.submit("index", run_index_task, full=full)
+    if job is None:
+        return {"message": "Indexing already running"}
+    return {"message": "Indexing started in background", "job": job.id}
+
+def run_snapshot_task(job=None):
+    return export_snapshot(segments=inverted_index.segments)
+
+@app.post("/admin/snapshot")
+def trigger_snapshot():
+    reject_on_replica()
+    job = jobs.submit("snapshot", run_snapshot_task)
+    if job is None:
+        return {"message": "Snapshot export already running"}
+    return {"message": f"Exporting snapshot to {config.SNAPSHOT_EXPORT_PATH}", "job": job.id}
+
+@app.get("/admin/status")
+def status():
+    return {'crawler_running': jobs.is_running("crawl"), 'indexing': jobs.is_running("index"),
+            'jobs': jobs.stats()}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/cache")
+def cache_stats():
+    return ranker.cache.stats()
+
+@app.get("/admin/suggest")
+def suggest_stats():
+    return suggester.stats()
+
+@app.get("/admin/search-pool")
+async def search_pool_stats():
+    return search_executor.stats()
+
+@app.get("/admin/segments")
+def segment_stats():
+    if not inverted_index or not inverted_index.segments:
+        raise HTTPException(status_code=404, detail="INDEX_BACKEND is not 'segments'")
+    return {**inverted_index.segments.stats(), 'merges': segment_merger.merges}
+
+@app.delete("/admin/cache")
+def clear_cache():
+    ranker.cache.clear()
+    return {"message": "Search cache cleared"}
 
 if __name__ == "__main__":
     uvicorn.run("search_engine.api.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,66 @@
+import threading
+import time
+import logging
+from ..indexer.term_dictionary import TermDictionary
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+
+class Suggester:
+    """
+    Keeps the TermDictionary that /suggest answers from. It is built in
+    the background at startup and rebuilt after every index job. Workers
+    that didn't run the job rebuild it in the background once it is older
+    than SUGGEST_REFRESH_INTERVAL. Until a rebuild finishes, the previous
+    dictionary keeps answering.
+    """
+    def __init__(self, vocabulary, executor):
+        self.vocabulary = vocabulary  # callable returning (word, df) pairs in word order
+        self.executor = executor
+        self.dictionary = None
+        self.built_at = None
+        self.build_seconds = None
+        self._building = threading.Lock()
+        self._scheduled = False  # a background rebuild is queued or running
+        self._scheduling = threading.Lock()
+
+    def refresh(self):
+        """Rebuild the dictionary in this thread, after any rebuild already running."""
+        with self._building:
+            start = time.monotonic()
+            self.dictionary = TermDictionary(self.vocabulary())
+            self.built_at = time.monotonic()
+            self.build_seconds = self.built_at - start
+        logger.info(f"Built term dictionary: {len(self.dictionary)} terms in {self.build_seconds:.2f}s")
+
+    def refresh_in_background(self):
+        """Queue a rebuild unless one is already queued or running."""
+        with self._scheduling:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.executor.submit(self._refresh_logged)
+
+    def _refresh_logged(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Term dictionary rebuild failed")
+        finally:
+            with self._scheduling:
+                self._scheduled = False
+
+    def suggest(self, text, limit=None):
+        """TermDictionary.suggest, or None until the first dictionary is built."""
+        if self.built_at is None or time.monotonic() - self.built_at > config.SUGGEST_REFRESH_INTERVAL:
+            self.refresh_in_background()
+        if self.dictionary is None:
+            return None
+        return self.dictionary.suggest(text, limit)
+
+    def stats(self):
+        if self.dictionary is None:
+            return {'ready': False}
+        return {'ready': True, **self.dictionary.stats(), 'build_seconds': self.build_seconds,
+                'age_seconds': time.monotonic() - self.built_at}
@@ -0,0 +1,152 @@
+"""
+Batch search throughput: queries per second answered by Ranker.search
+one query at a time against Ranker.search_batch, and over HTTP by
+/search requests against /search/batch requests streaming NDJSON, for
+a synthetic corpus's query log and for queries sharing common words.
+The result cache is off, so every query is ranked. Also the cost of
+paging through a query with /search cursors against asking for each
+page's results from scratch.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_batch [size]
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+import numpy as np
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure ranking, not the result cache
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.pagerank import PageRank
+from ..indexer.ranker import Ranker
+from .bench_pruning import common_queries
+from .corpus import Corpus
+
+BATCH_SIZE = 50
+CONCURRENCY = 4
+PAGES = 10
+
+SERVER = """
+import uvicorn
+from search_engine import config
+config.DATABASE_PATH = {database!r}
+config.QUERY_CACHE_MAX_ENTRIES = 0
+from search_engine.api.main import app
+uvicorn.run(app, host="127.0.0.1", port={port}, log_level="error")
+"""
+
+
+def batches(queries):
+    return [queries[i:i + BATCH_SIZE] for i in range(0, len(queries), BATCH_SIZE)]
+
+
+def in_process(ranker, queries):
+    """Queries per second, one search() at a time and in search_batch() calls of BATCH_SIZE."""
+    start = time.perf_counter()
+    single = [ranker.search(query) for query in queries]
+    single_rate = len(queries) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    batched = [results for batch in batches(queries) for results in ranker.search_batch(batch)]
+    batch_rate = len(queries) / (time.perf_counter() - start)
+    return single_rate, batch_rate, single == batched
+
+
+def start_server():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    root = os.path.dirname(config.BASE_DIR)
+    server = subprocess.Popen([sys.executable, "-c", SERVER.format(database=config.DATABASE_PATH, port=port)],
+                              cwd=root, env={**os.environ, 'PYTHONPATH': root})
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return f"http://127.0.0.1:{port}", server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            time.sleep(0.1)
+
+
+async def over_http(url, queries):
+    """Queries per second over CONCURRENCY connections, as /search calls and as /search/batch calls."""
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as session:
+        async def single(work):
+            while work:
+                async with session.get(f"{url}/search", params={'q': work.pop()}) as response:
+                    await response.json()
+
+        async def batch(work):
+            while work:
+                async with session.post(f"{url}/search/batch", json={'queries': work.pop()}) as response:
+                    async for line in response.content:
+                        json.loads(line)
+
+        rates = []
+        for client, work in ((single, list(queries)), (batch, batches(queries))):
+            start = time.perf_counter()
+            await asyncio.gather(*(client(work) for _ in range(CONCURRENCY)))
+            rates.append(len(queries) / (time.perf_counter() - start))
+        return rates
+
+
+def paging(ranker, queries):
+    """ms per page of PAGES pages of 10: following cursors, and re-ranking page * 10 results each time."""
+    cursor_ms, rerank_ms = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results, cursor = ranker.search_page(query, 10)
+        for _ in range(PAGES - 1):
+            if cursor is None:
+                break
+            results, cursor = ranker.search_page(cursor=cursor, limit=10)
+        cursor_ms.append((time.perf_counter() - start) * 1000 / PAGES)
+        start = time.perf_counter()
+        for page in range(1, PAGES + 1):
+            ranker.search(query, limit=page * 10)[-10:]
+        rerank_ms.append((time.perf_counter() - start) * 1000 / PAGES)
+    return np.mean(cursor_ms), np.mean(rerank_ms)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    db = Database()
+    corpus = Corpus.sized(sys.argv[1] if len(sys.argv) > 1 else '10k')
+    corpus.generate(db)
+    PageRank().calculate_pagerank()
+    InvertedIndex().build_index(full=True)
+    query_sets = {'query log': corpus.query_log(db), 'common words': common_queries(corpus, 200)}
+    ranker = Ranker()
+    print(f"{corpus.pages} pages, batches of {BATCH_SIZE}, {CONCURRENCY} HTTP connections\n")
+
+    url, server = start_server()
+    try:
+        print(f"{'queries':<14}{'':<10}{'single q/s':>12}{'batch q/s':>12}{'speedup':>9}")
+        for name, queries in query_sets.items():
+            single, batched, same = in_process(ranker, queries)
+            print(f"{name:<14}{'ranker':<10}{single:>12.0f}{batched:>12.0f}{batched / single:>8.2f}x"
+                  f"  {'identical' if same else 'RESULTS DIFFER'}")
+            single, batched = asyncio.run(over_http(url, queries))
+            print(f"{'':<14}{'http':<10}{single:>12.0f}{batched:>12.0f}{batched / single:>8.2f}x")
+    finally:
+        server.terminate()
+        server.wait()
+
+    cursor_ms, rerank_ms = paging(ranker, query_sets['common words'][:50])
+    print(f"\n{PAGES} pages of 10: {cursor_ms:.2f} ms per page following cursors, "
+          f"{rerank_ms:.2f} ms ranking each page's results from scratch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Connections opened per crawled page and per search, with and without the
+per-thread connection pool.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_connections
+"""
+import logging
+import os
+import queue
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+config.DELAY_BETWEEN_REQUESTS = 0
+
+from ..storage.database import Database
+from ..crawler.crawler_worker import CrawlerWorker
+from ..crawler.fetcher import FetchResult
+from ..crawler.url_queue import URLQueue
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.ranker import Ranker
+
+OUTLINKS = 200
+PAGES = 5
+QUERY = "python web crawler"
+
+
+class StubRobots:
+    @staticmethod
+    def crawl_delay(url):
+        return 0
+
+
+class StubFetcher:
+    robots = StubRobots()
+
+    def fetch(self, url):
+        return "<html></html>"
+
+    def fetch_conditional(self, url, meta=None):
+        return FetchResult(200, self.fetch(url))
+
+
+class StubParser:
+    @staticmethod
+    def parse(html, base_url):
+        links = [f"{base_url}/out/{i}" for i in range(OUTLINKS)]
+        return {
+            'title': base_url,
+            'text': "python web crawler written in python for the web",
+            'links': links,
+            'content': html
+        }
+
+
+class SeedOnlyQueue(URLQueue):
+    """
+    Hands out the seeded pages only; outlinks are stored but never fetched.
+    add_urls, get_depth, set_host_delay and task_done are URLQueue's.
+    """
+    def add_url(self, url, depth=0, priority=0.0):
+        return False
+
+    def get_url(self):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+def crawl_pages(db, round_no):
+    frontier = SeedOnlyQueue()
+    seeds = [f"http://bench.local/{round_no}/{i}" for i in range(PAGES)]
+    for url in seeds:
+        frontier.queue.put(url)
+    before = db.stats['connections_opened']
+    start = time.perf_counter()
+    CrawlerWorker(frontier, StubFetcher(), StubParser()).run()
+    elapsed = time.perf_counter() - start
+    with db.get_connection() as conn:
+        stored = conn.execute(f"SELECT COUNT(*) FROM pages WHERE title IS NOT NULL AND url IN "
+                              f"({','.join('?' * PAGES)})", seeds).fetchone()[0]
+    if stored != PAGES:
+        raise RuntimeError(f"{stored} of {PAGES} crawled pages were stored")
+    return (db.stats['connections_opened'] - before) / PAGES, elapsed / PAGES
+
+
+def run_queries(db, n=20):
+    ranker = Ranker()
+    before = db.stats['connections_opened']
+    start = time.perf_counter()
+    for _ in range(n):
+        ranker.search(QUERY)
+    elapsed = time.perf_counter() - start
+    return (db.stats['connections_opened'] - before) / n, elapsed / n
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    db = Database()
+    rows = []
+    for round_no, pooled in enumerate((False, True)):
+        config.DB_POOL_CONNECTIONS = pooled
+        db.close_all()
+        conns_page, secs_page = crawl_pages(db, round_no)
+        InvertedIndex().build_index()
+        conns_query, secs_query = run_queries(db)
+        rows.append(("pooled" if pooled else "per-call", conns_page, secs_page, conns_query, secs_query))
+
+    print(f"{'mode':<10}{'conns/page':>12}{'ms/page':>10}{'conns/query':>13}{'ms/query':>10}")
+    for mode, cp, sp, cq, sq in rows:
+        print(f"{mode:<10}{cp:>12.1f}{sp * 1000:>10.2f}{cq:>13.1f}{sq * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
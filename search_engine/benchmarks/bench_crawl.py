@@ -0,0 +1,64 @@
+"""
+Crawl throughput of the threaded and asyncio engines against the local
+stub site, with the same per-request politeness delay.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_crawl
+"""
+import logging
+import os
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from ..storage.database import Database
+from ..crawler.crawler_worker import CrawlerWorker
+from ..crawler.async_crawler import AsyncCrawler
+from ..crawler.url_queue import URLQueue
+from ..crawler.fetcher import Fetcher
+from ..crawler.parser import Parser
+from ..crawler.page_writer import PageWriter
+from .stub_server import StubSite
+
+PAGES = 300
+HOSTS = 10
+DELAY = 0.05  # seconds, global sleep for threaded workers / per-host spacing for async
+LATENCY = 0.02  # seconds the stub takes per response
+
+
+def crawl(engine, site):
+    queue = URLQueue()
+    for url in site.seed_urls(HOSTS):
+        queue.add_url(url)
+    writer = PageWriter()
+    writer.start()
+    start = time.perf_counter()
+    if engine == "async":
+        AsyncCrawler(queue, Fetcher(), Parser(), writer, max_pages=PAGES).run()
+    else:
+        workers = [CrawlerWorker(queue, Fetcher(), Parser(), writer) for _ in range(5)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    writer.close()
+    # Threaded workers idle for one get_url() timeout before exiting
+    idle = 1.0 if engine == "threaded" else 0.0
+    return writer.pages_written / (time.perf_counter() - start - idle)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    config.DELAY_BETWEEN_REQUESTS = DELAY
+    config.HOST_MIN_DELAY = DELAY
+    Database()
+    print(f"{'engine':<10}{'pages/sec':>12}")
+    for engine in ("threaded", "async"):
+        with StubSite(pages=PAGES, hosts=HOSTS, latency=LATENCY) as site:
+            print(f"{engine:<10}{crawl(engine, site):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
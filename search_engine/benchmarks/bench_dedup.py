@@ -0,0 +1,108 @@
+"""
+Crawl of a stub site whose links spell each page several ways (query
+string order, tracking parameters, index.html, fragments) and where a
+quarter of the pages mirror another one. Compares fetches, stored pages,
+index size and duplicate hits in the top 10 with URL canonicalization and
+near-duplicate detection off and on, the latter at the default
+DEDUP_MAX_DISTANCE and at a looser one.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_dedup
+"""
+import logging
+import os
+import tempfile
+import time
+from urllib.parse import urlsplit
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0
+
+from ..storage.database import Database
+from ..crawler.async_crawler import AsyncCrawler
+from ..crawler.url_queue import URLQueue
+from ..crawler.fetcher import Fetcher
+from ..crawler.parser import Parser
+from ..crawler.page_writer import PageWriter
+from ..crawler.dedup import Deduplicator
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.pagerank import PageRank
+from ..indexer.ranker import Ranker
+from .stub_server import StubSite, WORDS
+
+PAGES = 400
+HOSTS = 4
+MIRRORED = 0.25
+QUERIES = [f"{a} {b}" for a, b in zip(WORDS, WORDS[1:])]
+
+
+def reset(db):
+    with db.get_connection() as conn:
+        for table in ('pages', 'links', 'keywords', 'term_stats', 'collection_stats', 'fetch_meta'):
+            conn.execute(f'DELETE FROM {table}')
+
+
+def page_number(url):
+    path = urlsplit(url).path.rstrip('/')
+    return int(path.rsplit('/', 1)[-1])
+
+
+def crawl(site, db, dedup):
+    config.CANONICALIZE_URLS = bool(dedup)
+    queue = URLQueue()
+    for url in site.seed_urls(HOSTS):
+        queue.add_url(url)
+    writer = PageWriter()
+    writer.start()
+    requests = site.requests - site.robots_requests
+    start = time.perf_counter()
+    crawler = AsyncCrawler(queue, Fetcher(), Parser(), writer, max_pages=PAGES * 10,
+                           dedup=Deduplicator(dedup) if dedup else None)
+    crawler.run()
+    writer.close()
+    crawl_time = time.perf_counter() - start
+    fetches = site.requests - site.robots_requests - requests
+
+    start = time.perf_counter()
+    InvertedIndex().build_index()
+    PageRank().calculate_pagerank()
+    index_time = time.perf_counter() - start
+
+    with db.get_connection() as conn:
+        stored = conn.execute('SELECT COUNT(*) FROM pages WHERE cleaned_text IS NOT NULL').fetchone()[0]
+        links = conn.execute('SELECT COUNT(*) FROM links').fetchone()[0]
+        postings = conn.execute('SELECT COUNT(*) FROM keywords').fetchone()[0]
+
+    ranker = Ranker()
+    repeats = shown = 0
+    for query in QUERIES:
+        seen = set()
+        for result in ranker.search(query):
+            original = site.originals[page_number(result['url'])]
+            repeats += original in seen
+            seen.add(original)
+            shown += 1
+    return fetches, crawl_time, stored, links, postings, index_time, repeats / max(shown, 1)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    config.MAX_DEPTH = 100
+    config.HOST_MIN_DELAY = 0.0
+    db = Database()
+    print(f"{PAGES} pages, {int(PAGES * MIRRORED)} of them mirrors of another; "
+          f"mirrors differ in their title and one word\n")
+    print(f"{'dedup':<7}{'fetches':>9}{'crawl s':>9}{'stored':>8}{'links':>8}{'postings':>10}"
+          f"{'index s':>9}{'dup top10':>11}")
+    # dedup: DEDUP_MAX_DISTANCE, or None for no canonicalization or detection
+    for dedup in (None, config.DEDUP_MAX_DISTANCE, 6):
+        reset(db)
+        with StubSite(pages=PAGES, hosts=HOSTS, duplicates=MIRRORED, url_variants=True) as site:
+            fetches, crawl_time, stored, links, postings, index_time, repeats = crawl(site, db, dedup)
+        print(f"{f'k={dedup}' if dedup else 'off':<7}{fetches:>9}{crawl_time:>9.2f}{stored:>8}{links:>8}{postings:>10}"
+              f"{index_time:>9.2f}{repeats:>11.1%}")
+
+
+if __name__ == "__main__":
+    main()
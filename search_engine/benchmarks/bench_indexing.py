@@ -0,0 +1,62 @@
+"""
+Initial index build vs. an incremental re-index after a small crawl that
+touches 1% of the pages.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_indexing [pages]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from .stub_server import WORDS
+
+
+def make_text(rng, words=300):
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 200)) for _ in range(words))
+
+
+def load_pages(db, rng, count):
+    pages = [{'url': f"http://bench.local/{i}", 'title': f"Page {i}", 'content': None,
+              'text': make_text(rng), 'links': []} for i in range(count)]
+    for start in range(0, count, 1000):
+        db.save_crawl_batch(pages[start:start + 1000])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = random.Random(7)
+    db = Database()
+    index = InvertedIndex()
+    load_pages(db, rng, count)
+
+    indexed, initial = timed(index.build_index)
+    print(f"initial build:     {indexed:>7} pages in {initial:7.2f}s")
+
+    changed = rng.sample(range(count), count // 100)
+    db.save_crawl_batch([{'url': f"http://bench.local/{i}", 'title': f"Page {i}", 'content': None,
+                          'text': make_text(rng, 100), 'links': []} for i in changed])
+    indexed, incremental = timed(index.build_index)
+    print(f"incremental build: {indexed:>7} pages in {incremental:7.2f}s")
+
+    indexed, noop = timed(index.build_index)
+    print(f"no-change build:   {indexed:>7} pages in {noop:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Cost of the pipeline metrics: the price of one histogram observation and
+counter increment, search latency and index build time with
+METRICS_ENABLED on and off, and how long rendering /metrics takes.
+With metrics off, updates still cost a call and a flag check, so the
+difference is slightly less than the total overhead.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_metrics [pages]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+
+from .. import metrics
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.ranker import Ranker
+from .bench_indexing import load_pages
+from .bench_search import QUERIES
+
+CALLS = 200000
+ROUNDS = 5
+
+
+def per_call(fn):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        fn()
+    return (time.perf_counter() - start) / CALLS * 1e9
+
+
+def search_p50(ranker, queries, runs=30):
+    timings = []
+    for _ in range(runs):
+        for query in queries:
+            start = time.perf_counter()
+            ranker.search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db = Database()
+    load_pages(db, random.Random(7), count)
+    index = InvertedIndex()
+    ranker = Ranker()
+    queries = [query for group in QUERIES.values() for query in group]
+
+    histogram = metrics.SEARCH_STAGE_SECONDS.labels("postings")
+    counter = metrics.FETCHES.labels("bench.local", "200")
+    print(f"histogram observe: {per_call(lambda: histogram.observe(0.003)):.0f} ns, "
+          f"counter inc: {per_call(counter.inc):.0f} ns, "
+          f"labelled observe: {per_call(lambda: metrics.FETCH_SECONDS.labels('bench.local').observe(0.1)):.0f} ns\n")
+
+    # Alternate on and off so drift in the machine affects both alike
+    results = {True: {'search': [], 'index': []}, False: {'search': [], 'index': []}}
+    for _ in range(ROUNDS):
+        for enabled in (True, False):
+            config.METRICS_ENABLED = enabled
+            start = time.perf_counter()
+            index.build_index(full=True)
+            results[enabled]['index'].append(time.perf_counter() - start)
+            results[enabled]['search'].append(search_p50(ranker, queries))
+    config.METRICS_ENABLED = True
+
+    print(f"{'metrics':<9}{'search p50 ms':>15}{'index build s':>15}")
+    for enabled in (True, False):
+        search = sorted(results[enabled]['search'])[ROUNDS // 2]
+        build = sorted(results[enabled]['index'])[ROUNDS // 2]
+        print(f"{'on' if enabled else 'off':<9}{search:>15.3f}{build:>15.2f}")
+
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"\n/metrics: {len(text.splitlines())} lines, rendered in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
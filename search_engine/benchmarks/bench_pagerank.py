@@ -0,0 +1,60 @@
+"""
+Sparse PageRank on a power-law link graph, and agreement with the
+reference implementation on a smaller graph.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_pagerank [pages] [edges]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from ..storage.database import Database
+from ..indexer.pagerank import PageRank
+
+
+def load_graph(db, pages, edges, seed=3):
+    """Power-law in-degree: link targets are drawn with Zipf-like weights."""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(pages)]
+    targets = rng.choices(range(1, pages + 1), weights=weights, k=edges)
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM links')
+        cursor.execute('DELETE FROM pages')
+        cursor.executemany('INSERT INTO pages (id, url) VALUES (?, ?)',
+                           ((i, f"http://bench.local/{i}") for i in range(1, pages + 1)))
+        cursor.executemany('INSERT OR IGNORE INTO links (source_id, target_id) VALUES (?, ?)',
+                           ((rng.randint(1, pages), target) for target in targets))
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    edges = int(sys.argv[2]) if len(sys.argv) > 2 else 2000000
+    db = Database()
+    pagerank = PageRank()
+
+    load_graph(db, 2000, 20000)
+    config.PAGERANK_ITERATIONS = 200
+    reference = pagerank.calculate_pagerank(engine="python")
+    sparse_scores = pagerank.calculate_pagerank(engine="sparse")
+    diff = max(abs(reference[pid] - sparse_scores[pid]) for pid in reference)
+    print(f"agreement on 2k pages / 20k edges: max |diff| = {diff:.2e}")
+    assert diff < 1e-6, "sparse and reference PageRank disagree"
+
+    load_graph(db, pages, edges)
+    start = time.perf_counter()
+    pagerank.calculate_pagerank(engine="sparse")
+    print(f"sparse on {pages} pages / {edges} edges: {time.perf_counter() - start:.2f}s, "
+          f"{pagerank.iterations} iterations, residual {pagerank.residual:.2e}")
+
+
+if __name__ == "__main__":
+    main()
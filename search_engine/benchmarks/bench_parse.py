@@ -0,0 +1,56 @@
+"""
+Parse throughput of the BeautifulSoup and streaming lxml engines over the
+saved HTML fixtures (or a directory of .html files), plus the raw HTML
+storage cost under each compression setting.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_parse [fixture_dir]
+"""
+import glob
+import os
+import sys
+import time
+from .. import config
+from ..crawler.parser import Parser
+from ..storage.database import compress_content, zstandard
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ROUNDS = 200
+
+
+def load_fixtures(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append((f"https://bench.local/{os.path.basename(path)}", f.read()))
+    return pages
+
+
+def main():
+    pages = load_fixtures(sys.argv[1] if len(sys.argv) > 1 else FIXTURES)
+    total_bytes = sum(len(html.encode('utf-8')) for _, html in pages)
+
+    for url, html in pages:
+        soup, lxml = Parser.parse(html, url, "html.parser"), Parser.parse(html, url, "lxml")
+        agree = soup['text'] == lxml['text'] and set(soup['links']) == set(lxml['links'])
+        print(f"{url.rsplit('/', 1)[-1]:<24} {len(lxml['links']):>3} links, engines agree: {agree}")
+
+    print(f"{'engine':<14}{'pages/sec':>12}{'MB/sec':>10}")
+    for engine in ("html.parser", "lxml"):
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for url, html in pages:
+                Parser.parse(html, url, engine)
+        elapsed = time.perf_counter() - start
+        print(f"{engine:<14}{ROUNDS * len(pages) / elapsed:>12.1f}{ROUNDS * total_bytes / elapsed / 1e6:>10.2f}")
+
+    print(f"raw HTML stored per page: STORE_RAW_HTML=False 0 B, uncompressed {total_bytes // len(pages)} B")
+    codecs = ("zlib", "zstd") if zstandard else ("zlib",)
+    for codec in codecs:
+        config.RAW_HTML_COMPRESSION = codec
+        stored = sum(len(compress_content(html)) for _, html in pages)
+        print(f"  {codec}: {stored // len(pages)} B")
+
+
+if __name__ == "__main__":
+    main()
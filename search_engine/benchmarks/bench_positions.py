@@ -0,0 +1,86 @@
+"""
+Cost of positional postings: index build time, database size and search
+latency with INDEX_POSITIONS off and on, plus phrase query latency.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_positions [pages]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.ranker import Ranker
+from .bench_indexing import load_pages
+from .bench_search import QUERIES, percentiles
+
+
+def sample_phrases(db, rng, count=3):
+    """Quoted runs of 2-4 words taken from stored pages, so every phrase has a match."""
+    with db.get_connection() as conn:
+        texts = [row[0] for row in conn.execute('SELECT cleaned_text FROM pages ORDER BY id LIMIT ?', (count,))]
+    phrases = []
+    for length, text in enumerate(texts, start=2):
+        words = text.split()
+        start = rng.randrange(len(words) - length)
+        phrases.append('"' + " ".join(words[start:start + length]) + '"')
+    return phrases
+
+
+def reset_index(db):
+    """Drop all postings so each build starts from scratch."""
+    with db.get_connection() as conn:
+        for table in ('keywords', 'term_stats', 'collection_stats'):
+            conn.execute(f'DELETE FROM {table}')
+        conn.execute('UPDATE pages SET indexed_hash = NULL')
+
+
+def database_size(db):
+    with db.get_connection() as conn:
+        conn.execute('VACUUM')
+        blobs = conn.execute('SELECT COALESCE(SUM(LENGTH(positions) + LENGTH(offsets)), 0) FROM keywords').fetchone()[0]
+    return os.path.getsize(config.DATABASE_PATH) / 1e6, blobs / 1e6
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db = Database()
+    load_pages(db, random.Random(7), count)
+    index = InvertedIndex()
+    ranker = Ranker()
+
+    latencies = {}
+    print(f"{'positions':<11}{'build s':>9}{'db MB':>8}{'blob MB':>9}")
+    for positional in (False, True):
+        config.INDEX_POSITIONS = positional
+        reset_index(db)
+        start = time.perf_counter()
+        index.build_index()
+        elapsed = time.perf_counter() - start
+        size, blobs = database_size(db)
+        print(f"{'on' if positional else 'off':<11}{elapsed:>9.2f}{size:>8.1f}{blobs:>9.1f}")
+        latencies[positional] = {query: percentiles(ranker.search, query)
+                                 for queries in QUERIES.values() for query in queries}
+
+    print(f"\n{'query':<32}{'p50 off':>9}{'p50 on':>9}{'p99 off':>9}{'p99 on':>9}")
+    for query, (p50, p99) in latencies[False].items():
+        on50, on99 = latencies[True][query]
+        print(f"{query:<32}{p50:>9.2f}{on50:>9.2f}{p99:>9.2f}{on99:>9.2f}")
+
+    print(f"\n{'phrase query':<40}{'results':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for query in sample_phrases(db, random.Random(3)):
+        p50, p99 = percentiles(ranker.search, query)
+        print(f"{query:<40}{len(ranker.search(query)):>9}{p50:>9.2f}{p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Snapshot size, postings access time and search latency of the in-memory
+posting index against the SQLite path.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_posting_index [pages]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+config.MEMORY_INDEX_PATH = os.path.join(os.path.dirname(config.DATABASE_PATH), 'postings.idx')
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.ranker import Ranker
+from .bench_indexing import load_pages
+from .bench_search import QUERIES, percentiles
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db = Database()
+    load_pages(db, random.Random(7), count)
+    InvertedIndex().build_index()
+
+    ranker = Ranker()
+    sqlite_latency = {query: percentiles(ranker.search, query)
+                      for queries in QUERIES.values() for query in queries}
+
+    start = time.perf_counter()
+    ranker.load_posting_index(build=True)
+    print(f"snapshot build: {time.perf_counter() - start:.2f}s, "
+          f"{os.path.getsize(config.MEMORY_INDEX_PATH) / 1e6:.1f} MB "
+          f"(SQLite database {os.path.getsize(config.DATABASE_PATH) / 1e6:.1f} MB)")
+
+    index = ranker.posting_index
+    for word in ("search1", "zzunknown"):
+        start = time.perf_counter()
+        for _ in range(1000):
+            doc_ids = index.postings(word)[0]
+        print(f"postings('{word}'): {len(doc_ids)} docs, {(time.perf_counter() - start):.3f} ms per lookup")
+
+    print(f"{'query':<32}{'sqlite p50':>12}{'memory p50':>12}")
+    for query, (p50, _) in sqlite_latency.items():
+        memory_p50, _ = percentiles(ranker.search, query)
+        print(f"{query:<32}{p50:>12.2f}{memory_p50:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
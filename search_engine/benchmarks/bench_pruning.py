@@ -0,0 +1,97 @@
+"""
+Top-k pruning: postings scored and skipped, and search latency, with
+TOP_K_PRUNING on and off, over a synthetic corpus's query log plus
+queries mixing one common word with rarer ones, against SQLite, the
+memory-mapped snapshot and segments. Every result list, scores
+included, must come out the same both ways.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_pruning [size]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.SEGMENT_DIR = os.path.join(os.path.dirname(config.DATABASE_PATH), 'segments')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+
+from .. import metrics
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.pagerank import PageRank
+from ..indexer.ranker import Ranker
+from ..indexer.text_processor import TextProcessor
+from .corpus import Corpus
+
+ROUNDS = 3
+
+
+def common_queries(corpus, count=50):
+    """A word from the head of the vocabulary with one or two from further down."""
+    rng = np.random.default_rng(corpus.seed + 2)
+    head = len(TextProcessor().stopwords)
+    queries = []
+    for i in range(count):
+        ranks = [head + int(rng.integers(20))]
+        ranks.extend(np.exp(rng.uniform(np.log(head + 20), np.log(corpus.vocabulary), 1 + i % 2)).astype(int))
+        queries.append(' '.join(str(corpus.words[rank]) for rank in ranks))
+    return queries
+
+
+def run(ranker, queries):
+    """Result lists, p50 and p95 ms and per-query postings scored and skipped."""
+    results = [[(result['url'], result['score']) for result in ranker.search(query)] for query in queries]
+    scored, skipped = metrics.SEARCH_POSTINGS_SCORED.labels(), metrics.SEARCH_POSTINGS_SKIPPED.labels()
+    before = scored.value, skipped.value
+    timings = []
+    for _ in range(ROUNDS):
+        for query in queries:
+            start = time.perf_counter()
+            ranker.search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    searches = len(timings)
+    return (results, np.percentile(timings, 50), np.percentile(timings, 95),
+            (scored.value - before[0]) / searches, (skipped.value - before[1]) / searches)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    db = Database()
+    corpus = Corpus.sized(sys.argv[1] if len(sys.argv) > 1 else '10k')
+    corpus.generate(db)
+    PageRank().calculate_pagerank()
+    InvertedIndex().build_index(full=True)
+    query_sets = {'query log': corpus.query_log(db), 'common': common_queries(corpus)}
+    print(f"{corpus.pages} pages\n")
+
+    print(f"{'backend':<10}{'queries':<11}{'pruning':<9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'scored/query':>14}{'skipped/query':>15}  results")
+    for backend in ("sqlite", "snapshot", "segments"):
+        config.INDEX_BACKEND = "segments" if backend == "segments" else "sqlite"
+        if backend == "segments":
+            InvertedIndex().build_index(full=True)
+        ranker = Ranker()
+        if backend == "snapshot":
+            ranker.load_posting_index(os.path.join(os.path.dirname(config.DATABASE_PATH), 'postings.idx'),
+                                      build=True)
+        for name, queries in query_sets.items():
+            runs = {}
+            for pruning in (False, True):
+                config.TOP_K_PRUNING = pruning
+                runs[pruning] = run(ranker, queries)
+            same = sum(a == b for a, b in zip(runs[False][0], runs[True][0]))
+            for pruning in (False, True):
+                _, p50, p95, scored, skipped = runs[pruning]
+                verdict = f"{same}/{len(queries)} identical" if pruning else ''
+                print(f"{backend:<10}{name:<11}{'on' if pruning else 'off':<9}{p50:>9.2f}{p95:>9.2f}"
+                      f"{scored:>14.0f}{skipped:>15.0f}  {verdict}")
+    config.TOP_K_PRUNING = True
+
+
+if __name__ == "__main__":
+    main()
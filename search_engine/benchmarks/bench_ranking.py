@@ -0,0 +1,78 @@
+"""
+Relevance and latency of the TF-IDF and BM25 ranking models. Each topic
+has one short page about it (topic in the title, a few mentions) and one
+long boilerplate page that mentions it more often in passing; a model
+gets the topic right when the short page ranks first.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_ranking [pages]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.ranker import Ranker, ranking_params, RANKING_MODELS
+from .bench_indexing import load_pages, make_text
+from .bench_search import QUERIES, percentiles
+
+TOPICS = 200
+
+
+def topic_pages(rng):
+    pages = []
+    for i in range(TOPICS):
+        topic = f"topic{i}x"
+        short = make_text(rng, 150).split()
+        for position in rng.sample(range(len(short)), 3):
+            short[position] = topic
+        long = make_text(rng, 3000).split()
+        for position in rng.sample(range(len(long)), 6):
+            long[position] = topic
+        pages.append({'url': f"http://bench.local/topic/{i}", 'title': f"All about {topic}",
+                      'content': None, 'text': " ".join(short), 'links': []})
+        pages.append({'url': f"http://bench.local/boilerplate/{i}", 'title': f"Archive page {i}",
+                      'content': None, 'text': " ".join(long), 'links': []})
+    return pages
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(7)
+    db = Database()
+    load_pages(db, rng, count)
+    db.save_crawl_batch(topic_pages(rng))
+    InvertedIndex().build_index()
+    ranker = Ranker()
+
+    print(f"{'model':<8}{'title boost':>12}{'P@1':>8}{'MRR':>8}")
+    for model in RANKING_MODELS:
+        for boost in (0.0, config.TITLE_BOOST):
+            params = ranking_params(model=model, title_boost=boost)
+            hits = reciprocal = 0.0
+            for i in range(TOPICS):
+                urls = [r['url'] for r in ranker.search(f"topic{i}x", params=params)]
+                target = f"http://bench.local/topic/{i}"
+                hits += bool(urls) and urls[0] == target
+                reciprocal += 1 / (urls.index(target) + 1) if target in urls else 0
+            print(f"{model:<8}{boost:>12.1f}{hits / TOPICS:>8.2f}{reciprocal / TOPICS:>8.2f}")
+
+    print(f"\n{'query':<32}{'model':<8}{'p50 ms':>9}{'p99 ms':>9}")
+    for kind, queries in QUERIES.items():
+        for query in queries:
+            for model in RANKING_MODELS:
+                params = ranking_params(model=model)
+                p50, p99 = percentiles(lambda q: ranker.search(q, params=params), query)
+                print(f"{kind + ': ' + query:<32}{model:<8}{p50:>9.2f}{p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Re-crawl cost with conditional requests. Crawls the stub site once, changes
+a fraction of its pages, then re-crawls every page that is due and reports
+how many came back 304, how many bytes moved and how many pages were
+rewritten (and so would be re-indexed). Last, pages that start answering
+with an empty 200 are re-crawled by each engine, which should keep their
+stored text and only record the fetch.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_recrawl
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from ..storage.database import Database
+from ..crawler.async_crawler import AsyncCrawler
+from ..crawler.crawler_worker import CrawlerWorker
+from ..crawler.url_queue import URLQueue
+from ..crawler.fetcher import Fetcher
+from ..crawler.parser import Parser
+from ..crawler.page_writer import PageWriter
+from .stub_server import StubSite
+
+PAGES = 300
+HOSTS = 10
+CHANGED = 0.1  # fraction of pages mutated between crawls
+EMPTY = 10  # pages per engine that answer the last re-crawl with no body
+
+
+def crawl(site, seeds, recrawl=False):
+    queue = URLQueue()
+    for url in seeds:
+        queue.requeue(url) if recrawl else queue.add_url(url)
+    writer = PageWriter()
+    writer.start()
+    requests, not_modified, sent = site.requests, site.not_modified, site.bytes_sent
+    start = time.perf_counter()
+    crawler = AsyncCrawler(queue, Fetcher(), Parser(), writer, max_pages=PAGES)
+    crawler.run()
+    writer.close()
+    return {
+        'seconds': time.perf_counter() - start,
+        'requests': site.requests - requests,
+        'not_modified': site.not_modified - not_modified,
+        'bytes': site.bytes_sent - sent,
+        'unchanged': crawler.pages_unchanged,
+        'rewritten': writer.pages_written,
+    }
+
+
+def stored(db, urls):
+    """url -> (cleaned_text, fetch_count) for the given urls."""
+    with db.get_connection() as conn:
+        rows = conn.execute(f'''
+            SELECT p.url, p.cleaned_text, m.fetch_count FROM pages p JOIN fetch_meta m ON m.url = p.url
+            WHERE p.url IN ({','.join('?' * len(urls))})
+        ''', urls).fetchall()
+    return {url: (text, fetch_count) for url, text, fetch_count in rows}
+
+
+def empty_bodies(db, site, engine, pages):
+    """Re-crawls pages that now answer with an empty 200; returns how many kept their text and had the fetch recorded."""
+    urls = [site.url(page) for page in pages]
+    before = stored(db, urls)
+    site.empty.update(pages)
+    queue = URLQueue()
+    for url in urls:
+        queue.requeue(url)
+    writer = PageWriter()
+    writer.start()
+    if engine == "async":
+        AsyncCrawler(queue, Fetcher(), Parser(), writer, max_pages=len(urls)).run()
+    else:
+        workers = [CrawlerWorker(queue, Fetcher(), Parser(), writer) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    writer.close()
+    after = stored(db, urls)
+    return sum(1 for url in urls if url in after and after[url][0] == before[url][0]
+               and after[url][1] == before[url][1] + 1)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    config.HOST_MIN_DELAY = 0.0
+    config.REFRESH_INITIAL_INTERVAL = 3600
+    config.REFRESH_MIN_INTERVAL = 60
+    db = Database()
+
+    with StubSite(pages=PAGES, hosts=HOSTS, compress=True) as site:
+        first = crawl(site, site.seed_urls(HOSTS))
+        for page in range(0, PAGES, int(1 / CHANGED)):
+            site.mutate(page)
+        # Pretend an hour has passed so every page from the first crawl is due
+        due = db.get_due_urls(time.time() + config.REFRESH_INITIAL_INTERVAL, PAGES)
+        second = crawl(site, due, recrawl=True)
+        # Each engine gets pages of its own, so neither sees the other's empty-body hash
+        kept = {engine: empty_bodies(db, site, engine, range(offset, offset + EMPTY))
+                for engine, offset in (("threaded", 0), ("async", EMPTY))}
+
+    print(f"{'crawl':<10}{'seconds':>9}{'requests':>10}{'304s':>7}{'KB sent':>9}{'unchanged':>11}{'rewritten':>11}")
+    for name, r in (("initial", first), ("re-crawl", second)):
+        print(f"{name:<10}{r['seconds']:>9.2f}{r['requests']:>10}{r['not_modified']:>7}"
+              f"{r['bytes'] / 1024:>9.1f}{r['unchanged']:>11}{r['rewritten']:>11}")
+
+    with db.get_connection() as conn:
+        rows = conn.execute('''
+            SELECT change_count > 0, COUNT(*), AVG(refresh_interval) FROM fetch_meta
+            WHERE fetch_count > 1 GROUP BY 1
+        ''').fetchall()
+    for changed, count, interval in rows:
+        print(f"{'changed' if changed else 'unchanged':<10} {count:>4} pages, next re-crawl in {interval:.0f}s")
+
+    for engine, count in kept.items():
+        print(f"empty body, {engine:<8} {count} of {EMPTY} pages kept their text and recorded the fetch")
+    if any(count != EMPTY for count in kept.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
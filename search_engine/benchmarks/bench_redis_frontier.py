@@ -0,0 +1,163 @@
+"""
+RedisFrontier shared by several crawlers: three crawl engines (two
+asyncio, one threaded) on one frontier crawl the local stub site, which
+should see every page fetched exactly once and leave nothing pending or
+leased; the spacing of claims on one host by two frontier instances,
+against HOST_MIN_DELAY; and an expired lease handed to another instance
+at its depth, which the late task_done() of the first must not undo.
+
+Runs against the Redis server at REDIS_URL (keys under a prefix of its
+own, removed afterwards) or, with no server there, an in-process
+fakeredis from requirements-dev.txt; skipped if neither is available.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_redis_frontier [redis_url]
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from ..storage.database import Database
+from ..crawler.redis_frontier import RedisFrontier, redis
+from ..crawler.crawler_worker import CrawlerWorker
+from ..crawler.async_crawler import AsyncCrawler
+from ..crawler.fetcher import Fetcher
+from ..crawler.parser import Parser
+from ..crawler.page_writer import PageWriter
+from .stub_server import StubSite
+try:
+    import fakeredis
+except ImportError:  # only needed without a Redis server
+    fakeredis = None
+
+PAGES = 200
+HOSTS = 4
+DELAY = 0.2  # seconds, HOST_MIN_DELAY for the politeness check
+LEASE = 0.1  # seconds, lease timeout for the expiry check
+
+
+def connect(url):
+    """A client factory for the server at url, or for one fakeredis server; None if neither is usable."""
+    if redis is not None:
+        try:
+            redis.Redis.from_url(url).ping()
+            return lambda: redis.Redis.from_url(url, decode_responses=True), f"redis at {url}"
+        except redis.ConnectionError:
+            pass
+    if fakeredis is not None:
+        server = fakeredis.FakeServer()
+        return lambda: fakeredis.FakeRedis(server=server, decode_responses=True), "fakeredis"
+    return None
+
+
+def shared_crawl(client, prefix):
+    """Fetches, pages written, pending and leased after three engines crawl the stub site together."""
+    with StubSite(pages=PAGES, hosts=HOSTS) as site:
+        frontier = RedisFrontier(client=client(), prefix=prefix)
+        frontier.add_urls(site.seed_urls(HOSTS))
+        writer = PageWriter()
+        writer.start()
+
+        def crawler(engine):
+            queue = RedisFrontier(client=client(), prefix=prefix)
+            if engine == "async":
+                AsyncCrawler(queue, Fetcher(), Parser(), writer, max_pages=PAGES * 2).run()
+            else:
+                workers = [CrawlerWorker(queue, Fetcher(), Parser(), writer) for _ in range(3)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=crawler, args=(engine,)) for engine in ("async", "threaded", "async")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        writer.close()
+        elapsed = time.perf_counter() - start
+        return (site.requests - site.robots_requests, writer.pages_written, frontier.size(),
+                frontier.redis.zcard(frontier._key('leases')), elapsed)
+
+
+def politeness(client, prefix):
+    """Gaps in seconds between claims of one host's URLs by two frontier instances taking turns."""
+    first, second = (RedisFrontier(client=client(), prefix=prefix) for _ in range(2))
+    first.add_urls([f"http://polite.test/{i}" for i in range(5)])
+    claims = []
+    deadline = time.monotonic() + DELAY * 20
+    while len(claims) < 5 and time.monotonic() < deadline:
+        for frontier in (first, second):
+            url = frontier.get_url_nowait()
+            if url:
+                claims.append(time.monotonic())
+                frontier.task_done(url)
+    return [b - a for a, b in zip(claims, claims[1:])]
+
+
+def lease_expiry(client, prefix):
+    """Whether an expired claim is handed to another instance at its depth, and keeps it after a late ack."""
+    dead, live = (RedisFrontier(client=client(), prefix=prefix) for _ in range(2))
+    dead.lease_timeout = LEASE
+    dead.add_url("http://lease.test/a", depth=2)
+    url = dead.get_url_nowait()
+    time.sleep(LEASE * 2)
+    reclaimed = live.reclaim_expired()
+    handed_out = live.get_url_nowait() == url and live.get_depth(url) == 2
+    dead.task_done(url)  # the presumed-dead worker finishes after all
+    kept = live.get_depth(url) == 2 and live.redis.zcard(live._key('leases')) == 1
+    live.task_done(url)
+    return reclaimed == 1 and handed_out and kept
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    connection = connect(sys.argv[1] if len(sys.argv) > 1 else config.REDIS_URL)
+    if connection is None:
+        print("skipped: needs a Redis server at REDIS_URL, or fakeredis (pip install -r requirements-dev.txt)")
+        return
+    client, backend = connection
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    config.MAX_DEPTH = 100  # the whole stub site is reachable
+    config.DELAY_BETWEEN_REQUESTS = 0.0
+    config.HOST_MIN_DELAY = 0.01
+    Database()
+    print(f"RedisFrontier on {backend}\n")
+    failed = False
+    try:
+        fetches, written, pending, leased, elapsed = shared_crawl(client, f"{prefix}:crawl")
+        ok = fetches == written == PAGES and pending == leased == 0
+        failed |= not ok
+        print(f"shared crawl   {fetches} fetches, {written} of {PAGES} pages written, {pending} pending, "
+              f"{leased} leased, {written / elapsed:.0f} pages/s  {'ok' if ok else 'FAILED'}")
+
+        config.HOST_MIN_DELAY = DELAY
+        gaps = politeness(client, f"{prefix}:polite")
+        ok = len(gaps) == 4 and min(gaps) >= DELAY * 0.9
+        failed |= not ok
+        print(f"politeness     claims on one host {', '.join(f'{gap:.2f}' for gap in gaps)}s apart "
+              f"(HOST_MIN_DELAY {DELAY}s)  {'ok' if ok else 'FAILED'}")
+
+        config.HOST_MIN_DELAY = 0.0
+        ok = lease_expiry(client, f"{prefix}:lease")
+        failed |= not ok
+        print(f"lease expiry   re-queued at its depth, late ack ignored  {'ok' if ok else 'FAILED'}")
+    finally:
+        cleanup = client()
+        keys = list(cleanup.scan_iter(f"{prefix}:*"))
+        if keys:
+            cleanup.delete(*keys)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
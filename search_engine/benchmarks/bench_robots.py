@@ -0,0 +1,122 @@
+"""
+robots.txt handling under concurrent workers: fetches per host with the
+old per-Fetcher dict against the shared RobotsCache, for a slow host, an
+unreachable host and after a restart, plus how a Crawl-delay paces the
+async engine.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_robots
+"""
+import logging
+import os
+import socket
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.robotparser import RobotFileParser
+from urllib.parse import urlparse
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from ..storage.database import Database
+from ..crawler.robots import RobotsCache
+from ..crawler.async_crawler import AsyncCrawler
+from ..crawler.url_queue import URLQueue
+from ..crawler.fetcher import Fetcher
+from ..crawler.parser import Parser
+from ..crawler.page_writer import PageWriter
+from .stub_server import StubSite
+
+THREADS = 8
+HOSTS = 10
+URLS_PER_HOST = 40
+LATENCY = 0.1  # seconds the stub takes per response
+CRAWL_DELAY = 1  # urllib.robotparser only reads whole seconds
+
+
+class LegacyRobots:
+    """The original Fetcher.can_fetch: unbounded dict, failures not cached."""
+    def __init__(self):
+        self.robot_parsers = {}
+
+    def can_fetch(self, url):
+        parsed_url = urlparse(url)
+        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+        if base_url not in self.robot_parsers:
+            rp = RobotFileParser()
+            rp.set_url(f"{base_url}/robots.txt")
+            try:
+                rp.read()
+                self.robot_parsers[base_url] = rp
+            except Exception:
+                return True
+        return self.robot_parsers[base_url].can_fetch(config.USER_AGENT, url)
+
+
+def check_all(robots, urls):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        list(pool.map(robots.can_fetch, urls))
+    return time.perf_counter() - start
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    logging.getLogger().setLevel(logging.CRITICAL)
+    Database()
+
+    print(f"{'scenario':<22}{'impl':<8}{'robots GETs':>12}{'seconds':>9}")
+    with StubSite(pages=HOSTS * URLS_PER_HOST, hosts=HOSTS, latency=LATENCY) as site:
+        urls = [site.url(page) for page in range(site.pages)]
+        for name, robots in (("legacy", LegacyRobots()), ("cache", RobotsCache())):
+            before = site.robots_requests
+            elapsed = check_all(robots, urls)
+            print(f"{'slow hosts':<22}{name:<8}{site.robots_requests - before:>12}{elapsed:>9.2f}")
+
+        before = site.robots_requests
+        elapsed = check_all(RobotsCache(), urls)
+        print(f"{'restart':<22}{'cache':<8}{site.robots_requests - before:>12}{elapsed:>9.2f}")
+
+    port = closed_port()
+    dead = [f"http://127.0.0.1:{port}/page/{i}" for i in range(URLS_PER_HOST)]
+    attempts = 0
+    original = RobotFileParser.read
+    def counting_read(rp):
+        nonlocal attempts
+        attempts += 1
+        return original(rp)
+    RobotFileParser.read = counting_read
+    try:
+        check_all(LegacyRobots(), dead)
+    finally:
+        RobotFileParser.read = original
+    cache = RobotsCache()
+    check_all(cache, dead)
+    print(f"{'unreachable host':<22}{'legacy':<8}{attempts:>12}")
+    print(f"{'unreachable host':<22}{'cache':<8}{cache.fetches:>12}")
+
+    config.HOST_MIN_DELAY = 0.0
+    pages = 5
+    robots = f"User-agent: *\nCrawl-delay: {CRAWL_DELAY}\n"
+    with StubSite(pages=pages, hosts=1, robots=robots) as site:
+        queue = URLQueue()
+        for url in site.seed_urls(1):
+            queue.add_url(url)
+        writer = PageWriter()
+        writer.start()
+        start = time.perf_counter()
+        AsyncCrawler(queue, Fetcher(), Parser(), writer, max_pages=pages).run()
+        writer.close()
+        elapsed = time.perf_counter() - start
+    print(f"Crawl-delay {CRAWL_DELAY}s: {writer.pages_written} pages from one host in {elapsed:.2f}s "
+          f"(>= {(writer.pages_written - 1) * CRAWL_DELAY}s expected)")
+
+
+if __name__ == "__main__":
+    main()
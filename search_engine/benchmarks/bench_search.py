@@ -0,0 +1,81 @@
+"""
+Search latency (p50/p99) for common and rare query terms, comparing the
+old per-term query path with Ranker.search.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_search [pages]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from math import log
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.ranker import Ranker
+from .bench_indexing import load_pages
+
+QUERIES = {
+    'common': ["search1 engine2", "python3 web4 crawler5", "index6"],
+    'rare': ["zzunknown", "search1 zzunknown"],
+}
+
+
+def legacy_search(ranker, query):
+    """The per-term path Ranker.search used before term statistics."""
+    db = ranker.db
+    tokens = ranker.processor.process_text(query)
+    N = db.get_document_count()
+    doc_scores = defaultdict(float)
+    candidates = {}
+    for term in tokens:
+        df = db.get_doc_frequency(term)
+        if df == 0:
+            continue
+        for doc in db.get_documents_with_word(term):
+            doc_scores[doc['doc_id']] += doc['term_frequency'] * log(N / df) * config.TFIDF_WEIGHT
+            candidates[doc['doc_id']] = doc
+    results = []
+    for doc_id, score in doc_scores.items():
+        doc = candidates[doc_id]
+        results.append({'url': doc['url'], 'score': score + doc['pagerank'] * config.PAGERANK_WEIGHT,
+                        'snippet': ranker._generate_snippet(doc['cleaned_text'], tokens)})
+    results.sort(key=lambda x: x['score'], reverse=True)
+    return results[:10]
+
+
+def percentiles(fn, query, runs=50):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    load_pages(Database(), random.Random(7), count)
+    InvertedIndex().build_index()
+    ranker = Ranker()
+
+    print(f"{'query':<32}{'path':<8}{'p50 ms':>9}{'p99 ms':>9}")
+    for kind, queries in QUERIES.items():
+        for query in queries:
+            for name, fn in (("legacy", lambda q: legacy_search(ranker, q)), ("ranker", ranker.search)):
+                p50, p99 = percentiles(fn, query)
+                print(f"{kind + ': ' + query:<32}{name:<8}{p50:>9.2f}{p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Re-indexing while searches are in flight, with the SQLite keywords table
+and with the segmented index. Every page's text is replaced and the index
+rebuilt while query threads run; a result list matching neither the old
+index nor the new one was read from a half-built index. Also reports
+search latency during the build and what the background merger did.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_segments [pages]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.SEGMENT_DIR = os.path.join(os.path.dirname(config.DATABASE_PATH), 'segments')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+config.SEGMENT_FLUSH_DOCS = 500  # several segments per build, for the merger to work on
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.ranker import Ranker
+from ..indexer.segments import SegmentMerger
+from .bench_indexing import make_text
+from .bench_search import QUERIES
+from .bench_positions import sample_phrases
+
+THREADS = 4
+
+
+def rewrite_pages(db, rng, count):
+    pages = [{'url': f"http://bench.local/{i}", 'title': f"Page {i}", 'content': None,
+              'text': make_text(rng), 'links': []} for i in range(count)]
+    for start in range(0, count, 1000):
+        db.save_crawl_batch(pages[start:start + 1000])
+
+
+def urls(results):
+    return tuple(result['url'] for result in results)
+
+
+def search_loop(ranker, queries, stop, observed, latencies):
+    while not stop.is_set():
+        for query in queries:
+            start = time.perf_counter()
+            results = ranker.search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            observed.append((query, urls(results)))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def reindex_under_load(db, rng, count, queries):
+    index = InvertedIndex()
+    ranker = Ranker()
+    index.build_index()  # start from an up-to-date index
+    rewrite_pages(db, rng, count)
+    before = {query: urls(ranker.search(query)) for query in queries}
+
+    merger = SegmentMerger(index.segments, interval=0.5) if index.segments else None
+    if merger:
+        merger.start()
+    stop = threading.Event()
+    observed, latencies = [], []
+    threads = [threading.Thread(target=search_loop, args=(ranker, queries, stop, observed, latencies))
+               for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    index.build_index()
+    elapsed = time.perf_counter() - start
+    time.sleep(1.0)  # let the merger catch up with the new segments
+    stop.set()
+    for thread in threads:
+        thread.join()
+    if merger:
+        merger.stop()
+
+    after = {query: urls(ranker.search(query)) for query in queries}
+    torn = sum(1 for query, seen in observed if seen != before[query] and seen != after[query])
+    return elapsed, len(observed), torn, latencies, merger
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    db = Database()
+    rng = random.Random(7)
+    rewrite_pages(db, rng, count)
+    queries = [query for group in QUERIES.values() for query in group] + sample_phrases(db, random.Random(3))
+
+    print(f"{'backend':<10}{'build s':>9}{'searches':>10}{'torn':>7}{'p50 ms':>9}{'p99 ms':>9}")
+    for backend in ("sqlite", "segments"):
+        config.INDEX_BACKEND = backend
+        elapsed, searches, torn, latencies, merger = reindex_under_load(db, rng, count, queries)
+        print(f"{backend:<10}{elapsed:>9.2f}{searches:>10}{torn:>7}"
+              f"{percentile(latencies, 0.5):>9.2f}{percentile(latencies, 0.99):>9.2f}")
+    stats = merger.index.stats()
+    print(f"\nsegments: {merger.merges} merges during the run, {len(stats['segments'])} segments left "
+          f"({', '.join(str(segment['docs'] - segment['deleted']) for segment in stats['segments'])} live docs)")
+
+
+if __name__ == "__main__":
+    main()
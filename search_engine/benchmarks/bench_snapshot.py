@@ -0,0 +1,230 @@
+"""
+Replica startup: time from a fresh process to its first search result
+when it serves an exported snapshot (checksums checked or not), a copy
+of the primary's database, or has to rebuild the index from the pages;
+the snapshot's export time and size; and search latency on a replica
+while newer snapshots are swapped in under load. Last, snapshots exported
+while the index is being rewritten must each match one committed state:
+every document's length and the token total add up to its postings.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_snapshot [size]
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # every search goes to the index
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.pagerank import PageRank
+from ..indexer.ranker import Ranker
+from ..indexer.snapshot import export_snapshot, open_snapshot
+from .corpus import Corpus
+
+SWAPS = 3
+SEARCH_THREADS = 4
+CONSISTENCY_EXPORTS = 10
+REWRITTEN = 500  # documents rewritten while those are exported
+
+
+def first_query(mode, path, query):
+    """In a fresh process: load what mode serves from and search once; prints the timings."""
+    logging.getLogger().setLevel(logging.ERROR)
+    start = time.perf_counter()
+    if mode == "database":
+        config.DATABASE_PATH = path
+        ranker = Ranker()
+    else:
+        config.SNAPSHOT_VERIFY = mode == "verified"
+        ranker = Ranker(snapshot=path)
+    loaded = time.perf_counter()
+    results = ranker.search(query)
+    done = time.perf_counter()
+    print(json.dumps({'load_ms': (loaded - start) * 1000, 'query_ms': (done - loaded) * 1000,
+                      'results': len(results)}))
+
+
+def cold_start(mode, path, query):
+    """Wall time to the first result of a new replica process, interpreter start included."""
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-m', __spec__.name, '--first-query', mode, path, query],
+                         capture_output=True, text=True, check=True)
+    wall = (time.perf_counter() - start) * 1000
+    return {**json.loads(out.stdout.splitlines()[-1]), 'wall_ms': wall}
+
+
+def rebuild(pages_path, query):
+    """A replica given only the pages: full index build and PageRank, then the first search."""
+    config.DATABASE_PATH = pages_path
+    Database._instance = None
+    start = time.perf_counter()
+    InvertedIndex().build_index(full=True)
+    PageRank().calculate_pagerank()
+    ranker = Ranker()
+    loaded = time.perf_counter()
+    results = ranker.search(query)
+    done = time.perf_counter()
+    return {'load_ms': (loaded - start) * 1000, 'query_ms': (done - loaded) * 1000, 'results': len(results),
+            'wall_ms': (done - start) * 1000}
+
+
+def swap_under_load(path, queries):
+    """Search latency while SWAPS newer snapshots replace path, against the same searches before."""
+    config.MEMORY_INDEX_CHECK_INTERVAL = 0.05
+    ranker = Ranker()
+    ranker.load_snapshot(path)
+    timings, errors, phase = {'steady': [], 'swapping': []}, [], ['steady']
+    stop = threading.Event()
+
+    def search():
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                ranker.search(queries[i % len(queries)])
+            except Exception as e:
+                errors.append(repr(e))
+            timings[phase[0]].append((time.perf_counter() - start) * 1000)
+            i += 1
+
+    threads = [threading.Thread(target=search) for _ in range(SEARCH_THREADS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(2)
+    phase[0] = 'swapping'
+    swaps = 0
+    for _ in range(SWAPS):
+        current = ranker.posting_index
+        export_snapshot(path)
+        while ranker.posting_index is current:
+            time.sleep(0.01)
+        swaps += 1
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return swaps, errors, {name: (np.percentile(values, 50), np.percentile(values, 99), len(values))
+                           for name, values in timings.items()}
+
+
+def consistent(index):
+    """Whether each document's length, and the token total, add up to its postings in index."""
+    tokens = defaultdict(int)
+    for i in range(index.num_terms):
+        doc_ids, tfs, _ = index.term_postings(i)
+        for doc_id, tf in zip(doc_ids.tolist(), tfs.tolist()):
+            tokens[doc_id] += tf
+    return (index.header['num_tokens'] == sum(tokens.values())
+            and all(tokens[doc_id] == length for doc_id, length in zip(index.doc_ids.tolist(),
+                                                                         index.doc_lengths.tolist())))
+
+
+def export_under_writes(db, path):
+    """
+    Exports CONSISTENCY_EXPORTS snapshots while another thread's
+    replace_keywords() rewrites REWRITTEN documents with their term
+    frequencies doubled and back again, each rewrite committing right
+    after the export's first read; returns how many came out consistent.
+    """
+    docs = defaultdict(lambda: [None, {}, {}])
+    with db.get_connection() as conn:
+        for doc_id, word, tf, title_tf, text_hash in conn.execute('''
+            SELECT k.doc_id, k.word, k.term_frequency, k.title_frequency, p.content_hash
+            FROM keywords k JOIN pages p ON p.id = k.doc_id
+            WHERE k.doc_id IN (SELECT id FROM pages WHERE indexed_hash IS NOT NULL ORDER BY id LIMIT ?)
+        ''', (REWRITTEN,)):
+            docs[doc_id][0] = text_hash
+            docs[doc_id][1][word] = tf
+            docs[doc_id][2][word] = title_tf or 0
+    requested, committed, stop = threading.Semaphore(0), threading.Semaphore(0), threading.Event()
+
+    def rewrite():
+        factor = 2
+        while requested.acquire() and not stop.is_set():
+            db.replace_keywords([(doc_id, text_hash, {word: tf * factor for word, tf in tfs.items()}, title_tfs, {})
+                                 for doc_id, (text_hash, tfs, title_tfs) in docs.items()])
+            factor = 3 - factor
+            committed.release()
+
+    stats = db.get_collection_stats
+
+    def commit_between_reads():
+        result = stats()
+        requested.release()
+        committed.acquire()
+        return result
+
+    writer = threading.Thread(target=rewrite)
+    writer.start()
+    db.get_collection_stats = commit_between_reads
+    try:
+        results = []
+        for _ in range(CONSISTENCY_EXPORTS):
+            export_snapshot(path, db)
+            results.append(consistent(open_snapshot(path, verify=False)))
+    finally:
+        del db.get_collection_stats
+        stop.set()
+        requested.release()
+        writer.join()
+    return sum(results)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    directory = os.path.dirname(config.DATABASE_PATH)
+    db = Database()
+    corpus = Corpus.sized(sys.argv[1] if len(sys.argv) > 1 else '10k')
+    corpus.generate(db)
+    pages_path = os.path.join(directory, 'pages.db')
+    shutil.copy(config.DATABASE_PATH, pages_path)  # the pages alone, before any index build
+    PageRank().calculate_pagerank()
+    InvertedIndex().build_index(full=True)
+    queries = corpus.query_log(db)
+
+    snapshot_path = os.path.join(directory, 'snapshot.idx')
+    summary = export_snapshot(snapshot_path)
+    with db.get_connection() as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    print(f"{corpus.pages} pages: snapshot exported in {summary['seconds']:.2f}s, "
+          f"{summary['bytes'] / 1e6:.1f} MB (database {os.path.getsize(config.DATABASE_PATH) / 1e6:.1f} MB)\n")
+
+    runs = {
+        'snapshot, verified': cold_start("verified", snapshot_path, queries[0]),
+        'snapshot, unverified': cold_start("unverified", snapshot_path, queries[0]),
+        'database copy': cold_start("database", config.DATABASE_PATH, queries[0]),
+        'rebuild from pages': rebuild(pages_path, queries[0]),
+    }
+    print(f"{'replica':<22}{'load ms':>10}{'first query ms':>16}{'to first result ms':>20}")
+    for name, run in runs.items():
+        print(f"{name:<22}{run['load_ms']:>10.1f}{run['query_ms']:>16.1f}{run['wall_ms']:>20.1f}")
+    print("(to first result: from process start for the fresh processes; rebuild runs in this one)\n")
+
+    swaps, errors, latency = swap_under_load(snapshot_path, queries)
+    print(f"{SEARCH_THREADS} threads searching while {swaps} new snapshots were swapped in: {len(errors)} errors")
+    for name, (p50, p99, count) in latency.items():
+        print(f"  {name:<10} p50 {p50:.2f} ms  p99 {p99:.2f} ms  ({count} searches)")
+
+    # Rewrites the index, so it goes last
+    matched = export_under_writes(db, snapshot_path)
+    print(f"\n{matched} of {CONSISTENCY_EXPORTS} snapshots exported during index writes match one committed state")
+    if matched != CONSISTENCY_EXPORTS:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--first-query']:
+        first_query(*sys.argv[2:5])
+    else:
+        main()
@@ -0,0 +1,80 @@
+"""
+/suggest's term dictionary: build time, memory, and completion latency
+by prefix length, against the SQLite query it replaces (LIKE 'prefix%'
+over term_stats, most frequent first). The vocabulary is a synthetic
+corpus's, with Zipfian document frequencies.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_suggest [words]
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from ..indexer.term_dictionary import TermDictionary
+from .corpus import make_vocabulary
+
+LOOKUPS = 2000
+SQL_LOOKUPS = 100
+
+
+def vocabulary(size, seed=7):
+    """(word, df) in word order; dfs fall off with frequency rank as in a real index."""
+    words = make_vocabulary(size, seed).tolist()
+    dfs = np.maximum((size * 5 / np.arange(1, size + 1) ** 1.07).astype(int), 1).tolist()
+    return sorted(zip(words, dfs))
+
+
+def timed(fn, prefixes):
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        fn(prefix)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    terms = vocabulary(size)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    dictionary = TermDictionary(iter(terms))
+    build = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    stats = dictionary.stats()
+    print(f"{size} words: built in {build:.2f}s, {stats['bytes'] / 1e6:.1f} MB of arrays, "
+          f"{memory / 1e6:.1f} MB retained, {stats['precomputed_prefixes']} precomputed prefixes\n")
+
+    path = os.path.join(tempfile.mkdtemp(), 'terms.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE term_stats (word TEXT PRIMARY KEY, df INTEGER)')
+    conn.executemany('INSERT INTO term_stats VALUES (?, ?)', terms)
+    conn.commit()
+
+    def like(prefix):
+        return conn.execute('SELECT word, df FROM term_stats WHERE word LIKE ? ORDER BY df DESC LIMIT 10',
+                            (prefix + '%',)).fetchall()
+
+    rng = np.random.default_rng(1)
+    words = [word for word, _ in terms]
+    print(f"{'prefix':<8}{'dictionary p50 us':>19}{'p99 us':>10}{'LIKE p50 us':>14}{'LIKE p99 us':>14}")
+    for length in (1, 2, 3, 4, 6):
+        prefixes = [word[:length] for word in (words[i] for i in rng.integers(len(words), size=LOOKUPS))]
+        p50, p99 = timed(lambda prefix: dictionary.complete(prefix, 10), prefixes)
+        like_p50, like_p99 = timed(like, prefixes[:SQL_LOOKUPS])
+        print(f"{length:<8}{p50:>19.1f}{p99:>10.1f}{like_p50:>14.0f}{like_p99:>14.0f}")
+    typed = [' '.join(words[i] for i in rng.integers(len(words), size=2))[:-1] for _ in range(LOOKUPS)]
+    p50, p99 = timed(dictionary.suggest, typed)
+    print(f"\nsuggest() on two typed words, the last cut short: p50 {p50:.1f} us, p99 {p99:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
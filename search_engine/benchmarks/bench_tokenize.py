@@ -0,0 +1,41 @@
+"""
+Index build throughput (docs/sec) by number of tokenizer processes. Every
+run is a full re-index of the same pages, so postings writes are mostly
+no-ops and the numbers track tokenization.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_tokenize [pages]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from ..storage.database import Database
+from ..indexer.inverted_index import InvertedIndex
+from .bench_indexing import load_pages
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db = Database()
+    index = InvertedIndex()
+    load_pages(db, random.Random(7), count)
+    index.build_index()
+
+    cores = os.cpu_count() or 1
+    print(f"{'workers':<10}{'docs/sec':>12}   ({cores} cores)")
+    for workers in sorted({1, 2, 4, cores}):
+        start = time.perf_counter()
+        indexed = index.build_index(full=True, workers=workers)
+        print(f"{workers:<10}{indexed / (time.perf_counter() - start):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
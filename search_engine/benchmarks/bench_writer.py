@@ -0,0 +1,82 @@
+"""
+Crawl persistence throughput (pages/sec) for 5 worker threads: one
+transaction per row as CrawlerWorker used to do, one transaction per page,
+and the batched PageWriter stage.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.bench_writer
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from ..storage.database import Database
+from ..crawler.page_writer import PageWriter
+
+THREADS = 5
+PAGES_PER_THREAD = 40
+OUTLINKS = 50
+
+
+def make_page(mode, thread_no, i):
+    url = f"http://bench.local/{mode}/{thread_no}/{i}"
+    return {
+        'url': url,
+        'title': url,
+        'content': "<html></html>",
+        'text': "benchmark page text " * 20,
+        'links': [f"http://bench.local/{mode}/out/{(i * 7 + j) % 500}" for j in range(OUTLINKS)]
+    }
+
+
+def write_per_row(db, page):
+    page_id = db.add_page(page['url'], page['title'], page['content'], page['text'])
+    for link in page['links']:
+        target_id = db.get_page_id(link)
+        if not target_id:
+            target_id = db.add_page(link, None, None, None)
+        db.add_link(page_id, target_id)
+
+
+def run(mode, db):
+    writer = None
+    if mode == "batched":
+        writer = PageWriter()
+        writer.start()
+
+    def work(thread_no):
+        for i in range(PAGES_PER_THREAD):
+            page = make_page(mode, thread_no, i)
+            if mode == "per-row":
+                write_per_row(db, page)
+            elif mode == "per-page":
+                db.save_crawl_batch([page])
+            else:
+                writer.submit(page['url'], page)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if writer:
+        writer.close()
+    return THREADS * PAGES_PER_THREAD / (time.perf_counter() - start)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    db = Database()
+    print(f"{'mode':<10}{'pages/sec':>12}")
+    for mode in ("per-row", "per-page", "batched"):
+        print(f"{mode:<10}{run(mode, db):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
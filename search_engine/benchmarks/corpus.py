@@ -0,0 +1,180 @@
+"""
+Synthetic corpora for benchmarks, written straight into the Database
+schema: page text drawn from a Zipfian vocabulary (stopwords at the
+head, as in real text), titles from the same distribution, and a link
+graph whose in-degrees follow a power law. Everything is derived from
+the seed, so a corpus and its query log are identical between runs and
+between commits.
+
+As a script, fills a database file for ad-hoc runs:
+    python -m search_engine.benchmarks.corpus <pages> [database_path]
+"""
+import logging
+import os
+import sys
+import time
+import numpy as np
+from .. import config
+from ..storage.database import Database, document_hash
+from ..indexer.text_processor import TextProcessor
+
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000, '1M': 1000000}
+ONSETS = ("b", "c", "d", "f", "g", "h", "k", "l", "m", "n", "p", "r", "s", "t", "v", "w", "z",
+          "br", "ch", "cl", "dr", "fl", "gr", "pl", "pr", "sh", "st", "th", "tr")
+VOWELS = ("a", "e", "i", "o", "u", "ai", "ea", "ou")
+CODAS = ("", "", "n", "r", "s", "t", "l", "m", "nd", "st")
+WRITE_BATCH = 5000
+
+
+def make_vocabulary(size, seed):
+    """
+    size distinct words, most frequent first: the stopwords, then made-up
+    words of one to four syllables, shorter ones more common as in real
+    text.
+    """
+    rng = np.random.default_rng(seed)
+    words = sorted(TextProcessor().stopwords)
+    seen = set(words)
+    while len(words) < size:
+        syllables = 1 + min(3, int(rng.exponential(0.4 + len(words) / size * 1.5)))
+        word = ''.join(ONSETS[rng.integers(len(ONSETS))] + VOWELS[rng.integers(len(VOWELS))]
+                       + CODAS[rng.integers(len(CODAS))] for _ in range(syllables))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return np.array(words[:size], dtype=object)
+
+
+def zipf_sampler(size, exponent, rng):
+    """Draws ranks 0..size-1 with probability proportional to 1 / (rank + 1) ** exponent."""
+    cdf = np.cumsum(1.0 / np.arange(1, size + 1) ** exponent)
+    cdf /= cdf[-1]
+    return lambda count: np.minimum(np.searchsorted(cdf, rng.random(count)), size - 1)
+
+
+class Corpus:
+    """
+    Parameters of a synthetic corpus. generate() fills a database with it;
+    query_log() gives the fixed queries benchmarks run against it.
+    """
+    def __init__(self, pages, seed=7, vocabulary=50000, word_exponent=1.07, mean_words=300,
+                 title_words=6, mean_links=12, link_exponent=1.1, pages_per_host=200):
+        self.pages = pages
+        self.seed = seed
+        self.vocabulary = vocabulary
+        self.word_exponent = word_exponent
+        self.mean_words = mean_words
+        self.title_words = title_words
+        self.mean_links = mean_links
+        self.link_exponent = link_exponent
+        self.pages_per_host = pages_per_host
+        self._words = None
+
+    @classmethod
+    def sized(cls, size, **params):
+        """Corpus('10k') and the like, or a page count."""
+        return cls(SIZES[size] if size in SIZES else int(size), **params)
+
+    def describe(self):
+        return {key: value for key, value in vars(self).items() if not key.startswith('_')}
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = make_vocabulary(self.vocabulary, self.seed)
+        return self._words
+
+    def url(self, page_id):
+        return f"http://host{(page_id - 1) // self.pages_per_host}.bench.local/page/{page_id}"
+
+    def generate(self, db):
+        """
+        Replaces the pages and links of db with this corpus, pages numbered
+        1..pages. Returns the number of links written.
+        """
+        rng = np.random.default_rng(self.seed)
+        draw_words = zipf_sampler(self.vocabulary, self.word_exponent, rng)
+        # Popularity is independent of page id, so popular pages are spread over hosts
+        popular = rng.permutation(self.pages) + 1
+        draw_targets = zipf_sampler(self.pages, self.link_exponent, rng)
+        words = self.words
+
+        with db.get_connection() as conn:
+            for table in ('keywords', 'term_stats', 'collection_stats', 'links', 'pages'):
+                conn.execute(f'DELETE FROM {table}')
+        links = 0
+        for start in range(1, self.pages + 1, WRITE_BATCH):
+            ids = range(start, min(start + WRITE_BATCH, self.pages + 1))
+            lengths = np.maximum(rng.lognormal(np.log(self.mean_words) - 0.18, 0.6, len(ids)).astype(int), 5)
+            text_ranks = draw_words(int(lengths.sum()))
+            title_ranks = draw_words(self.title_words * len(ids))
+            out_degrees = rng.poisson(self.mean_links, len(ids))
+            targets = popular[draw_targets(int(out_degrees.sum()))]
+
+            page_rows, link_rows = [], []
+            text_at = link_at = 0
+            for i, page_id in enumerate(ids):
+                text = ' '.join(words[text_ranks[text_at:text_at + lengths[i]]])
+                title = ' '.join(words[title_ranks[i * self.title_words:(i + 1) * self.title_words]]).title()
+                text_at += lengths[i]
+                page_rows.append((page_id, self.url(page_id), title, text, document_hash(title, text)))
+                link_rows.extend((page_id, int(target))
+                                 for target in targets[link_at:link_at + out_degrees[i]] if target != page_id)
+                link_at += out_degrees[i]
+
+            with db.get_connection() as conn:
+                conn.executemany('INSERT INTO pages (id, url, title, cleaned_text, content_hash) VALUES (?, ?, ?, ?, ?)',
+                                 page_rows)
+                links += conn.executemany('INSERT OR IGNORE INTO links (source_id, target_id) VALUES (?, ?)',
+                                          link_rows).rowcount
+        return links
+
+    def query_log(self, db, count=200):
+        """
+        count queries, the same for every run with this seed: one to three
+        non-stopword words with log-uniform ranks, so head, torso and tail
+        words are all well represented, one in ten a quoted phrase taken from a page of
+        the generated corpus in db, and one in ten with a word that isn't
+        in the corpus at all.
+        """
+        rng = np.random.default_rng(self.seed + 1)
+        stopwords = TextProcessor().stopwords
+        queries = []
+        for i in range(count):
+            kind = i % 10
+            ranks = np.exp(rng.uniform(np.log(len(stopwords)), np.log(self.vocabulary), 1 + kind % 3)).astype(int)
+            terms = [str(word) for word in self.words[ranks]]
+            if kind == 8:
+                queries.append(f'"{self._phrase(db, rng, stopwords)}"')
+            elif kind == 9:
+                queries.append(f"{terms[0]} zzmissing{i}")
+            else:
+                queries.append(' '.join(terms))
+        return queries
+
+    def _phrase(self, db, rng, stopwords):
+        """Two adjacent words of a random page, neither of them a stopword."""
+        while True:
+            with db.get_connection() as conn:
+                text = conn.execute('SELECT cleaned_text FROM pages WHERE id = ?',
+                                    (int(rng.integers(1, self.pages + 1)),)).fetchone()[0]
+            words = text.split()
+            for start in rng.permutation(len(words) - 1):
+                pair = words[start:start + 2]
+                if not stopwords.intersection(pair):
+                    return ' '.join(pair)
+
+
+def main():
+    logging.getLogger().setLevel(logging.ERROR)
+    corpus = Corpus.sized(sys.argv[1] if len(sys.argv) > 1 else '10k')
+    if len(sys.argv) > 2:
+        config.DATABASE_PATH = os.path.abspath(sys.argv[2])
+    start = time.perf_counter()
+    links = corpus.generate(Database())
+    print(f"{corpus.pages} pages, {links} links written to {config.DATABASE_PATH} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
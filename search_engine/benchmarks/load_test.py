@@ -0,0 +1,149 @@
+"""
+Load test for the search API: keeps a fixed number of /search requests
+in flight for a while and reports throughput, p50/p99 latency and status
+codes, plus the latency of an admin endpoint probed alongside. With
+--index a full re-index runs during the test.
+
+Without --url it builds a synthetic corpus and serves it from a separate
+uvicorn process, so the client doesn't compete with the API for the GIL.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.load_test [--url http://host:8000] [--concurrency 64]
+        [--duration 10] [--pages 3000] [--index]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+import aiohttp
+from .. import config
+
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+
+from .bench_search import QUERIES
+
+WORDS = [word for queries in QUERIES.values() for query in queries for word in query.split()]
+
+
+SERVER = """
+import uvicorn
+from search_engine import config
+config.DATABASE_PATH = {database!r}
+config.QUERY_CACHE_MAX_ENTRIES = 0
+from search_engine.api.main import app
+uvicorn.run(app, host="127.0.0.1", port={port}, log_level="error")
+"""
+
+
+def start_local_server(pages):
+    from ..storage.database import Database
+    from ..indexer.inverted_index import InvertedIndex
+    from .bench_indexing import load_pages
+
+    load_pages(Database(), random.Random(7), pages)
+    InvertedIndex().build_index()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    root = os.path.dirname(config.BASE_DIR)
+    server = subprocess.Popen([sys.executable, "-c", SERVER.format(database=config.DATABASE_PATH, port=port)],
+                              cwd=root, env={**os.environ, 'PYTHONPATH': root})
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            time.sleep(0.1)
+    return f"http://127.0.0.1:{port}", server
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def search_client(session, url, deadline, rng, latencies, statuses):
+    while time.monotonic() < deadline:
+        query = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+        start = time.perf_counter()
+        try:
+            async with session.get(f"{url}/search", params={'q': query}) as response:
+                await response.read()
+                statuses[response.status] += 1
+        except aiohttp.ClientError:
+            statuses['error'] += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def admin_probe(session, url, deadline, latencies):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        async with session.get(f"{url}/admin/search-pool") as response:
+            await response.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.1)
+
+
+async def run(url, concurrency, duration, index):
+    connector = aiohttp.TCPConnector(limit=concurrency + 1)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        if index:
+            async with session.post(f"{url}/admin/index", params={'full': 'true'}) as response:
+                await response.read()
+        deadline = time.monotonic() + duration
+        latencies, admin_latencies, statuses = [], [], Counter()
+        rng = random.Random(11)
+        start = time.perf_counter()
+        await asyncio.gather(admin_probe(session, url, deadline, admin_latencies),
+                             *(search_client(session, url, deadline, random.Random(rng.random()),
+                                             latencies, statuses)
+                               for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        async with session.get(f"{url}/admin/search-pool") as response:
+            pool = await response.json()
+
+    print(f"concurrency {concurrency}, {elapsed:.1f}s{', re-indexing' if index else ''}")
+    print(f"search:  {sum(statuses.values())} requests, {len(latencies) / elapsed:.1f} req/s, "
+          f"p50 {percentile(latencies, 0.5):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms")
+    print(f"status:  {dict(sorted(statuses.items(), key=str))}")
+    print(f"admin:   p50 {percentile(admin_latencies, 0.5):.1f} ms, p99 {percentile(admin_latencies, 0.99):.1f} ms")
+    print(f"pool:    {pool}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="API to test; starts a local one when omitted")
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--pages', type=int, default=3000, help="synthetic corpus size for the local API")
+    parser.add_argument('--index', action='store_true', help="run a full re-index during the test")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    url, server = args.url, None
+    if not url:
+        url, server = start_local_server(args.pages)
+    try:
+        asyncio.run(run(url.rstrip('/'), args.concurrency, args.duration, args.index))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+The whole pipeline on a synthetic corpus, one stage at a time, with the
+results written as JSON so runs can be compared between commits:
+TextProcessor.process_text, InvertedIndex.build_index,
+PageRank.calculate_pagerank, Ranker.search over the corpus's fixed
+query log, Parser.parse over the HTML fixtures, and a crawl of the
+local stub site. The search stage also records a digest of every result
+list, so a change in ranking shows up next to a change in speed.
+
+Run from the repository root:
+    python -m search_engine.benchmarks.run_all [--size 10k] [--output results.json]
+    python -m search_engine.benchmarks.run_all --baseline before.json --output after.json
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from .. import config, metrics
+from ..storage.database import Database
+from ..indexer.text_processor import TextProcessor
+from ..indexer.inverted_index import InvertedIndex
+from ..indexer.pagerank import PageRank
+from ..indexer.ranker import Ranker, SEARCH_STAGES
+from ..crawler.parser import Parser
+from .corpus import Corpus
+from .bench_parse import load_fixtures, FIXTURES
+from . import bench_crawl as crawl_benchmark
+from .stub_server import StubSite
+
+STAGES = ("process_text", "build_index", "pagerank", "search", "parse", "crawl")
+SEARCH_ROUNDS = 3
+PARSE_ROUNDS = 50
+PROCESS_TEXT_SAMPLE = 5000  # pages
+
+
+def latency_summary(timings):
+    timings = np.sort(np.asarray(timings) * 1000)
+    return {'p50_ms': float(np.percentile(timings, 50)), 'p95_ms': float(np.percentile(timings, 95)),
+            'p99_ms': float(np.percentile(timings, 99)), 'mean_ms': float(timings.mean())}
+
+
+def bench_process_text(db, corpus, queries):
+    processor = TextProcessor()
+    with db.get_connection() as conn:
+        texts = [row[0] for row in conn.execute('SELECT cleaned_text FROM pages ORDER BY id LIMIT ?',
+                                                (PROCESS_TEXT_SAMPLE,))]
+    start = time.perf_counter()
+    tokens = sum(len(processor.process_text(text)) for text in texts)
+    elapsed = time.perf_counter() - start
+    return {'docs': len(texts), 'seconds': elapsed, 'docs_per_sec': len(texts) / elapsed,
+            'tokens_per_sec': tokens / elapsed}
+
+
+def bench_build_index(db, corpus, queries):
+    index = InvertedIndex()
+    start = time.perf_counter()
+    indexed = index.build_index(full=True)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    index.build_index()  # nothing changed: the cost of checking
+    return {'docs': indexed, 'seconds': elapsed, 'docs_per_sec': indexed / elapsed,
+            'noop_seconds': time.perf_counter() - start}
+
+
+def bench_pagerank(db, corpus, queries):
+    pagerank = PageRank()
+    start = time.perf_counter()
+    pagerank.calculate_pagerank()
+    return {'seconds': time.perf_counter() - start, 'links': db.get_links_count(),
+            'iterations': pagerank.iterations, 'residual': pagerank.residual}
+
+
+def _stage_totals():
+    return {stage: metrics.SEARCH_STAGE_SECONDS.labels(stage).sum for stage in SEARCH_STAGES}
+
+
+def bench_search(db, corpus, queries):
+    index = InvertedIndex()
+    index.build_index()  # untimed; a no-op after the build_index stage
+    if index.segments:
+        # Segments keep the scores their pages had when written; publish the
+        # current ones as run_index_task does after PageRank
+        index.segments.update_pageranks()
+    ranker = Ranker()
+    for query in queries:  # warm up: page cache, connections, snapshot loads
+        ranker.search(query)
+    digest = hashlib.sha1()
+    for query in queries:
+        for result in ranker.search(query):
+            digest.update(f"{result['url']}\t{result['score']:.9g}\n".encode('utf-8'))
+
+    before = _stage_totals()
+    postings = metrics.SEARCH_POSTINGS_SCORED.labels(), metrics.SEARCH_POSTINGS_SKIPPED.labels()
+    postings_before = [counter.value for counter in postings]
+    timings, results = [], 0
+    start = time.perf_counter()
+    for _ in range(SEARCH_ROUNDS):
+        for query in queries:
+            query_start = time.perf_counter()
+            results += len(ranker.search(query))
+            timings.append(time.perf_counter() - query_start)
+    elapsed = time.perf_counter() - start
+    after = _stage_totals()
+    searches = len(timings)
+    return {'queries': len(queries), 'searches': searches, 'qps': searches / elapsed,
+            **latency_summary(timings), 'results_per_query': results / searches,
+            'postings_scored_per_query': (postings[0].value - postings_before[0]) / searches,
+            'postings_skipped_per_query': (postings[1].value - postings_before[1]) / searches,
+            'stage_mean_ms': {stage: (after[stage] - before[stage]) / searches * 1000 for stage in SEARCH_STAGES},
+            'results_digest': digest.hexdigest()}
+
+
+def bench_parse(db, corpus, queries):
+    pages = load_fixtures(FIXTURES)
+    total_bytes = sum(len(html.encode('utf-8')) for _, html in pages)
+    engines = {}
+    for engine in ("html.parser", "lxml"):
+        start = time.perf_counter()
+        for _ in range(PARSE_ROUNDS):
+            for url, html in pages:
+                Parser.parse(html, url, engine)
+        elapsed = time.perf_counter() - start
+        engines[engine] = {'pages_per_sec': PARSE_ROUNDS * len(pages) / elapsed,
+                           'mb_per_sec': PARSE_ROUNDS * total_bytes / elapsed / 1e6}
+    return {'fixtures': len(pages), 'bytes': total_bytes, **engines}
+
+
+def bench_crawl(db, corpus, queries):
+    """bench_crawl's stub-site crawl; its pages land next to the corpus under other urls."""
+    config.DELAY_BETWEEN_REQUESTS = config.HOST_MIN_DELAY = crawl_benchmark.DELAY
+    engines = {}
+    for engine in ("threaded", "async"):
+        with StubSite(pages=crawl_benchmark.PAGES, hosts=crawl_benchmark.HOSTS,
+                      latency=crawl_benchmark.LATENCY) as site:
+            engines[engine] = {'pages_per_sec': crawl_benchmark.crawl(engine, site)}
+    return {'pages': crawl_benchmark.PAGES, 'hosts': crawl_benchmark.HOSTS, **engines}
+
+
+BENCHMARKS = {'process_text': bench_process_text, 'build_index': bench_build_index, 'pagerank': bench_pagerank,
+              'search': bench_search, 'parse': bench_parse, 'crawl': bench_crawl}
+
+
+def environment():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {'commit': commit, 'dirty': dirty, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'config': {name: getattr(config, name) for name in
+                       ('INDEX_BACKEND', 'INDEX_WORKERS', 'INDEX_POSITIONS', 'MEMORY_INDEX', 'RANKING_MODEL',
+                        'TOP_K_PRUNING', 'PAGERANK_ENGINE', 'PARSER_ENGINE', 'USE_STEMMING', 'METRICS_ENABLED')}}
+
+
+def flatten(results, prefix=''):
+    """Numeric leaves of nested results as {'stage.key': value}."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def print_comparison(baseline, report):
+    old, new = flatten(baseline['results']), flatten(report['results'])
+    print(f"\n{'metric':<44}{'baseline':>14}{'now':>14}{'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        change = f"{(new[key] - old[key]) / old[key]:+.1%}" if old[key] else ''
+        print(f"{key:<44}{old[key]:>14.4g}{new[key]:>14.4g}{change:>9}")
+    before = baseline['results'].get('search', {}).get('results_digest')
+    after = report['results'].get('search', {}).get('results_digest')
+    if before and after and before != after:
+        print("\nsearch: result lists differ from the baseline")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', default='10k', help="corpus pages: 1k, 10k, 100k, 1M or a number")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma-separated subset of " + ', '.join(STAGES))
+    parser.add_argument('--backend', choices=("sqlite", "segments"), default=config.INDEX_BACKEND)
+    parser.add_argument('--database', help="reuse this database if it already holds the corpus")
+    parser.add_argument('--output', help="write the JSON report here; '-' for stdout")
+    parser.add_argument('--baseline', help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    logging.getLogger().setLevel(logging.ERROR)
+    config.DATABASE_PATH = os.path.abspath(args.database) if args.database else \
+        os.path.join(tempfile.mkdtemp(), 'bench.db')
+    config.SEGMENT_DIR = os.path.join(os.path.dirname(config.DATABASE_PATH), 'segments')
+    config.INDEX_BACKEND = args.backend
+    config.QUERY_CACHE_MAX_ENTRIES = 0  # measure the search path, not the result cache
+
+    db = Database()
+    corpus = Corpus.sized(args.size, seed=args.seed)
+    start = time.perf_counter()
+    if db.get_document_count() != corpus.pages or not args.database:
+        links = corpus.generate(db)
+    else:
+        links = db.get_links_count()
+    report = {'environment': environment(),
+              'corpus': {**corpus.describe(), 'links': links, 'generate_seconds': time.perf_counter() - start},
+              'results': {}}
+    queries = corpus.query_log(db, args.queries)
+
+    for stage in STAGES:  # in pipeline order, whatever order they were given in
+        if stage not in stages:
+            continue
+        report['results'][stage] = result = BENCHMARKS[stage](db, corpus, queries)
+        print(f"{stage:<14}" + ', '.join(f"{key} {value:.4g}" for key, value in flatten(result).items()
+                                          if not key.startswith('stage_mean_ms')), file=sys.stderr)
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Local HTTP stub serving a synthetic link graph for crawler tests and
+benchmarks. Pages are spread over several "hosts" (one server per port on
+127.0.0.1) so per-host politeness can be exercised without DNS.
+
+    with StubSite(pages=500, hosts=10) as site:
+        seeds = site.seed_urls()
+"""
+import gzip
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+WORDS = ("search engine crawler index python web page link graph rank query "
+         "token stem document frequency score server network cache fetch").split()
+
+# Ways a link can spell the same page, for url_variants
+VARIANTS = ("", "?utm_source=feed", "?b=2&a=1", "?a=1&b=2", "/index.html", "#top")
+
+
+class StubSite:
+    def __init__(self, pages=500, hosts=4, out_degree=8, latency=0.0, seed=42, compress=False,
+                 robots="User-agent: *\nAllow: /\n", robots_status=200, duplicates=0.0, url_variants=False):
+        self.pages = pages
+        self.robots = robots
+        self.robots_status = robots_status
+        self.robots_requests = 0
+        self.latency = latency
+        self.compress = compress  # gzip bodies for clients that accept it
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.rng = rng = random.Random(seed)
+        self.versions = [0] * pages
+        self.modified = [time.time()] * pages
+        self.graph = [rng.sample(range(pages), min(out_degree, pages)) for _ in range(pages)]
+        self.bodies = [" ".join(rng.choice(WORDS) for _ in range(200)) for _ in range(pages)]
+        # Mirrors: a share of pages copy another page's links and body, give or take a word
+        self.originals = list(range(pages))
+        mirrors = set(rng.sample(range(pages), int(pages * duplicates)))
+        sources = [page for page in range(pages) if page not in mirrors]
+        for page in sorted(mirrors):
+            original = self.originals[page] = rng.choice(sources)
+            self.graph[page] = self.graph[original]
+            words = self.bodies[original].split()
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            self.bodies[page] = " ".join(words)
+        self.url_variants = url_variants  # links use query strings, index.html and fragments
+        self.empty = set()  # pages answered with a 200 and no body
+        self.servers = [ThreadingHTTPServer(("127.0.0.1", 0), self._handler()) for _ in range(hosts)]
+        for server in self.servers:
+            server.daemon_threads = True
+
+    def url(self, page):
+        server = self.servers[page % len(self.servers)]
+        return f"http://127.0.0.1:{server.server_address[1]}/page/{page}"
+
+    def seed_urls(self, count=1):
+        return [self.url(page) for page in range(count)]
+
+    def mutate(self, page):
+        """Change a page's body, giving it a new ETag and Last-Modified."""
+        self.bodies[page] = " ".join(self.rng.choice(WORDS) for _ in range(200))
+        self.versions[page] += 1
+        self.modified[page] = time.time()
+
+    def etag(self, page):
+        return f'"{page}-{self.versions[page]}"'
+
+    def link(self, page, target):
+        if not self.url_variants:
+            return self.url(target)
+        return self.url(target) + VARIANTS[(page + target) % len(VARIANTS)]
+
+    def render(self, page):
+        links = "".join(f'<a href="{self.link(page, target)}">page {target}</a>\n' for target in self.graph[page])
+        return (f"<html><head><title>Page {page}</title></head>"
+                f"<body><p>{self.bodies[page]}</p>\n{links}</body></html>")
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests += 1
+                if site.latency:
+                    time.sleep(site.latency)
+                if self.path == "/robots.txt":
+                    site.robots_requests += 1
+                    return self._send(site.robots_status, site.robots, "text/plain")
+                path = urlsplit(self.path).path
+                if path.endswith("/index.html"):
+                    path = path[:-len("/index.html")]
+                try:
+                    page = int(path.rsplit("/", 1)[-1])
+                    assert 0 <= page < site.pages
+                except (ValueError, AssertionError):
+                    return self._send(404, "not found", "text/plain")
+                if page in site.empty:
+                    return self._send(200, "", "text/html")
+                validators = {"ETag": site.etag(page),
+                              "Last-Modified": formatdate(site.modified[page], usegmt=True)}
+                if self.headers.get("If-None-Match") == validators["ETag"]:
+                    site.not_modified += 1
+                    return self._send(304, "", "text/html", validators)
+                self._send(200, site.render(page), "text/html", validators)
+
+            def _send(self, status, body, content_type, extra_headers=None):
+                payload = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                for name, value in (extra_headers or {}).items():
+                    self.send_header(name, value)
+                if status == 304:
+                    self.end_headers()
+                    return
+                if site.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    payload = gzip.compress(payload)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                site.bytes_sent += len(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,6 +1,13 @@
 import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_PATH = os.path.join(BASE_DIR, 'search_engine.db')
+DB_POOL_CONNECTIONS = True  # Reuse one connection per thread instead of one per call
+DB_JOURNAL_MODE = "WAL"
+DB_SYNCHRONOUS = "NORMAL"  # Safe with WAL; fsync only at checkpoints
+DB_CACHE_SIZE_KB = 64000
+DB_MMAP_SIZE = 256 * 1024 * 1024  # bytes
+DB_BUSY_TIMEOUT = 30  # seconds to wait on a locked database
+DB_STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
 SEED_URLS = [
     "https://www.python.org",
     "https://en.wikipedia.org/wiki/Web_crawler",
@@ -8,15 +15,102 @@ SEED_URLS = [
     "https://docs.docker.com/"
 ]
 
+CRAWLER_ENGINE = "threaded"  # "threaded" or "async"
+FRONTIER_BACKEND = "memory"  # "memory" (URLQueue), "disk" (DiskFrontier) or "redis" (RedisFrontier, shared by several crawlers)
+FRONTIER_PATH = os.path.join(BASE_DIR, 'frontier.db')
+FRONTIER_PRIORITY = "depth"  # "depth" (breadth-first) or "inlinks" (estimated PageRank)
+FRONTIER_BLOOM_CAPACITY = 1000000  # expected distinct urls
+FRONTIER_BLOOM_ERROR_RATE = 0.001
+FRONTIER_COMMIT_EVERY = 100  # frontier operations per commit
+FRONTIER_CHECKPOINT_INTERVAL = 30  # seconds between Bloom filter saves
+REDIS_URL = "redis://localhost:6379/0"
+REDIS_FRONTIER_PREFIX = "frontier"  # key prefix; crawlers sharing a prefix share a frontier
+REDIS_FRONTIER_CANDIDATES = 16  # due hosts looked at per claim
+FRONTIER_LEASE_TIMEOUT = 300  # seconds a claimed URL may go without task_done before it is handed out again
+FRONTIER_RECLAIM_INTERVAL = 30  # seconds between checks for expired leases
+CANONICALIZE_URLS = True  # queue, store and link pages under canonical URLs
+CANONICAL_INDEX_FILES = ("index.html", "index.htm", "index.php", "default.htm", "default.aspx")
+CANONICAL_DROP_PARAMS = ("utm_*", "gclid", "fbclid", "msclkid", "sessionid", "phpsessid", "jsessionid")
+NEAR_DUPLICATE_DETECTION = True  # collapse pages whose text is nearly identical onto one canonical page
+DEDUP_SHINGLE_SIZE = 3  # words per SimHash feature
+DEDUP_MAX_DISTANCE = 3  # fingerprints this many bits apart (of 64) or fewer are duplicates
+DEDUP_MIN_WORDS = 20  # shorter pages are never treated as duplicates
 MAX_DEPTH = 2
 MAX_PAGES_TO_CRAWL = 100
 USER_AGENT = "MiniGoogleBot/1.0"
 REQUEST_TIMEOUT = 10  # seconds
 RETRY_COUNT = 3
 DELAY_BETWEEN_REQUESTS = 1.0  # seconds
+ROBOTS_CACHE_SIZE = 10000  # hosts whose robots.txt is kept in memory
+ROBOTS_TTL = 24 * 3600  # seconds a fetched robots.txt stays valid
+ROBOTS_ERROR_TTL = 3600  # seconds before retrying a host whose robots.txt failed
+ROBOTS_TIMEOUT = 5  # seconds
+ROBOTS_MAX_CRAWL_DELAY = 60  # cap on a host's Crawl-delay, in seconds
+HOST_MAX_CONCURRENCY = 2  # concurrent requests per host (async engine)
+HOST_MIN_DELAY = DELAY_BETWEEN_REQUESTS  # seconds between request starts to one host
+ASYNC_MAX_IN_FLIGHT = 1000
+ASYNC_PARSE_WORKERS = 4
+REFRESH_INITIAL_INTERVAL = 24 * 3600  # seconds until a new page is re-crawled
+REFRESH_MIN_INTERVAL = 3600
+REFRESH_MAX_INTERVAL = 30 * 24 * 3600
+REFRESH_CHANGED_FACTOR = 0.5  # interval multiplier when a page changed
+REFRESH_UNCHANGED_FACTOR = 1.5  # interval multiplier when it didn't
+PARSER_ENGINE = "lxml"  # "lxml" (streaming extractor) or "html.parser" (BeautifulSoup)
+STORE_RAW_HTML = False  # keep fetched HTML in pages.content
+RAW_HTML_COMPRESSION = "zlib"  # "zlib", "zstd" (needs zstandard) or None
+WRITE_BATCH_SIZE = 50  # pages per write transaction
+WRITE_FLUSH_INTERVAL = 2.0  # seconds before a partial batch is flushed
+WRITE_QUEUE_SIZE = 500  # parsed pages buffered before workers block
+WRITE_RETRIES = 2  # retries of a failed batch before its items are written one at a time
+WRITE_RETRY_DELAY = 0.5  # seconds between batch write retries
 STOPWORDS_FILE = os.path.join(BASE_DIR, 'indexer', 'stopwords.txt') # If we use a file
 USE_STEMMING = True
+INDEX_BATCH_SIZE = 500  # pages tokenized and written per transaction
+INDEX_POSITIONS = True  # store word positions and offsets for phrases, proximity and snippets
+INDEX_WORKERS = 1  # tokenizer processes for index builds; 1 tokenizes in-process
+INDEX_BACKEND = "sqlite"  # "sqlite" (keywords table) or "segments" (immutable segment files); run a full build after switching
+SEGMENT_DIR = os.path.join(BASE_DIR, 'segments')
+SEGMENT_FLUSH_DOCS = 5000  # documents per segment written by an index build
+SEGMENT_MERGE_FACTOR = 4  # segments of a similar size merged at once
+SEGMENT_MAX_DELETED_RATIO = 0.3  # segments with a larger share of deleted documents are rewritten
+SEGMENT_MERGE_INTERVAL = 30.0  # seconds between background merge checks
 DAMPING_FACTOR = 0.85
-PAGERANK_ITERATIONS = 20
+PAGERANK_ITERATIONS = 20  # fixed iteration count of the reference engine
+PAGERANK_ENGINE = "sparse"  # "sparse" (NumPy/SciPy) or "python" (reference)
+PAGERANK_TOLERANCE = 1e-6  # L1 change at which the sparse engine stops
+PAGERANK_MAX_ITERATIONS = 100
 PAGERANK_WEIGHT = 10.0  # Weight for PageRank in final score
-TFIDF_WEIGHT = 1.0     # Weight for TF-IDF in final score
+TFIDF_WEIGHT = 1.0     # Weight for the text score (BM25 or TF-IDF) in final score
+RANKING_MODEL = "bm25"  # "bm25" or "tfidf"
+BM25_K1 = 1.2  # term frequency saturation
+BM25_B = 0.75  # document length normalization, 0 (none) to 1 (full)
+TITLE_BOOST = 2.0  # weight of a title occurrence relative to one in the body
+PROXIMITY_WEIGHT = 1.0  # text score bonus for query terms appearing close together; 0 disables
+PROXIMITY_RERANK_DEPTH = 5  # proximity is scored for the top limit * depth results, then for any lower one it could still lift into the top limit
+TOP_K_PRUNING = True  # skip documents that can't reach the top results (MaxScore); results are the same either way
+MEMORY_INDEX = False  # Serve postings from a memory-mapped snapshot instead of SQLite
+MEMORY_INDEX_PATH = os.path.join(BASE_DIR, 'postings.idx')
+MEMORY_INDEX_CHECK_INTERVAL = 5.0  # seconds between checks for a newer snapshot
+SNAPSHOT_EXPORT_PATH = os.path.join(BASE_DIR, 'snapshot.idx')  # where /admin/snapshot writes a replica snapshot
+REPLICA_SNAPSHOT_PATH = None  # serve searches from this exported snapshot alone, no database or index build needed
+SNAPSHOT_VERIFY = True  # check a replica snapshot's checksums before serving it
+SEARCH_WORKERS = 4  # threads running searches for the API
+SEARCH_MAX_IN_FLIGHT = 32  # searches running or queued before new ones get 503
+SEARCH_TIMEOUT = 5.0  # seconds before a search gets 504
+SEARCH_MAX_LIMIT = 100  # results one /search page may ask for
+SEARCH_CURSOR_DEPTH = 200  # results /search cursors can page through
+SEARCH_CURSOR_MAX_ENTRIES = 1000  # ranked lists kept for cursors
+SEARCH_CURSOR_TTL = 600  # seconds a ranked list is kept for its cursors; later pages rank again
+SEARCH_BATCH_MAX_QUERIES = 100  # queries one /search/batch request may hold
+ADMIN_JOB_WORKERS = 2  # threads for crawl and index jobs started from /admin
+JOB_HISTORY = 50  # finished admin jobs kept for /admin/status
+QUERY_CACHE_MAX_ENTRIES = 10000  # 0 disables the search result cache
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024  # estimated size of cached results
+QUERY_CACHE_TTL = 300  # seconds; also bounds staleness in workers that didn't re-index
+SUGGEST_LIMIT = 10  # completions /suggest returns by default
+SUGGEST_MAX_RESULTS = 50  # most completions a /suggest request may ask for
+SUGGEST_SCAN_LIMIT = 256  # prefixes matching more words than this have their completions precomputed
+SUGGEST_REFRESH_INTERVAL = 300  # seconds before a worker rebuilds its term dictionary in the background
+METRICS_ENABLED = True  # collect pipeline metrics for /metrics
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+METRICS_MAX_HOSTS = 1000  # hosts with their own per-host series; the rest are labelled "other"
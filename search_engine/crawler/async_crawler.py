@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import aiohttp
+from .fetcher import FetchResult, conditional_headers
+from .freshness import FreshnessScheduler
+from .. import config, metrics
+
+logger = logging.getLogger(__name__)
+
+class HostScheduler:
+    """
+    Per-host politeness: caps concurrent requests to a host and spaces
+    request starts to that host by a minimum delay. Hosts never wait on
+    each other.
+    """
+    def __init__(self, max_per_host=None, min_delay=None):
+        self.max_per_host = max_per_host or config.HOST_MAX_CONCURRENCY
+        self.min_delay = config.HOST_MIN_DELAY if min_delay is None else min_delay
+        self.semaphores = {}
+        self.next_start = {}
+        self.delays = {}  # host -> delay overriding min_delay
+
+    def set_delay(self, host, delay):
+        self.delays[host] = delay
+
+    async def acquire(self, host):
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        await self.semaphores[host].acquire()
+
+        # Reserve the next start slot before sleeping so concurrent
+        # requests to the same host queue up behind each other.
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self.next_start.get(host, now))
+        self.next_start[host] = start + self.delays.get(host, self.min_delay)
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def release(self, host):
+        self.semaphores[host].release()
+
+
+class AsyncCrawler:
+    """
+    asyncio fetch engine. Keeps up to ASYNC_MAX_IN_FLIGHT requests open
+    with one aiohttp session; parsing and writes run on a small thread pool
+    so the event loop only does network I/O.
+    """
+    def __init__(self, queue, fetcher, parser, writer, max_in_flight=None, max_pages=None, dedup=None):
+        self.queue = queue
+        self.fetcher = fetcher
+        self.robots = fetcher.robots  # shared with the threaded engine and persisted
+        self.robots_inflight = {}  # host -> task fetching its robots.txt
+        self.parser = parser
+        self.writer = writer
+        self.dedup = dedup  # Deduplicator; None stores every page
+        self.max_in_flight = max_in_flight or config.ASYNC_MAX_IN_FLIGHT
+        self.max_pages = max_pages or config.MAX_PAGES_TO_CRAWL
+        self.scheduler = HostScheduler()
+        self.freshness = FreshnessScheduler()
+        self.executor = ThreadPoolExecutor(max_workers=config.ASYNC_PARSE_WORKERS)
+        self.pages_started = 0
+        self.pages_fetched = 0
+        self.pages_unchanged = 0
+        self.pages_duplicate = 0
+
+    def run(self):
+        try:
+            asyncio.run(self._crawl())
+        finally:
+            self.executor.shutdown()
+
+    async def _crawl(self):
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight,
+                                         limit_per_host=self.scheduler.max_per_host,
+                                         ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=config.REQUEST_TIMEOUT)
+        headers = {'User-Agent': config.USER_AGENT}
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+            in_flight = set()
+            while True:
+                while len(in_flight) < self.max_in_flight and self.pages_started < self.max_pages:
+                    url = self.queue.get_url_nowait()
+                    if not url:
+                        break
+                    self.pages_started += 1
+                    in_flight.add(asyncio.create_task(self._process(session, url)))
+
+                if not in_flight:
+                    break
+                _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+        logger.info(f"Async crawl finished: {self.pages_fetched} of {self.pages_started} pages fetched, "
+                    f"{self.pages_unchanged} unchanged, {self.pages_duplicate} near-duplicates")
+
+    async def _process(self, session, url):
+        loop = asyncio.get_running_loop()
+        try:
+            robots = await self._robots(session, url)
+            if not robots.can_fetch(url):
+                logger.info(f"Blocked by robots.txt: {url}")
+                return
+
+            meta = await loop.run_in_executor(self.executor, self.freshness.get_meta, url)
+            result = await self._fetch(session, url, meta)
+            if result:
+                self.pages_fetched += 1
+                await loop.run_in_executor(self.executor, self._store, url, result, meta)
+        except Exception as e:
+            logger.error(f"Error processing {url}: {e}")
+        finally:
+            self.queue.task_done(url)
+
+    async def _robots(self, session, url):
+        host = self.robots.host_key(url)
+        entry = self.robots.cached(host)
+        if entry is None:
+            task = self.robots_inflight.get(host)
+            if task is None:
+                # First URL of this host: one fetch, every other task awaits it
+                task = self.robots_inflight[host] = asyncio.ensure_future(self._load_robots(session, host))
+                task.add_done_callback(lambda _: self.robots_inflight.pop(host, None))
+            entry = await task
+        if entry.crawl_delay:
+            netloc = urlparse(url).netloc
+            self.scheduler.set_delay(netloc, max(self.scheduler.min_delay, entry.crawl_delay))
+            self.queue.set_host_delay(netloc, entry.crawl_delay)  # for crawlers sharing the frontier
+        return entry
+
+    async def _load_robots(self, session, host):
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(self.executor, self.robots.load, host)
+        if entry:
+            return entry
+
+        self.robots.misses += 1
+        self.robots.fetches += 1
+        status, body = None, ''
+        try:
+            timeout = aiohttp.ClientTimeout(total=config.ROBOTS_TIMEOUT)
+            async with session.get(f"{host}/robots.txt", timeout=timeout) as response:
+                status = response.status
+                if status == 200:
+                    body = await response.text(errors='replace')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not read robots.txt for {host}: {e}")
+        return await loop.run_in_executor(self.executor, self.robots.store, host, status, body)
+
+    async def _fetch(self, session, url, meta=None):
+        host = urlparse(url).netloc
+        label = metrics.host_label(host)
+        headers = conditional_headers(meta)
+        for attempt in range(config.RETRY_COUNT):
+            await self.scheduler.acquire(host)
+            try:
+                logger.info(f"Crawling: {url}")
+                start = time.perf_counter()  # after the politeness wait, like the threaded engine
+                async with session.get(url, headers=headers) as response:
+                    metrics.FETCHES.labels(label, str(response.status)).inc()
+                    if response.status == 304:
+                        metrics.FETCH_SECONDS.labels(label).observe(time.perf_counter() - start)
+                        return FetchResult(304, etag=response.headers.get('ETag'),
+                                           last_modified=response.headers.get('Last-Modified'))
+                    if response.status == 200:
+                        body = await response.read()
+                        metrics.FETCH_SECONDS.labels(label).observe(time.perf_counter() - start)
+                        metrics.FETCH_BYTES.labels(label).inc(len(body))
+                        return FetchResult(200, body.decode(response.get_encoding(), errors='replace'),
+                                           response.headers.get('ETag'),
+                                           response.headers.get('Last-Modified'), len(body))
+                    logger.warning(f"Failed to fetch {url}: Status {response.status} (Attempt {attempt+1})")
+                    if response.status != 429 and response.status < 500:
+                        return None  # retrying won't change a client error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.FETCHES.labels(label, 'error').inc()
+                logger.warning(f"Error fetching {url} (Attempt {attempt+1}): {e}")
+            finally:
+                self.scheduler.release(host)
+            if attempt < config.RETRY_COUNT - 1:
+                await asyncio.sleep(1) # Backoff
+        return None
+
+    def _store(self, url, result, meta):
+        changed, meta_row = self.freshness.record(url, result, meta)
+        if not changed or not result.text:
+            # 304, identical or empty body: only the re-crawl schedule moves
+            self.pages_unchanged += 1
+            self.writer.submit_fetch_meta(meta_row)
+            return
+
+        data = self.parser.parse(result.text, url)
+        if self.dedup:
+            data['simhash'], canonical = self.dedup.check(url, data['text'])
+            if canonical:
+                # Its links are (nearly) the canonical page's: not followed again
+                self.pages_duplicate += 1
+                metrics.DUPLICATES.inc()
+                self.writer.submit_duplicate(url, canonical, data['simhash'])
+                self.writer.submit_fetch_meta(meta_row)
+                return
+        self.writer.submit(url, data)
+        self.writer.submit_fetch_meta(meta_row)
+        # Frontier backends may touch disk, so enqueue off the event loop too
+        depth = self.queue.get_depth(url)
+        for link in self.queue.add_urls(data['links'], depth + 1):
+            logger.debug(f"Queued: {link}")
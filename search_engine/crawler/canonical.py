@@ -0,0 +1,68 @@
+import re
+import string
+from fnmatch import fnmatchcase
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote
+from .. import config
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+_UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+
+def _normalize_escape(match):
+    char = chr(int(match.group(1), 16))
+    return char if char in _UNRESERVED else f"%{match.group(1).upper()}"
+
+def _normalize_path(path):
+    """Dot segments resolved (RFC 3986 5.2.4) and a trailing default document dropped."""
+    path = _ESCAPE.sub(_normalize_escape, path)
+    segments = path.split('/')[1:] if path.startswith('/') else path.split('/')
+    output = []
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == '..':
+            if output:
+                output.pop()
+            if last:
+                output.append('')
+        elif segment == '.':
+            if last:
+                output.append('')
+        else:
+            output.append(segment)
+    if output and output[-1].lower() in config.CANONICAL_INDEX_FILES:
+        output[-1] = ''
+    return '/' + '/'.join(output)
+
+def _dropped(name):
+    name = name.lower()
+    return any(fnmatchcase(name, pattern) for pattern in config.CANONICAL_DROP_PARAMS)
+
+def canonicalize_url(url):
+    """
+    The form a URL is queued, stored and linked under, so that variants
+    of one address collapse to a single page: lower-case scheme and host,
+    no default port or fragment, dot segments resolved, index documents
+    (CANONICAL_INDEX_FILES) cut from the path, tracking parameters
+    (CANONICAL_DROP_PARAMS) removed and the rest sorted, and percent-escapes
+    normalized. URLs that aren't http(s) or don't parse come back unchanged.
+    """
+    if not config.CANONICALIZE_URLS:
+        return url
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname  # already lower-case
+    netloc = f"[{host}]" if ':' in host else host
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    if '@' in parts.netloc:
+        netloc = f"{parts.netloc.rsplit('@', 1)[0]}@{netloc}"
+    params = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                    if not _dropped(name))
+    return urlunsplit((scheme, netloc, _normalize_path(parts.path), urlencode(params, quote_via=quote), ''))
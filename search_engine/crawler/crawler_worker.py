@@ -1,18 +1,23 @@
 import threading
 import time
 import logging
+from urllib.parse import urlparse
 from ..storage.database import Database
-from .. import config
+from .freshness import FreshnessScheduler
+from .. import config, metrics
 
 logger = logging.getLogger(__name__)
 
 class CrawlerWorker(threading.Thread):
-    def __init__(self, queue, fetcher, parser):
+    def __init__(self, queue, fetcher, parser, writer=None, dedup=None):
         super().__init__()
         self.queue = queue
         self.fetcher = fetcher
         self.parser = parser
+        self.writer = writer  # PageWriter; without one, each page is its own transaction
+        self.dedup = dedup  # Deduplicator shared by all workers; None stores every page
         self.db = Database()
+        self.freshness = FreshnessScheduler()
         self.daemon = True # Daemon thread exits when main program exits
 
     def run(self):
@@ -27,25 +32,51 @@ class CrawlerWorker(threading.Thread):
                 time.sleep(config.DELAY_BETWEEN_REQUESTS)
                 
                 logger.info(f"Crawling: {url}")
-                html = self.fetcher.fetch(url)
-                
-                if html:
-                    data = self.parser.parse(html, url)
-                    page_id = self.db.add_page(url, data['title'], data['content'], data['text'])
-                    
-                    if page_id:
-                        for link in data['links']:
-                            if self.queue.add_url(link):
-                                logger.debug(f"Queued: {link}")
-                            pass
-                        for link in data['links']:
-                             target_id = self.db.get_page_id(link)
-                             if not target_id:
-                                 target_id = self.db.add_page(link, None, None, None)
-                             
-                             self.db.add_link(page_id, target_id)
+                meta = self.freshness.get_meta(url)
+                result = self.fetcher.fetch_conditional(url, meta)
+                # The fetcher only spaces this process's requests; crawlers
+                # sharing the frontier learn the Crawl-delay from it
+                self.queue.set_host_delay(urlparse(url).netloc, self.fetcher.robots.crawl_delay(url))
+                if not result:
+                    continue
+
+                changed, meta_row = self.freshness.record(url, result, meta)
+                if not changed or not result.text:
+                    # 304, identical or empty body: only the re-crawl schedule moves
+                    logger.debug(f"Unchanged: {url}")
+                    if self.writer:
+                        self.writer.submit_fetch_meta(meta_row)
+                    else:
+                        self.db.save_crawl_batch([], [meta_row])
+                    continue
+
+                data = self.parser.parse(result.text, url)
+                canonical = None
+                if self.dedup:
+                    data['simhash'], canonical = self.dedup.check(url, data['text'])
+                if canonical:
+                    # Its links are (nearly) the canonical page's: not followed again
+                    logger.info(f"Near-duplicate of {canonical}: {url}")
+                    metrics.DUPLICATES.inc()
+                    duplicate = (url, canonical, data['simhash'])
+                    if self.writer:
+                        self.writer.submit_duplicate(*duplicate)
+                        self.writer.submit_fetch_meta(meta_row)
+                    else:
+                        self.db.save_crawl_batch([], [meta_row], [duplicate])
+                    continue
+
+                if self.writer:
+                    self.writer.submit(url, data)
+                    self.writer.submit_fetch_meta(meta_row)
+                else:
+                    self.db.save_crawl_batch([{'url': url, **data}], [meta_row])
+
+                depth = self.queue.get_depth(url)
+                for link in self.queue.add_urls(data['links'], depth + 1):
+                    logger.debug(f"Queued: {link}")
 
             except Exception as e:
                 logger.error(f"Error processing {url}: {e}")
             finally:
-                self.queue.task_done()
+                self.queue.task_done(url)
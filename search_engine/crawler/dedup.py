@@ -0,0 +1,122 @@
+import hashlib
+import re
+import threading
+import logging
+from collections import Counter, defaultdict
+import numpy as np
+from ..storage.database import Database
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r'\w+')
+
+def simhash(text, shingle_size=None):
+    """
+    64-bit SimHash of text: every run of shingle_size words is hashed, and
+    each bit of the fingerprint is a vote over that bit of the shingle
+    hashes, weighted by how often the shingle occurs. Texts that differ in
+    a few words get fingerprints a few bits apart. None for texts shorter
+    than DEDUP_MIN_WORDS, which are too short to compare this way.
+    """
+    shingle_size = shingle_size or config.DEDUP_SHINGLE_SIZE
+    words = WORD_PATTERN.findall(text.lower()) if text else []
+    if len(words) < max(shingle_size, config.DEDUP_MIN_WORDS):
+        return None
+    shingles = Counter(' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1))
+    hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+                       for shingle in shingles], dtype='<u8')
+    weights = np.fromiter(shingles.values(), dtype=np.int64)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little').astype(np.int64)
+    votes = weights @ (2 * bits - 1)
+    return int(np.packbits(votes > 0, bitorder='little').view('<u8')[0])
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class SimHashIndex:
+    """
+    LSH index over 64-bit SimHash fingerprints. Each fingerprint is split
+    into max_distance + 1 bands; two fingerprints at most max_distance bits
+    apart must agree exactly on at least one band, so lookups only compare
+    against fingerprints sharing a band.
+    """
+    def __init__(self, max_distance=None):
+        self.max_distance = config.DEDUP_MAX_DISTANCE if max_distance is None else max_distance
+        bands = self.max_distance + 1
+        bounds = [64 * i // bands for i in range(bands + 1)]
+        self.bands = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self.tables = [defaultdict(set) for _ in self.bands]
+        self.fingerprints = {}  # key -> fingerprint
+
+    def _band_values(self, fingerprint):
+        return [(fingerprint >> shift) & mask for shift, mask in self.bands]
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def add(self, key, fingerprint):
+        self.remove(key)
+        self.fingerprints[key] = fingerprint
+        for table, value in zip(self.tables, self._band_values(fingerprint)):
+            table[value].add(key)
+
+    def remove(self, key):
+        fingerprint = self.fingerprints.pop(key, None)
+        if fingerprint is None:
+            return
+        for table, value in zip(self.tables, self._band_values(fingerprint)):
+            table[value].discard(key)
+            if not table[value]:
+                del table[value]
+
+    def find(self, fingerprint, exclude=None):
+        """The key of the closest fingerprint within max_distance bits, or None."""
+        candidates = set()
+        for table, value in zip(self.tables, self._band_values(fingerprint)):
+            candidates.update(table.get(value, ()))
+        candidates.discard(exclude)
+        best = None
+        for key in candidates:
+            distance = hamming(fingerprint, self.fingerprints[key])
+            if distance <= self.max_distance and (best is None or (distance, key) < best):
+                best = (distance, key)
+        return best[1] if best else None
+
+
+class Deduplicator:
+    """
+    Content-fingerprint stage between Parser.parse and storage, shared by
+    all crawl workers. The first page seen with some content becomes its
+    canonical page; later pages within DEDUP_MAX_DISTANCE bits of it are
+    reported as its duplicates, to be stored as aliases of it instead of
+    as pages of their own. Canonical fingerprints are loaded from the
+    database, so duplicates are caught across crawls.
+    """
+    def __init__(self, max_distance=None):
+        self.db = Database()
+        self.index = SimHashIndex(max_distance)
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        for url, fingerprint in self.db.get_fingerprints():
+            self.index.add(url, fingerprint)
+        logger.info(f"Loaded {len(self.index)} page fingerprints")
+
+    def check(self, url, text):
+        """
+        (fingerprint, canonical_url): canonical_url is the page url
+        duplicates, or None if url is canonical itself. fingerprint is
+        None for pages too short to fingerprint.
+        """
+        fingerprint = simhash(text)
+        if fingerprint is None:
+            return None, None
+        with self.lock:
+            canonical = self.index.find(fingerprint, exclude=url)
+            if canonical is None:
+                self.index.add(url, fingerprint)
+            else:
+                self.index.remove(url)  # it may have been canonical on an earlier crawl
+                self.duplicates += 1
+        return fingerprint, canonical
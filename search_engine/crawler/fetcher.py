@@ -1,47 +1,92 @@
 import requests
+import threading
 import time
-from urllib.robotparser import RobotFileParser
 from urllib.parse import urlparse
-from .. import config
+from .robots import RobotsCache
+from .. import config, metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
+class FetchResult:
+    """Outcome of a fetch: status 200 with a body, or 304 Not Modified."""
+    def __init__(self, status, text=None, etag=None, last_modified=None, content_length=None):
+        self.status = status
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_length = content_length
+
+def conditional_headers(meta):
+    """Validators from a fetch_meta row, to make a GET conditional."""
+    headers = {}
+    if meta:
+        if meta['etag']:
+            headers['If-None-Match'] = meta['etag']
+        if meta['last_modified']:
+            headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
 class Fetcher:
     def __init__(self):
         self.session = requests.Session()
-        self.session.headers.update({'User-Agent': config.USER_AGENT})
-        self.robot_parsers = {}
+        self.session.headers.update({'User-Agent': config.USER_AGENT,
+                                     'Accept-Encoding': 'gzip, deflate'})
+        self.robots = RobotsCache(self.session)
+        self.next_start = {}  # host -> earliest start allowed by its Crawl-delay
+        self.host_lock = threading.Lock()
 
     def can_fetch(self, url):
-        parsed_url = urlparse(url)
-        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-        
-        if base_url not in self.robot_parsers:
-            rp = RobotFileParser()
-            rp.set_url(f"{base_url}/robots.txt")
-            try:
-                rp.read()
-                self.robot_parsers[base_url] = rp
-            except Exception:
-                logger.warning(f"Could not read robots.txt for {base_url}")
-                return True
-        
-        return self.robot_parsers[base_url].can_fetch(config.USER_AGENT, url)
+        return self.robots.can_fetch(url)
+
+    def _wait_crawl_delay(self, url):
+        # Workers share one Fetcher, so this spaces requests to a host
+        # across all of them
+        delay = self.robots.crawl_delay(url)
+        if not delay:
+            return
+        host = urlparse(url).netloc
+        with self.host_lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + delay
+        if start > now:
+            time.sleep(start - now)
 
     def fetch(self, url):
+        result = self.fetch_conditional(url)
+        return result.text if result else None
+
+    def fetch_conditional(self, url, meta=None):
+        """
+        GET url, sending If-None-Match/If-Modified-Since from meta (a
+        fetch_meta row) when there is one. Returns a FetchResult, or None if
+        the URL is blocked or could not be fetched.
+        """
         if not self.can_fetch(url):
             logger.info(f"Blocked by robots.txt: {url}")
             return None
 
+        self._wait_crawl_delay(url)
+        headers = conditional_headers(meta)
+        host = metrics.host_label(urlparse(url).netloc)
         for attempt in range(config.RETRY_COUNT):
+            start = time.perf_counter()
             try:
-                response = self.session.get(url, timeout=config.REQUEST_TIMEOUT)
+                response = self.session.get(url, timeout=config.REQUEST_TIMEOUT, headers=headers)
+                metrics.FETCH_SECONDS.labels(host).observe(time.perf_counter() - start)
+                metrics.FETCHES.labels(host, str(response.status_code)).inc()
+                metrics.FETCH_BYTES.labels(host).inc(len(response.content))
+                if response.status_code == 304:
+                    return FetchResult(304, etag=response.headers.get('ETag'),
+                                       last_modified=response.headers.get('Last-Modified'))
                 if response.status_code == 200:
-                    return response.text
+                    return FetchResult(200, response.text, response.headers.get('ETag'),
+                                       response.headers.get('Last-Modified'), len(response.content))
                 else:
                     logger.warning(f"Failed to fetch {url}: Status {response.status_code}")
             except requests.RequestException as e:
+                metrics.FETCHES.labels(host, 'error').inc()
                 logger.warning(f"Error fetching {url} (Attempt {attempt+1}): {e}")
                 time.sleep(1) # Backoff
         
@@ -0,0 +1,54 @@
+import time
+from ..storage.database import Database, content_hash
+from .. import config
+
+class FreshnessScheduler:
+    """
+    Tracks fetch metadata per URL and decides when each page is due for a
+    re-crawl. Pages that changed since the last fetch are revisited sooner,
+    pages that didn't are revisited less often, within the configured
+    bounds.
+    """
+    def __init__(self):
+        self.db = Database()
+
+    def get_meta(self, url):
+        return self.db.get_fetch_meta(url)
+
+    def record(self, url, result, meta=None):
+        """
+        Returns (changed, fetch_meta row) for a FetchResult. A 304, or a 200
+        whose body hashes the same as last time, counts as unchanged.
+        """
+        now = time.time()
+        if result.status == 304:
+            body_hash = meta['body_hash'] if meta else None
+            changed = False
+        else:
+            body_hash = content_hash(result.text)
+            changed = meta is None or meta['body_hash'] != body_hash
+
+        if meta is None:
+            interval = config.REFRESH_INITIAL_INTERVAL
+        else:
+            factor = config.REFRESH_CHANGED_FACTOR if changed else config.REFRESH_UNCHANGED_FACTOR
+            interval = min(config.REFRESH_MAX_INTERVAL,
+                           max(config.REFRESH_MIN_INTERVAL, meta['refresh_interval'] * factor))
+
+        row = (
+            url,
+            result.etag or (meta['etag'] if meta else None),
+            result.last_modified or (meta['last_modified'] if meta else None),
+            result.content_length if result.status == 200 else (meta['content_length'] if meta else None),
+            body_hash,
+            now,
+            now if changed else meta['changed_at'],
+            (meta['fetch_count'] if meta else 0) + 1,
+            (meta['change_count'] + changed) if meta else 0,
+            interval,
+            now + interval
+        )
+        return changed, row
+
+    def due_urls(self, limit=None):
+        return self.db.get_due_urls(time.time(), limit or config.MAX_PAGES_TO_CRAWL)
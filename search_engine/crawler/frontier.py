@@ -0,0 +1,190 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from .url_queue import URLQueue
+from .canonical import canonicalize_url
+from .. import config
+
+class BloomFilter:
+    """Fixed-size Bloom filter over a bytearray, using double hashing."""
+    def __init__(self, capacity, error_rate, bits=None):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits else bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item):
+        """Add item; returns False if it was (probably) already present."""
+        added = False
+        for p in self._positions(item):
+            mask = 1 << (p & 7)
+            if not self.bits[p >> 3] & mask:
+                self.bits[p >> 3] |= mask
+                added = True
+        return added
+
+
+class DiskFrontier:
+    """
+    URL frontier kept in its own SQLite file instead of memory. Seen URLs
+    are tracked in a Bloom filter (rare false positives drop a URL), pending
+    URLs are rows ordered by depth or by estimated importance, and claimed
+    URLs are only removed on task_done() so a restart re-queues them.
+    """
+    def __init__(self, path=None, priority=None):
+        self.path = path or config.FRONTIER_PATH
+        self.priority = priority or config.FRONTIER_PRIORITY
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._uncommitted = 0
+        self._last_checkpoint = time.monotonic()
+        self._init_db()
+        self.seen = self._load_bloom()
+
+    def _init_db(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS frontier (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                depth INTEGER DEFAULT 0,
+                priority REAL DEFAULT 0.0,
+                claimed INTEGER DEFAULT 0
+            )
+        ''')
+        cursor.execute('CREATE TABLE IF NOT EXISTS frontier_meta (key TEXT PRIMARY KEY, value BLOB)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_frontier_depth ON frontier(claimed, depth, priority DESC, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_frontier_priority ON frontier(claimed, priority DESC, depth, id)')
+        # URLs claimed by a previous run never finished; hand them out again
+        cursor.execute('UPDATE frontier SET claimed = 0 WHERE claimed = 1')
+        self.conn.commit()
+
+    def _load_bloom(self):
+        row = self.conn.execute("SELECT value FROM frontier_meta WHERE key = 'bloom'").fetchone()
+        bloom = BloomFilter(config.FRONTIER_BLOOM_CAPACITY, config.FRONTIER_BLOOM_ERROR_RATE,
+                            row[0] if row else None)
+        if row and len(row[0]) != len(bloom.bits):
+            bloom = BloomFilter(config.FRONTIER_BLOOM_CAPACITY, config.FRONTIER_BLOOM_ERROR_RATE)
+        # The saved filter may predate the last rows written before a crash
+        for (url,) in self.conn.execute('SELECT url FROM frontier'):
+            bloom.add(url)
+        return bloom
+
+    def _maybe_commit(self):
+        self._uncommitted += 1
+        if self._uncommitted >= config.FRONTIER_COMMIT_EVERY:
+            self._commit()
+
+    def _commit(self):
+        if time.monotonic() - self._last_checkpoint >= config.FRONTIER_CHECKPOINT_INTERVAL:
+            self._save_bloom()
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def _save_bloom(self):
+        self.conn.execute("INSERT OR REPLACE INTO frontier_meta (key, value) VALUES ('bloom', ?)",
+                          (bytes(self.seen.bits),))
+        self._last_checkpoint = time.monotonic()
+
+    def add_url(self, url, depth=0, priority=0.0):
+        if depth > config.MAX_DEPTH:
+            return False
+        url = canonicalize_url(url)
+        with self.lock:
+            if not self.seen.add(url):
+                if self.priority == "inlinks":
+                    # Every rediscovery is another in-link: a cheap PageRank estimate
+                    self.conn.execute('UPDATE frontier SET priority = priority + 1 WHERE url = ? AND claimed = 0', (url,))
+                    self._maybe_commit()
+                return False
+            self.conn.execute('INSERT OR IGNORE INTO frontier (url, depth, priority) VALUES (?, ?, ?)',
+                              (url, depth, priority))
+            self._maybe_commit()
+            return True
+
+    def add_urls(self, urls, depth=0, priority=0.0):
+        """add_url for each of urls; returns the ones that were queued."""
+        return [url for url in urls if self.add_url(url, depth, priority)]
+
+    def set_host_delay(self, host, delay):
+        pass  # one process: the fetch engines space requests to a host themselves
+
+    def requeue(self, url, depth=0):
+        """Queue a URL again even if the Bloom filter has seen it, for re-crawls."""
+        url = canonicalize_url(url)
+        with self.lock:
+            self.seen.add(url)
+            self.conn.execute('INSERT OR IGNORE INTO frontier (url, depth, priority) VALUES (?, ?, 0)',
+                              (url, depth))
+            self._maybe_commit()
+
+    def get_url_nowait(self):
+        order = 'priority DESC, depth, id' if self.priority == "inlinks" else 'depth, priority DESC, id'
+        with self.lock:
+            row = self.conn.execute(
+                f'SELECT id, url FROM frontier WHERE claimed = 0 ORDER BY {order} LIMIT 1').fetchone()
+            if not row:
+                return None
+            self.conn.execute('UPDATE frontier SET claimed = 1 WHERE id = ?', (row[0],))
+            self._maybe_commit()
+            return row[1]
+
+    def get_url(self):
+        deadline = time.monotonic() + 1 # Same 1s wait as URLQueue
+        while True:
+            url = self.get_url_nowait()
+            if url or time.monotonic() >= deadline:
+                return url
+            time.sleep(0.05)
+
+    def get_depth(self, url):
+        with self.lock:
+            row = self.conn.execute('SELECT depth FROM frontier WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else 0
+
+    def task_done(self, url=None):
+        if url is None:
+            return
+        with self.lock:
+            self.conn.execute('DELETE FROM frontier WHERE url = ?', (url,))
+            self._maybe_commit()
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM frontier WHERE claimed = 0').fetchone()[0]
+
+    def empty(self):
+        return self.size() == 0
+
+    def is_visited(self, url):
+        url = canonicalize_url(url)
+        with self.lock:
+            return url in self.seen
+
+    def close(self):
+        with self.lock:
+            self._save_bloom()
+            self.conn.commit()
+            self.conn.close()
+
+
+def create_frontier(backend=None):
+    backend = backend or config.FRONTIER_BACKEND
+    if backend == "disk":
+        return DiskFrontier()
+    if backend == "redis":
+        from .redis_frontier import RedisFrontier
+        return RedisFrontier()
+    return URLQueue()
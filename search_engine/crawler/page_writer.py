@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+import logging
+from ..storage.database import Database
+from .. import config, metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class PageWriter(threading.Thread):
+    """
+    Single writer stage for the crawler. Workers submit parsed pages and the
+    writer persists them in multi-row transactions, flushing when a batch
+    fills up or when the flush interval elapses.
+    """
+    def __init__(self, batch_size=None, flush_interval=None):
+        super().__init__()
+        self.batch_size = batch_size or config.WRITE_BATCH_SIZE
+        self.flush_interval = flush_interval or config.WRITE_FLUSH_INTERVAL
+        self.queue = queue.Queue(maxsize=config.WRITE_QUEUE_SIZE)
+        self.db = Database()
+        self.pages_written = 0
+        self.daemon = True
+
+    def submit(self, url, data):
+        # Blocks when the writer falls behind, which throttles the workers
+        self.queue.put(('page', {
+            'url': url,
+            'title': data['title'],
+            'content': data['content'],
+            'text': data['text'],
+            'links': data['links'],
+            'simhash': data.get('simhash')
+        }))
+
+    def submit_duplicate(self, url, canonical_url, fingerprint):
+        self.queue.put(('duplicate', (url, canonical_url, fingerprint)))
+
+    def submit_fetch_meta(self, row):
+        self.queue.put(('meta', row))
+
+    def close(self):
+        """Flush whatever is buffered and stop the writer thread."""
+        self.queue.put(_STOP)
+        self.join()
+
+    def run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                break
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        for attempt in range(config.WRITE_RETRIES + 1):
+            try:
+                self._write(batch)
+                return
+            except Exception as e:
+                logger.warning(f"Error writing batch of {len(batch)} items (attempt {attempt + 1}): {e}")
+                if attempt < config.WRITE_RETRIES:
+                    time.sleep(config.WRITE_RETRY_DELAY)
+        # One bad row shouldn't cost the rest of the batch: write items alone
+        for item in batch:
+            try:
+                self._write([item])
+            except Exception as e:
+                kind, value = item
+                url = value['url'] if kind == 'page' else value[0]
+                logger.error(f"Dropped {kind} item for {url}: {e}")
+
+    def _write(self, batch):
+        pages = [item for kind, item in batch if kind == 'page']
+        fetch_meta = [item for kind, item in batch if kind == 'meta']
+        duplicates = [item for kind, item in batch if kind == 'duplicate']
+        self.db.save_crawl_batch(pages, fetch_meta, duplicates)
+        self.pages_written += len(pages)
+        metrics.PAGES_WRITTEN.inc(len(pages))
+        logger.debug(f"Flushed {len(pages)} pages")
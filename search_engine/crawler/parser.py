@@ -1,31 +1,105 @@
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import re
+import time
+from .canonical import canonicalize_url
+from .. import config, metrics
+try:
+    from lxml import etree
+except ImportError:  # BeautifulSoup's html.parser is always available
+    etree = None
+
+class _ExtractTarget:
+    """
+    lxml parser target that collects the title, visible text and hrefs as
+    parse events arrive, without building a document tree.
+    """
+    SKIP = ("script", "style")
+
+    def __init__(self):
+        self.skip_depth = 0
+        self.in_title = False
+        self.title = None
+        self.text = []
+        self.hrefs = []
+
+    def start(self, tag, attrib):
+        if tag in self.SKIP:
+            self.skip_depth += 1
+        elif tag == "title" and self.title is None:
+            self.in_title = True
+            self.title = []
+        elif tag == "a":
+            href = attrib.get("href")
+            if href:
+                self.hrefs.append(href)
+
+    def end(self, tag):
+        if tag in self.SKIP:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag == "title":
+            self.in_title = False
+
+    def data(self, data):
+        if self.skip_depth:
+            return
+        if self.in_title:
+            self.title.append(data)
+        self.text.append(data)
+
+    def close(self):
+        return self
+
 
 class Parser:
     @staticmethod
-    def parse(html, base_url):
-        soup = BeautifulSoup(html, 'html.parser')
-        title = soup.title.string if soup.title else "No Title"
-        for script in soup(["script", "style"]):
-            script.extract()
-            
-        text = soup.get_text()
+    def parse(html, base_url, engine=None):
+        start = time.perf_counter()
+        engine = engine or config.PARSER_ENGINE
+        if engine == "lxml" and etree is not None:
+            try:
+                title, text, hrefs = Parser._extract_streaming(html)
+            except (etree.Error, ValueError):
+                title, text, hrefs = Parser._extract_soup(html)
+        else:
+            title, text, hrefs = Parser._extract_soup(html)
+
         lines = (line.strip() for line in text.splitlines())
         chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
         cleaned_text = '\n'.join(chunk for chunk in chunks if chunk)
         links = set()
-        for link in soup.find_all('a', href=True):
-            href = link['href']
+        for href in hrefs:
             full_url = urljoin(base_url, href)
             parsed = urlparse(full_url)
             clean_url = parsed._replace(fragment="").geturl()
             if clean_url.startswith('http'):
-                links.add(clean_url)
-                
+                links.add(canonicalize_url(clean_url))
+
+        metrics.PARSE_SECONDS.observe(time.perf_counter() - start)
         return {
             'title': title,
             'text': cleaned_text,
             'links': list(links),
-            'content': str(soup) # Store full HTML if needed
+            'content': html if config.STORE_RAW_HTML else None # compressed by Database
         }
+
+    @staticmethod
+    def _extract_soup(html):
+        soup = BeautifulSoup(html, 'html.parser')
+        title = soup.title.string if soup.title else "No Title"
+        for script in soup(["script", "style"]):
+            script.extract()
+        hrefs = [link['href'] for link in soup.find_all('a', href=True)]
+        return title, soup.get_text(), hrefs
+
+    @staticmethod
+    def _extract_streaming(html):
+        target = _ExtractTarget()
+        parser = etree.HTMLParser(target=target)
+        parser.feed(html)
+        parser.close()
+        if target.title is None:
+            title = "No Title"
+        else:
+            title = ''.join(target.title) or None # as soup.title.string
+        return title, ''.join(target.text), target.hrefs
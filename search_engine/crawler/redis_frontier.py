@@ -0,0 +1,233 @@
+import random
+import time
+import uuid
+import logging
+from urllib.parse import urlparse
+from .canonical import canonicalize_url
+from .. import config
+try:
+    import redis
+except ImportError:  # only needed for FRONTIER_BACKEND = "redis"
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class RedisFrontier:
+    """
+    URL frontier shared by crawlers on any number of machines through
+    Redis. Keys, all under REDIS_FRONTIER_PREFIX:
+
+      seen          set of every URL ever queued; SADD is the dedup check
+      q:<host>      sorted set of a host's pending URLs, by depth (or by
+                    in-links, with FRONTIER_PRIORITY = "inlinks")
+      hosts         sorted set of hosts with pending URLs, by when they
+                    may next be fetched
+      lock:<host>   held for a host's politeness delay by whichever
+                    worker fetches it; its TTL spaces request starts to
+                    the host across the whole cluster
+      delay         hash of per-host delays longer than HOST_MIN_DELAY
+                    (robots.txt Crawl-delay)
+      leases        sorted set of "<claimant> <url>" for claimed URLs, by
+                    lease expiry; the claimant id tells a late task_done()
+                    for an expired lease from the current one
+      depth         hash of the depth of pending and claimed URLs
+      pending       count of pending URLs
+
+    A claimed URL moves from its host queue to leases in one transaction
+    and leaves leases on task_done(). Leases that expire, because their
+    worker died or hung, are handed out again. Only commands that fakeredis
+    supports are used (no Lua), so the backend can be exercised against an
+    in-process fake as well as a real server. Depth order is kept per host;
+    across hosts URLs come out in politeness order.
+    """
+    def __init__(self, url=None, prefix=None, priority=None, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("FRONTIER_BACKEND 'redis' needs the redis package")
+            client = redis.Redis.from_url(url or config.REDIS_URL, decode_responses=True)
+        self.redis = client
+        self.prefix = prefix or config.REDIS_FRONTIER_PREFIX
+        self.priority = priority or config.FRONTIER_PRIORITY
+        self.lease_timeout = config.FRONTIER_LEASE_TIMEOUT
+        self.delays = {}  # host -> delay last written to the delay hash
+        self.claimant = uuid.uuid4().hex
+        self.leases = {}  # url -> leases member, for URLs this instance claimed
+        self._reclaimed_at = 0.0
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix, *parts))
+
+    def _score(self, depth, priority=0.0):
+        # Lower scores pop first; depth is kept in the fraction for "inlinks"
+        if self.priority == "inlinks":
+            return depth / 1000 - priority
+        return depth
+
+    @staticmethod
+    def _decode(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def add_url(self, url, depth=0, priority=0.0):
+        return bool(self.add_urls([url], depth, priority))
+
+    def add_urls(self, urls, depth=0, priority=0.0):
+        """
+        Queues the URLs not seen before, in two round trips whatever their
+        number; returns the ones that were queued.
+        """
+        if depth > config.MAX_DEPTH:
+            return []
+        urls = list(dict.fromkeys(canonicalize_url(url) for url in urls))
+        if not urls:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for url in urls:
+            pipe.sadd(self._key('seen'), url)
+        added = [url for url, new in zip(urls, pipe.execute()) if new]
+
+        pipe = self.redis.pipeline(transaction=False)
+        for url in added:
+            self._enqueue(pipe, url, depth, priority)
+        if self.priority == "inlinks":
+            # Every rediscovery is another in-link: a cheap PageRank estimate
+            for url in set(urls) - set(added):
+                pipe.zadd(self._key('q', urlparse(url).netloc), {url: -1}, xx=True, incr=True)
+        if added:
+            pipe.incrby(self._key('pending'), len(added))
+        pipe.execute()
+        return added
+
+    def _enqueue(self, pipe, url, depth, priority=0.0):
+        host = urlparse(url).netloc
+        pipe.zadd(self._key('q', host), {url: self._score(depth, priority)})
+        pipe.hset(self._key('depth'), url, depth)
+        pipe.zadd(self._key('hosts'), {host: 0}, nx=True)
+
+    def requeue(self, url, depth=0):
+        """Queue a URL again even if it was seen before, for re-crawls."""
+        url = canonicalize_url(url)
+        host = urlparse(url).netloc
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sadd(self._key('seen'), url)
+        pipe.zadd(self._key('q', host), {url: self._score(depth)}, nx=True)
+        pipe.hset(self._key('depth'), url, depth)
+        pipe.zadd(self._key('hosts'), {host: 0}, nx=True)
+        _, queued, _, _ = pipe.execute()
+        if queued:
+            self.redis.incr(self._key('pending'))
+
+    def set_host_delay(self, host, delay):
+        """A longer politeness delay for host, such as its Crawl-delay, for every worker."""
+        if delay and self.delays.get(host) != delay:
+            self.delays[host] = delay
+            self.redis.hset(self._key('delay'), host, delay)
+
+    def get_url_nowait(self):
+        now = time.time()
+        if now - self._reclaimed_at >= config.FRONTIER_RECLAIM_INTERVAL:
+            self._reclaimed_at = now
+            self.reclaim_expired()
+
+        candidates = self.redis.zrangebyscore(self._key('hosts'), '-inf', now, start=0,
+                                              num=config.REDIS_FRONTIER_CANDIDATES)
+        if not candidates:
+            return None
+        random.shuffle(candidates)  # spread workers over the hosts that are due
+        delays = self.redis.hmget(self._key('delay'), candidates)
+        for host, delay in zip(map(self._decode, candidates), delays):
+            delay = max(config.HOST_MIN_DELAY, float(delay) if delay else 0.0)
+            if delay > 0 and not self.redis.set(self._key('lock', host), 1, nx=True, px=int(delay * 1000)):
+                continue  # fetched elsewhere within its delay
+            url = self._claim(host, now + delay)
+            if url:
+                return url
+        return None
+
+    def _claim(self, host, next_fetch):
+        """
+        Moves the host's first URL to leases; None if it has none left, in
+        which case the host is dropped from hosts. Both happen under a WATCH
+        of the host queue, so a URL added meanwhile makes the attempt start
+        over rather than be stranded.
+        """
+        queue = self._key('q', host)
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(queue)
+                    first = pipe.zrange(queue, 0, 0)
+                    if not first:
+                        pipe.multi()
+                        pipe.zrem(self._key('hosts'), host)
+                        pipe.execute()
+                        break
+                    url = self._decode(first[0])
+                    lease = f"{self.claimant} {url}"
+                    pipe.multi()
+                    pipe.zrem(queue, url)
+                    pipe.zadd(self._key('leases'), {lease: time.time() + self.lease_timeout})
+                    pipe.zadd(self._key('hosts'), {host: next_fetch}, xx=True)
+                    pipe.decr(self._key('pending'))
+                    pipe.execute()
+                    self.leases[url] = lease
+                    return url
+                except redis.WatchError:
+                    continue
+        return None
+
+    def reclaim_expired(self):
+        """Puts URLs whose lease ran out back in their host queues; returns how many."""
+        expired = self.redis.zrangebyscore(self._key('leases'), '-inf', time.time(), start=0, num=1000)
+        if not expired:
+            return 0
+        urls = [self._decode(lease).split(' ', 1)[1] for lease in expired]
+        pipe = self.redis.pipeline(transaction=False)
+        for lease, url in zip(expired, urls):
+            pipe.zrem(self._key('leases'), lease)
+            pipe.hget(self._key('depth'), url)
+        results = pipe.execute()
+        pipe = self.redis.pipeline(transaction=False)
+        reclaimed = 0
+        for url, removed, depth in zip(urls, results[::2], results[1::2]):
+            if removed:  # another worker may be reclaiming the same lease
+                self._enqueue(pipe, url, int(depth or 0))
+                reclaimed += 1
+        if reclaimed:
+            pipe.incrby(self._key('pending'), reclaimed)
+            pipe.execute()
+            logger.warning(f"Re-queued {reclaimed} URLs whose lease expired")
+        return reclaimed
+
+    def get_url(self):
+        deadline = time.monotonic() + 1 # Same 1s wait as URLQueue
+        while True:
+            url = self.get_url_nowait()
+            if url or time.monotonic() >= deadline:
+                return url
+            time.sleep(0.05)
+
+    def get_depth(self, url):
+        depth = self.redis.hget(self._key('depth'), url)
+        return int(depth) if depth is not None else 0
+
+    def task_done(self, url=None):
+        lease = self.leases.pop(url, None) if url is not None else None
+        if lease is None:
+            return
+        # Only the lease holder clears the depth; if the lease expired and
+        # the URL was re-queued, the new claim still needs it
+        if self.redis.zrem(self._key('leases'), lease):
+            self.redis.hdel(self._key('depth'), url)
+
+    def size(self):
+        return max(0, int(self.redis.get(self._key('pending')) or 0))
+
+    def empty(self):
+        return self.size() == 0
+
+    def is_visited(self, url):
+        return bool(self.redis.sismember(self._key('seen'), canonicalize_url(url)))
+
+    def close(self):
+        self.redis.close()
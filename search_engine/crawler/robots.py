@@ -0,0 +1,148 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from urllib.robotparser import RobotFileParser
+from urllib.parse import urlparse
+import requests
+from ..storage.database import Database
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+class RobotsEntry:
+    """Parsed robots.txt of one host and when it has to be fetched again."""
+    def __init__(self, status, body, expires_at):
+        self.status = status
+        self.expires_at = expires_at
+        self.parser = RobotFileParser()
+        if status is None or status >= 500:
+            # Unreachable or broken: crawl as before, but remember the failure
+            self.parser.allow_all = True
+        elif status in (401, 403):
+            self.parser.disallow_all = True
+        elif status >= 400:
+            self.parser.allow_all = True
+        else:
+            self.parser.parse(body.splitlines())
+        self.parser.modified()
+        delay = self.parser.crawl_delay(config.USER_AGENT)
+        self.crawl_delay = min(float(delay), config.ROBOTS_MAX_CRAWL_DELAY) if delay else None
+
+    def can_fetch(self, url):
+        return self.parser.can_fetch(config.USER_AGENT, url)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+
+class RobotsCache:
+    """
+    robots.txt per host, shared by all crawler workers. Entries live in a
+    bounded LRU and expire after ROBOTS_TTL (ROBOTS_ERROR_TTL for hosts
+    whose robots.txt could not be fetched), and are persisted so a restarted
+    crawler doesn't fetch them again. Concurrent misses for one host wait on
+    a single fetch.
+    """
+    def __init__(self, session=None, max_entries=None):
+        self.session = session or requests.Session()
+        self.max_entries = config.ROBOTS_CACHE_SIZE if max_entries is None else max_entries
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.db = Database()
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    @staticmethod
+    def host_key(url):
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}"
+
+    def cached(self, host):
+        """The in-memory entry for host if it hasn't expired, else None."""
+        with self.lock:
+            entry = self.entries.get(host)
+            if entry is None or entry.expires_at <= time.time():
+                return None
+            self.entries.move_to_end(host)
+            self.hits += 1
+            return entry
+
+    def load(self, host):
+        """Entry persisted by an earlier run, if still valid."""
+        row = self.db.get_robots(host)
+        if row is None or row['expires_at'] <= time.time():
+            return None
+        entry = RobotsEntry(row['status'], row['body'], row['expires_at'])
+        self._remember(host, entry)
+        return entry
+
+    def store(self, host, status, body):
+        """Cache and persist a robots.txt response; status None means the fetch failed."""
+        ttl = config.ROBOTS_ERROR_TTL if status is None or status >= 500 else config.ROBOTS_TTL
+        entry = RobotsEntry(status, body or '', time.time() + ttl)
+        self._remember(host, entry)
+        self.db.save_robots(host, status, body, entry.expires_at)
+        return entry
+
+    def _remember(self, host, entry):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[host] = entry
+            self.entries.move_to_end(host)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, host):
+        entry = self.cached(host)
+        if entry:
+            return entry
+
+        with self.lock:
+            flight = self.inflight.get(host)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[host] = _Flight()
+                self.misses += 1
+        if not leader:
+            flight.done.wait()
+            # No entry means the leader's fetch raised; try again ourselves
+            return flight.entry or self.get(host)
+
+        try:
+            flight.entry = self.load(host) or self._fetch(host)
+        finally:
+            with self.lock:
+                del self.inflight[host]
+            flight.done.set()
+        return flight.entry
+
+    def _fetch(self, host):
+        with self.lock:
+            self.fetches += 1
+        status, body = None, ''
+        try:
+            response = self.session.get(f"{host}/robots.txt", timeout=config.ROBOTS_TIMEOUT)
+            status = response.status_code
+            if status == 200:
+                body = response.text
+        except requests.RequestException as e:
+            logger.warning(f"Could not read robots.txt for {host}: {e}")
+        return self.store(host, status, body)
+
+    def can_fetch(self, url):
+        return self.get(self.host_key(url)).can_fetch(url)
+
+    def crawl_delay(self, url):
+        return self.get(self.host_key(url)).crawl_delay
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits,
+                    'misses': self.misses, 'fetches': self.fetches}
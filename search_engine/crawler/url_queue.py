@@ -1,28 +1,63 @@
 import queue
 import threading
 from urllib.parse import urlparse
+from .canonical import canonicalize_url
+from .. import config
 
 class URLQueue:
     def __init__(self):
         self.queue = queue.Queue()
         self.visited_urls = set()
+        self.depths = {}  # depth of queued and in-progress urls
         self.lock = threading.Lock()
 
-    def add_url(self, url):
+    def add_url(self, url, depth=0, priority=0.0):
+        if depth > config.MAX_DEPTH:
+            return False
+        url = canonicalize_url(url)
         with self.lock:
             if url not in self.visited_urls:
                 self.visited_urls.add(url)
+                self.depths[url] = depth
                 self.queue.put(url)
                 return True
         return False
 
+    def add_urls(self, urls, depth=0, priority=0.0):
+        """add_url for each of urls; returns the ones that were queued."""
+        return [url for url in urls if self.add_url(url, depth, priority)]
+
+    def set_host_delay(self, host, delay):
+        pass  # one process: the fetch engines space requests to a host themselves
+
+    def requeue(self, url, depth=0):
+        """Queue a URL again even if it was seen before, for re-crawls."""
+        url = canonicalize_url(url)
+        with self.lock:
+            self.visited_urls.add(url)
+            self.depths[url] = depth
+            self.queue.put(url)
+
     def get_url(self):
         try:
             return self.queue.get(timeout=1) # Non-blocking with timeout
         except queue.Empty:
             return None
 
-    def task_done(self):
+    def get_url_nowait(self):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def get_depth(self, url):
+        with self.lock:
+            return self.depths.get(url, 0)
+
+    def task_done(self, url=None):
+        if url is not None:
+            with self.lock:
+                self.depths.pop(url, None)
         self.queue.task_done()
 
     def size(self):
@@ -32,5 +67,9 @@ class URLQueue:
         return self.queue.empty()
 
     def is_visited(self, url):
+        url = canonicalize_url(url)
         with self.lock:
             return url in self.visited_urls
+
+    def close(self):
+        pass
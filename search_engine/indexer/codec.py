@@ -0,0 +1,52 @@
+import numpy as np
+
+def encode_varints(values):
+    """LEB128-style varints: 7 bits per byte, high bit set on all but the last."""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+def decode_varints(buf):
+    """Decode a buffer of varints into a uint64 array, vectorized."""
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # Bit shift of every byte within its own varint
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(data)) - starts[group]) * 7
+    payload = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(payload, starts)
+
+def encode_deltas(sorted_values):
+    """Varint-encode the gaps of an ascending sequence."""
+    previous = 0
+    gaps = []
+    for value in sorted_values:
+        gaps.append(value - previous)
+        previous = value
+    return encode_varints(gaps)
+
+def decode_deltas(buf):
+    return np.cumsum(decode_varints(buf), dtype=np.uint64)
+
+def decode_delta_list(buf):
+    """decode_deltas as a plain list; quicker than numpy for short blobs like one document's positions."""
+    values = []
+    total = value = shift = 0
+    for byte in buf:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            total += value
+            values.append(total)
+            value = shift = 0
+    return values
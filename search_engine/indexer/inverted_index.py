@@ -1,30 +1,130 @@
-from ..storage.database import Database
+from ..storage.database import Database, document_hash
 from .text_processor import TextProcessor
-from collections import Counter
+from .codec import encode_deltas
+from .segments import SegmentedIndex
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import time
+from .. import config, metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
+_worker_processor = None
+
+def _tokenize_page(processor, page_id, title, text, text_hash, positional):
+    """
+    (id, hash, body Counter, title Counter, positions) as replace_keywords
+    takes them; positions maps each body word to delta-encoded blobs of its
+    word positions and character offsets, or is empty if not positional.
+    """
+    tokens = processor.tokenize(text)
+    positions = {}
+    if positional:
+        occurrences = defaultdict(lambda: ([], []))
+        for token, position, offset in tokens:
+            occurrences[token][0].append(position)
+            occurrences[token][1].append(offset)
+        positions = {word: (encode_deltas(word_positions), encode_deltas(offsets))
+                     for word, (word_positions, offsets) in occurrences.items()}
+    title_freqs = Counter(processor.process_text(title))
+    if positional:
+        for word in title_freqs.keys() - positions.keys():
+            positions[word] = (b'', b'')  # title only: no body positions, but not unknown either
+    return (page_id, text_hash or document_hash(title, text), Counter(token for token, _, _ in tokens),
+            title_freqs, positions)
+
+def _tokenize_batch(pages, positional):
+    """Runs in a pool process: (id, title, text, hash) tuples -> replace_keywords docs."""
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = TextProcessor()
+    return [_tokenize_page(_worker_processor, *page, positional) for page in pages]
+
 class InvertedIndex:
     def __init__(self):
         self.db = Database()
         self.processor = TextProcessor()
+        self.segments = SegmentedIndex() if config.INDEX_BACKEND == "segments" else None
 
-    def build_index(self):
+    def build_index(self, full=False, workers=None):
+        """
+        Indexes pages that are new or whose text changed since the last
+        build; full=True re-tokenizes every page. With more than one worker,
+        tokenization runs in a process pool and this thread only writes.
+        """
         logger.info("Building inverted index...")
-        pages = self.db.get_all_pages()
-        for page in pages:
-            self._index_page(page['id'], page['url']) # pass url if needed to fetch content again?
-            
-    def _index_page(self, page_id, url):
-        
-        with self.db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT cleaned_text FROM pages WHERE id = ?', (page_id,))
-            row = cursor.fetchone()
-            if row and row['cleaned_text']:
-                tokens = self.processor.process_text(row['cleaned_text'])
-                word_freqs = Counter(tokens)
-                self.db.save_keywords(page_id, word_freqs)
-            else:
-                 logger.warning(f"No content for page {page_id}")
+        start = time.perf_counter()
+        workers = workers or config.INDEX_WORKERS
+        if self.segments:
+            # Pages were marked indexed by whichever backend built them last
+            full = full or self.segments.is_empty()
+            lost = self.db.get_lost_pages()
+        batches = self.db.iter_pages_to_index(config.INDEX_BATCH_SIZE, full)
+        tokenized = self._tokenize(batches, workers)
+        if self.segments:
+            indexed = self._build_segments(tokenized, lost)
+        else:
+            indexed = 0
+            for docs in tokenized:
+                self.db.replace_keywords(docs)
+                indexed += len(docs)
+                metrics.INDEX_DOCS.inc(len(docs))
+        elapsed = time.perf_counter() - start
+        metrics.INDEX_BUILD_SECONDS.set(elapsed)
+        metrics.INDEX_DOCS_PER_SECOND.set(indexed / elapsed if elapsed else 0.0)
+        logger.info(f"Indexed {indexed} new or changed pages in {elapsed:.1f}s.")
+        return indexed
+
+    def _tokenize(self, batches, workers):
+        """Yields replace_keywords docs for each batch of pages, in order."""
+        if workers <= 1:
+            for pages in batches:
+                yield [self._index_page(page) for page in pages]
+            return
+
+        pending = deque()
+        # spawn, not fork: the API process has other threads running
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            for pages in batches:
+                rows = [(page['id'], page['title'], page['cleaned_text'], page['content_hash']) for page in pages]
+                pending.append(pool.submit(_tokenize_batch, rows, config.INDEX_POSITIONS))
+                # Keep a couple of batches per worker in flight, no more
+                while len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _build_segments(self, tokenized, lost):
+        """
+        Writes tokenized docs out as segments of SEGMENT_FLUSH_DOCS and
+        publishes them all at once, so searches see the whole build or
+        none of it. Pages are only marked indexed once it is published.
+        """
+        names, indexed, buffered = [], [], []
+        def flush():
+            name = self.segments.write_segment(buffered)
+            if name:
+                names.append(name)
+            for doc_id, text_hash, word_freqs, title_freqs, _ in buffered:
+                if word_freqs or title_freqs:
+                    indexed.append((doc_id, text_hash, sum(word_freqs.values()), sum(title_freqs.values())))
+                else:
+                    indexed.append((doc_id, text_hash, None, None))
+            buffered.clear()
+
+        for docs in tokenized:
+            buffered.extend(docs)
+            if len(buffered) >= config.SEGMENT_FLUSH_DOCS:
+                flush()
+        flush()
+        self.segments.commit(names, deleted=[row[0] for row in indexed] + lost)
+        self.db.mark_indexed(indexed)
+        metrics.INDEX_DOCS.inc(len(indexed))
+        return len(indexed)
+
+    def _index_page(self, page):
+        return _tokenize_page(self.processor, page['id'], page['title'], page['cleaned_text'],
+                              page['content_hash'], config.INDEX_POSITIONS)
@@ -0,0 +1,429 @@
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+import logging
+from itertools import groupby
+from operator import itemgetter
+import numpy as np
+from .codec import encode_deltas, encode_varints, decode_varints
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PIDX"
+VERSION = 3
+_PREAMBLE = struct.Struct("<4sII")  # magic, version, header length
+PAGE_FIELDS = ('url', 'title', 'cleaned_text')
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _position_lists(rows):
+    """Positions and offsets blobs of keywords rows, or (None, None) if any row lacks them."""
+    if any(row[4] is None for row in rows):
+        return None, None
+    return [row[4] for row in rows], [row[5] for row in rows]
+
+
+def _page_sections(pages):
+    """
+    Sections for (page_id, url, title, cleaned_text) rows in id order:
+    the ids, and per field a blob with its offsets. Texts are compressed
+    one by one, so a lookup only inflates the pages it returns.
+    """
+    ids = []
+    blobs = {field: bytearray() for field in PAGE_FIELDS}
+    offsets = {field: [0] for field in PAGE_FIELDS}
+    for page_id, *values in pages:
+        ids.append(page_id)
+        for field, value in zip(PAGE_FIELDS, values):
+            encoded = (value or '').encode('utf-8')
+            blobs[field].extend(zlib.compress(encoded) if field == 'cleaned_text' else encoded)
+            offsets[field].append(len(blobs[field]))
+    sections = [('page_ids', np.array(ids, dtype='<i8').tobytes())]
+    for field in PAGE_FIELDS:
+        sections.append((f'page_{field}_offsets', np.array(offsets[field], dtype='<u8').tobytes()))
+        sections.append((f'page_{field}', bytes(blobs[field])))
+    return sections
+
+
+class _TermBounds:
+    """
+    Per-term score bounds for a snapshot, in term order: the largest body
+    frequency, body frequency over body length, title frequency and title
+    frequency over title length of any posting. Postings are gathered and
+    reduced a chunk at a time, so memory stays flat however large the
+    index.
+    """
+    CHUNK = 1 << 18  # postings
+
+    def __init__(self, docs):
+        self.doc_ids = np.array([row[0] for row in docs], dtype=np.int64)
+        self.lengths = np.array([[row[2] or 0, row[3] or 0] for row in docs], dtype=np.float64).reshape(-1, 2)
+        self.starts, self.ids, self.tfs, self.title_tfs = [], [], [], []
+        self.bounds = []
+
+    def add(self, doc_ids, tfs, title_tfs):
+        self.starts.append(len(self.ids))
+        self.ids.extend(doc_ids)
+        self.tfs.extend(tfs)
+        self.title_tfs.extend(title_tfs)
+        if len(self.ids) >= self.CHUNK:
+            self.flush()
+
+    def flush(self):
+        if not self.starts:
+            return
+        ids = np.array(self.ids, dtype=np.int64)
+        lengths = np.zeros((len(ids), 2))
+        if len(self.doc_ids):
+            positions = np.minimum(np.searchsorted(self.doc_ids, ids), len(self.doc_ids) - 1)
+            found = self.doc_ids[positions] == ids
+            lengths[found] = self.lengths[positions[found]]
+        starts = np.array(self.starts)
+        columns = []
+        for field, freqs in enumerate((self.tfs, self.title_tfs)):
+            freqs = np.array(freqs, dtype=np.float64)
+            ratios = np.divide(freqs, lengths[:, field], out=np.zeros_like(freqs), where=lengths[:, field] > 0)
+            columns.extend((np.maximum.reduceat(freqs, starts), np.maximum.reduceat(ratios, starts)))
+        self.bounds.append(np.column_stack(columns))
+        self.starts, self.ids, self.tfs, self.title_tfs = [], [], [], []
+
+    def finish(self):
+        self.flush()
+        return np.concatenate(self.bounds) if self.bounds else np.zeros((0, 4))
+
+
+class PostingIndex:
+    """
+    Read-only in-memory index loaded from a snapshot file. The snapshot
+    holds a sorted term dictionary, per-term posting blocks (delta-encoded
+    doc ids followed by body and title term frequencies, all varints), the
+    positions and offsets blobs of every posting, a doc table of
+    PageRank scores and field lengths, and per-term score bounds for
+    top-k pruning (absent from snapshots written before them, which are
+    then always scored in full). Exported snapshots also carry every
+    page's url, title and text, so a replica can serve results without a
+    database. Everything is memory-mapped, so uvicorn workers that load
+    the same file share its pages. The header keeps a CRC-32 of every
+    section for verify().
+
+    Implements the same get_collection_stats()/get_postings()/
+    get_term_bounds()/get_positions()/get_vocabulary() calls as Database,
+    and get_pages() when it has pages, so Ranker can score against either.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = _PREAMBLE.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} posting index snapshot")
+        self.header = json.loads(self.mm[_PREAMBLE.size:_PREAMBLE.size + header_len])
+        sections = self.header['sections']
+
+        def view(name, dtype):
+            offset, length = sections[name]
+            return np.frombuffer(self.mm, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+        self.term_offsets = view('term_offsets', '<u8')
+        self.terms = view('terms', np.uint8)
+        self.posting_offsets = view('posting_offsets', '<u8')
+        self.posting_starts = view('posting_starts', '<u8')
+        self.dfs = view('dfs', '<u4')
+        self.doc_ids = view('doc_ids', '<i8')
+        self.pageranks = view('pageranks', '<f8')
+        self.doc_lengths = view('doc_lengths', '<u4')
+        self.title_lengths = view('title_lengths', '<u4')
+        self.postings_blob = view('postings', np.uint8)
+        self.position_bounds = view('position_bounds', '<u8')
+        self.positions_blob = view('positions', np.uint8)
+        self.term_bounds = view('term_bounds', '<f8').reshape(-1, 4) if 'term_bounds' in sections else None
+        self.has_pages = 'page_ids' in sections
+        if self.has_pages:
+            self.page_ids = view('page_ids', '<i8')
+            self.page_fields = {field: (view(f'page_{field}_offsets', '<u8'), view(f'page_{field}', np.uint8))
+                                for field in PAGE_FIELDS}
+        self.positional = self.header['positional']
+        self.num_terms = len(self.dfs)
+        self.max_pagerank = float(self.pageranks.max()) if len(self.pageranks) else 0.0
+
+    @classmethod
+    def build(cls, db, path, pages=None, header=None):
+        """
+        Write a snapshot of the keywords table to path, atomically; pages
+        and header as for write(). Everything is read in one transaction,
+        so a commit meanwhile can't leave it half old, half new.
+        """
+        with db.read_transaction() as conn:
+            stats = db.get_collection_stats()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, pagerank, doc_length, title_length FROM pages
+                WHERE indexed_hash IS NOT NULL ORDER BY id
+            ''')
+            docs = cursor.fetchall()
+            # The (word, doc_id) primary key already yields this order
+            cursor.execute('''
+                SELECT word, doc_id, term_frequency, title_frequency, positions, offsets
+                FROM keywords ORDER BY word, doc_id
+            ''')
+            def terms():
+                for word, rows in groupby(cursor, key=itemgetter(0)):
+                    rows = list(rows)
+                    yield (word, [row[1] for row in rows], [row[2] for row in rows],
+                           [row[3] or 0 for row in rows], *_position_lists(rows))
+            cls.write(path, stats, terms(), docs, pages, header)
+
+    @classmethod
+    def write(cls, path, stats, terms, docs, pages=None, header=None):
+        """
+        Write a snapshot to path, atomically. terms yields (word, doc_ids,
+        term_frequencies, title_frequencies, positions, offsets) in word
+        order, the last two being lists of per-document blobs, or None if
+        the word's positions weren't stored; docs are (doc_id, pagerank,
+        doc_length, title_length) rows in doc id order; stats is a
+        collection_stats dict. Positions are kept only if every word has them.
+        pages optionally yields (page_id, url, title, cleaned_text) rows in
+        id order to store as well; header holds extra header fields.
+        """
+        terms_blob = bytearray()
+        term_offsets = [0]
+        postings = bytearray()
+        posting_offsets = [0]
+        posting_starts = [0]
+        dfs = []
+        positions = bytearray()
+        position_bounds = [0]
+        positional = True
+
+        bounds = _TermBounds(docs)
+
+        for word, doc_ids, tfs, title_tfs, word_positions, word_offsets in terms:
+            bounds.add(doc_ids, tfs, title_tfs)
+            terms_blob.extend(word.encode('utf-8'))
+            term_offsets.append(len(terms_blob))
+            postings.extend(encode_deltas(doc_ids))
+            postings.extend(encode_varints(tfs))
+            postings.extend(encode_varints(title_tfs))
+            posting_offsets.append(len(postings))
+            dfs.append(len(doc_ids))
+            posting_starts.append(posting_starts[-1] + len(doc_ids))
+            positional = positional and word_positions is not None
+            if positional:
+                for blobs in zip(word_positions, word_offsets):
+                    for blob in blobs:
+                        positions.extend(blob)
+                        position_bounds.append(len(positions))
+        if not positional:
+            positions, position_bounds = bytearray(), [0]
+
+        sections = [
+            ('term_offsets', np.array(term_offsets, dtype='<u8').tobytes()),
+            ('terms', bytes(terms_blob)),
+            ('posting_offsets', np.array(posting_offsets, dtype='<u8').tobytes()),
+            ('posting_starts', np.array(posting_starts, dtype='<u8').tobytes()),
+            ('dfs', np.array(dfs, dtype='<u4').tobytes()),
+            ('doc_ids', np.array([row[0] for row in docs], dtype='<i8').tobytes()),
+            ('pageranks', np.array([row[1] or 0.0 for row in docs], dtype='<f8').tobytes()),
+            ('doc_lengths', np.array([row[2] or 0 for row in docs], dtype='<u4').tobytes()),
+            ('title_lengths', np.array([row[3] or 0 for row in docs], dtype='<u4').tobytes()),
+            ('postings', bytes(postings)),
+            ('position_bounds', np.array(position_bounds, dtype='<u8').tobytes()),
+            ('positions', bytes(positions)),
+            ('term_bounds', bounds.finish().astype('<f8').tobytes()),
+        ]
+        if pages is not None:
+            sections.extend(_page_sections(pages))
+        cls._write(path, {**(header or {}),
+                          'num_docs': stats.get('num_docs', 0),
+                          'num_tokens': stats.get('num_terms', 0),
+                          'num_title_tokens': stats.get('num_title_terms', 0),
+                          'positional': positional}, sections)
+        logger.info(f"Wrote posting index snapshot: {len(dfs)} terms, {len(postings)} posting bytes")
+
+    @staticmethod
+    def _write(path, header, sections):
+        # Reserve header space first: section offsets depend on its length
+        layout = {}
+        checksums = {name: zlib.crc32(payload) for name, payload in sections}
+        header = {**header, 'created_at': time.time(), 'checksums': checksums}
+        header_len = 4096
+        while True:
+            offset = _align(_PREAMBLE.size + header_len)
+            for name, payload in sections:
+                layout[name] = [offset, len(payload)]
+                offset = _align(offset + len(payload))
+            encoded = json.dumps({**header, 'sections': layout}).encode('utf-8')
+            if len(encoded) <= header_len:
+                break
+            header_len *= 2
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_PREAMBLE.pack(MAGIC, VERSION, header_len))
+            f.write(encoded.ljust(header_len, b' '))
+            for name, payload in sections:
+                f.seek(layout[name][0])
+                f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def is_stale(self):
+        """True once the snapshot file has been replaced by a newer build."""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (current.st_ino, current.st_mtime_ns) != (self.stat.st_ino, self.stat.st_mtime_ns)
+
+    def verify(self):
+        """Raise ValueError unless every section matches the checksum written with it."""
+        checksums = self.header.get('checksums')
+        if checksums is None:
+            raise ValueError(f"{self.path} was written without checksums")
+        with memoryview(self.mm) as buffer:
+            for name, (offset, length) in self.header['sections'].items():
+                if zlib.crc32(buffer[offset:offset + length]) != checksums.get(name):
+                    raise ValueError(f"{self.path}: section {name} is corrupt")
+
+    def _term_index(self, word):
+        target = word.encode('utf-8')
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            term = self.terms[self.term_offsets[mid]:self.term_offsets[mid + 1]].tobytes()
+            if term < target:
+                lo = mid + 1
+            elif term > target:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def postings(self, word):
+        """(doc_ids, term_frequencies, title_frequencies) arrays for word; empty if unknown."""
+        i = self._term_index(word)
+        if i is None:
+            empty = np.zeros(0, dtype=np.uint64)
+            return np.zeros(0, dtype=np.int64), empty, empty
+        return self.term_postings(i)
+
+    def term_postings(self, i):
+        """postings() of the i-th term in the dictionary."""
+        values = decode_varints(self.postings_blob[self.posting_offsets[i]:self.posting_offsets[i + 1]])
+        df = int(self.dfs[i])
+        return np.cumsum(values[:df]).astype(np.int64), values[df:2 * df], values[2 * df:]
+
+    def term_positions(self, i, indices):
+        """(positions, offsets) blobs of the i-th term's postings at indices."""
+        base = int(self.posting_starts[i])
+        bounds, blob = self.position_bounds, self.positions_blob
+        blobs = []
+        for index in indices:
+            k = 2 * (base + index)
+            blobs.append((blob[bounds[k]:bounds[k + 1]].tobytes(), blob[bounds[k + 1]:bounds[k + 2]].tobytes()))
+        return blobs
+
+    def iter_terms(self):
+        """The dictionary's words, in order."""
+        offsets = self.term_offsets.tolist()
+        terms = self.terms.tobytes()
+        for i in range(self.num_terms):
+            yield terms[offsets[i]:offsets[i + 1]].decode('utf-8')
+
+    def get_vocabulary(self):
+        """Shaped like Database.get_vocabulary."""
+        return zip(self.iter_terms(), self.dfs.tolist())
+
+    def doc_table(self, doc_ids):
+        """PageRank, body length and title length of each doc id."""
+        if not len(self.doc_ids):
+            zeros = np.zeros(len(doc_ids))
+            return zeros, zeros, zeros
+        positions = np.minimum(np.searchsorted(self.doc_ids, doc_ids), len(self.doc_ids) - 1)
+        found = self.doc_ids[positions] == doc_ids
+        return (np.where(found, self.pageranks[positions], 0.0),
+                np.where(found, self.doc_lengths[positions], 0),
+                np.where(found, self.title_lengths[positions], 0))
+
+    def get_collection_stats(self):
+        return {'num_docs': self.header['num_docs'], 'num_terms': self.header['num_tokens'],
+                'num_title_terms': self.header['num_title_tokens'], 'max_pagerank': self.max_pagerank}
+
+    def get_postings(self, words, doc_ids=None):
+        """Rows shaped like Database.get_postings, only those of doc_ids if given."""
+        wanted = None if doc_ids is None else np.fromiter(doc_ids, dtype=np.int64)
+        rows = []
+        for word in words:
+            term_doc_ids, tfs, title_tfs = self.postings(word)
+            df = len(term_doc_ids)
+            if wanted is not None and df:
+                kept = np.isin(term_doc_ids, wanted)
+                term_doc_ids, tfs, title_tfs = term_doc_ids[kept], tfs[kept], title_tfs[kept]
+            if not len(term_doc_ids):
+                continue
+            rows.extend(self.posting_rows(word, df, term_doc_ids, tfs, title_tfs, *self.doc_table(term_doc_ids)))
+        return rows
+
+    def get_term_bounds(self, words):
+        """Shaped like Database.get_term_bounds; None if the snapshot has no bounds."""
+        if self.term_bounds is None:
+            return None
+        bounds = {}
+        for word in words:
+            i = self._term_index(word)
+            if i is not None:
+                bounds[word] = (int(self.dfs[i]), *self.term_bounds[i].tolist())
+        return bounds
+
+    def get_pages(self, page_ids):
+        """
+        Shaped like Database.get_pages, from a snapshot exported with its
+        pages; a page stored without a title comes back with None.
+        """
+        pages = {}
+        if not len(self.page_ids):
+            return pages
+        for page_id in page_ids:
+            i = int(np.searchsorted(self.page_ids, page_id))
+            if i == len(self.page_ids) or self.page_ids[i] != page_id:
+                continue
+            page = {'id': page_id}
+            for field, (offsets, blob) in self.page_fields.items():
+                value = blob[offsets[i]:offsets[i + 1]].tobytes()
+                page[field] = (zlib.decompress(value) if field == 'cleaned_text' else value).decode('utf-8')
+            page['title'] = page['title'] or None
+            pages[page_id] = page
+        return pages
+
+    @staticmethod
+    def posting_rows(word, df, doc_ids, tfs, title_tfs, pageranks, doc_lengths, title_lengths):
+        """Database.get_postings rows from per-document arrays."""
+        return [(word, doc_id, tf, title_tf, df, doc_length, title_length, pagerank)
+                for doc_id, tf, title_tf, doc_length, title_length, pagerank
+                in zip(doc_ids.tolist(), tfs.tolist(), title_tfs.tolist(),
+                       doc_lengths.tolist(), title_lengths.tolist(), pageranks.tolist())]
+
+    def get_positions(self, words, doc_ids):
+        """
+        Positions and offsets blobs shaped like Database.get_positions;
+        empty if the snapshot was built without positions.
+        """
+        positions = {}
+        if not self.positional or not words or not doc_ids:
+            return positions
+        wanted = np.fromiter(doc_ids, dtype=np.int64)
+        for word in words:
+            i = self._term_index(word)
+            if i is None:
+                continue
+            term_doc_ids = self.term_postings(i)[0]
+            indices = np.flatnonzero(np.isin(term_doc_ids, wanted)).tolist()
+            for index, blobs in zip(indices, self.term_positions(i, indices)):
+                positions[word, int(term_doc_ids[index])] = blobs
+        return positions
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from .. import config
+
+class QueryCache:
+    """
+    LRU cache of search results, or other lists of dicts or tuples, with
+    a TTL, bounded by entry count and an estimate of result size. Entries
+    belong to an index generation; bumping the generation after a
+    re-index drops everything cached before it.
+    """
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        self.max_entries = config.QUERY_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = max_bytes or config.QUERY_CACHE_MAX_BYTES
+        self.ttl = ttl or config.QUERY_CACHE_TTL
+        self.entries = OrderedDict()  # key -> (expires_at, size, results)
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, results, generation):
+        """generation: the value of self.generation when the search started."""
+        if self.max_entries <= 0:
+            return
+        size = self._estimate_size(key, results)
+        with self.lock:
+            # Results computed against an index that has since been replaced
+            if generation != self.generation or size > self.max_bytes:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, size, results)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def bump_generation(self):
+        with self.lock:
+            self.generation += 1
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.bytes = 0
+
+    def clear(self):
+        self.bump_generation()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'generation': self.generation,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    @staticmethod
+    def _estimate_size(key, results):
+        size = 200 + sum(len(str(part)) for part in key)
+        for result in results:
+            values = result.values() if isinstance(result, dict) else result
+            size += 150 + sum(len(value) for value in values if isinstance(value, str))
+        return size
@@ -1,74 +1,660 @@
 from math import log
-from collections import defaultdict
+from collections import defaultdict, Counter
+import base64
+import heapq
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import logging
 from ..storage.database import Database
+from .codec import decode_delta_list
 from .text_processor import TextProcessor
-from .. import config
+from .posting_index import PostingIndex
+from .segments import SegmentedIndex
+from .snapshot import open_snapshot
+from .query_cache import QueryCache
+from .. import config, metrics
+
+logger = logging.getLogger(__name__)
+
+RANKING_MODELS = ("bm25", "tfidf")
+PHRASE_PATTERN = re.compile(r'"([^"]+)"')
+SEARCH_STAGES = ("postings", "scoring", "phrases", "proximity", "snippets")
+BOUND_SLACK = 1e-9  # relative margin for rounding differences between score bounds and scores
+_stage_metrics = {stage: metrics.SEARCH_STAGE_SECONDS.labels(stage) for stage in SEARCH_STAGES}
+_search_metrics = {hit: metrics.SEARCH_SECONDS.labels("hit" if hit else "miss") for hit in (True, False)}
+
+def ranking_params(model=None, k1=None, b=None, title_boost=None, text_weight=None, pagerank_weight=None,
+                   proximity_weight=None):
+    """Scoring parameters for one search; anything not given comes from config."""
+    params = {
+        'model': model or config.RANKING_MODEL,
+        'k1': config.BM25_K1 if k1 is None else k1,
+        'b': config.BM25_B if b is None else b,
+        'title_boost': config.TITLE_BOOST if title_boost is None else title_boost,
+        'text_weight': config.TFIDF_WEIGHT if text_weight is None else text_weight,
+        'pagerank_weight': config.PAGERANK_WEIGHT if pagerank_weight is None else pagerank_weight,
+        'proximity_weight': config.PROXIMITY_WEIGHT if proximity_weight is None else proximity_weight,
+    }
+    if params['model'] not in RANKING_MODELS:
+        raise ValueError(f"model must be one of {', '.join(RANKING_MODELS)}")
+    if params['k1'] < 0 or not 0 <= params['b'] <= 1 or params['title_boost'] < 0:
+        raise ValueError("k1 and title_boost must be >= 0 and b between 0 and 1")
+    return params
+
+def encode_cursor(state):
+    """search_page()'s position in a search, as a URL-safe token."""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """The state encode_cursor() made cursor from, checked; ValueError if it isn't one."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        state['params'] = ranking_params(**state['params'])
+        first, offset = state['first'], state['offset']
+        if not (isinstance(state['query'], str) and isinstance(first, int) and isinstance(offset, int)
+                and 0 < first <= config.SEARCH_MAX_LIMIT and offset >= first
+                and (state['ranking'] is None or isinstance(state['ranking'], str))):
+            raise ValueError
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("invalid cursor") from None
+    return state
+
+
+class _SharedSource:
+    """
+    The source a batch of searches reads through. Collection statistics
+    and term bounds are read once for the batch, and the full postings
+    of words more than one of its queries has are kept after their first
+    read; reads limited to some documents, and everything else, go to
+    the source.
+    """
+    def __init__(self, source, shared_words):
+        self.source = source
+        self.shared_words = shared_words
+        self.has_pages = getattr(source, 'has_pages', False)
+        self.stats = source.get_collection_stats()
+        self.postings = {}  # word -> every posting row, for shared words read so far
+        self.bounds = {}  # word -> stored bounds, None for words without postings
+        self.bounded = True
+
+    def get_collection_stats(self):
+        return self.stats
+
+    def get_postings(self, words, doc_ids=None):
+        missing = [word for word in words if word not in self.postings]
+        fetched = defaultdict(list)
+        if missing:
+            for row in self.source.get_postings(missing, doc_ids):
+                fetched[row[0]].append(row)
+            if doc_ids is None:
+                self.postings.update((word, fetched[word]) for word in missing if word in self.shared_words)
+        wanted = None if doc_ids is None else set(doc_ids)
+        rows = []
+        for word in words:
+            if word not in self.postings:
+                rows.extend(fetched[word])
+            elif wanted is None:
+                rows.extend(self.postings[word])
+            else:
+                rows.extend(row for row in self.postings[word] if row[1] in wanted)
+        return rows
+
+    def get_term_bounds(self, words):
+        missing = [word for word in words if word not in self.bounds]
+        if missing and self.bounded:
+            stored = self.source.get_term_bounds(missing)
+            if stored is None:
+                self.bounded = False
+            else:
+                self.bounds.update((word, stored.get(word)) for word in missing)
+        if not self.bounded:
+            return None
+        return {word: self.bounds[word] for word in words if self.bounds[word] is not None}
+
+    def get_positions(self, words, doc_ids):
+        return self.source.get_positions(words, doc_ids)
+
+    def get_pages(self, page_ids):
+        return self.source.get_pages(page_ids)
+
 
 class Ranker:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, snapshot=None):
+        """snapshot: serve only this replica snapshot, with no database or segments of its own."""
+        self.db = None if snapshot else Database()
         self.processor = TextProcessor()
+        self.posting_index = None  # PostingIndex; postings come from SQLite when None
+        self.segments = SegmentedIndex() if config.INDEX_BACKEND == "segments" and not snapshot else None
+        self.cache = QueryCache()
+        self.rankings = QueryCache(config.SEARCH_CURSOR_MAX_ENTRIES, ttl=config.SEARCH_CURSOR_TTL)
+        self._index_checked_at = 0.0
+        self._view_generation = None
+        self._swapping = threading.Lock()
+        self._rejected = None  # (mtime, size) of the last snapshot file that failed to load
+        if snapshot:
+            self.load_snapshot(snapshot)
+
+    def load_posting_index(self, path=None, build=False):
+        """
+        Serve postings from the snapshot at path, building it first if asked
+        to or if it doesn't exist. Swapping the attribute is atomic, so
+        in-flight searches finish on the index they started with.
+        """
+        path = path or config.MEMORY_INDEX_PATH
+        if build or not os.path.exists(path):
+            PostingIndex.build(self.db, path)
+        try:
+            self.posting_index = PostingIndex(path)
+        except ValueError:
+            # Snapshot written by an older version of the format
+            PostingIndex.build(self.db, path)
+            self.posting_index = PostingIndex(path)
+        self.cache.bump_generation()
+        logger.info(f"Loaded posting index {path} ({self.posting_index.num_terms} terms)")
+
+    def load_snapshot(self, path=None):
+        """
+        Serve searches, result pages included, from the replica snapshot at
+        path alone. Nothing is rebuilt: a snapshot that isn't one or fails
+        its checks raises ValueError, leaving the current index in place.
+        """
+        path = path or config.REPLICA_SNAPSHOT_PATH
+        self.posting_index = open_snapshot(path)
+        self.segments = None  # a replica has no segments of its own
+        self.cache.bump_generation()
+        logger.info(f"Loaded snapshot {path} ({len(self.posting_index.page_ids)} pages, "
+                    f"{self.posting_index.num_terms} terms)")
+
+    def _refresh_posting_index(self):
+        # Another worker may have rebuilt the snapshot; check now and then
+        now = time.monotonic()
+        if now - self._index_checked_at < config.MEMORY_INDEX_CHECK_INTERVAL:
+            return
+        self._index_checked_at = now
+        if not self.posting_index.is_stale():
+            return
+        path = self.posting_index.path
+        if not self.posting_index.has_pages:
+            self.load_posting_index(path)
+            return
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            return
+        signature = (current.st_mtime_ns, current.st_size)
+        # A file that failed its checks is only read again once it changes
+        if signature != self._rejected and self._swapping.acquire(blocking=False):
+            # Checking a replica snapshot reads all of it: searches keep the
+            # current one meanwhile instead of waiting
+            threading.Thread(target=self._swap_snapshot, args=(path, signature),
+                             name="snapshot-swap", daemon=True).start()
 
-    def search(self, query, metadata_only=True):
+    def _swap_snapshot(self, path, signature):
+        try:
+            self.load_snapshot(path)
+            self._rejected = None
+        except (OSError, ValueError) as e:
+            self._rejected = signature
+            logger.error(f"Keeping the current index, new snapshot failed to load: {e}")
+        finally:
+            self._swapping.release()
+
+    def parse_query(self, query):
+        """
+        Query tokens, plus each quoted phrase of two or more tokens as
+        (token, gap) pairs, gap being the token's distance in words from
+        the phrase's first token.
+        """
         tokens = self.processor.process_text(query)
+        phrases = []
+        for text in PHRASE_PATTERN.findall(query):
+            words = self.processor.tokenize(text)
+            if len(words) > 1:
+                first = words[0][1]
+                phrases.append(tuple((token, position - first) for token, position, _ in words))
+        return tokens, tuple(phrases)
+
+    def search(self, query, metadata_only=True, limit=10, params=None):
+        """
+        Quoted phrases in query only match documents containing them
+        verbatim. params: a ranking_params() dict; config defaults when None.
+        """
+        return self._cached_search(self._source(), query, limit, params or ranking_params())
+
+    def search_batch(self, queries, limit=10, params=None):
+        """
+        Yields search() results for each of queries in turn, all against
+        the same index view, which a _SharedSource reads through so that
+        words several of the queries have are read once for all of them.
+        """
+        params = params or ranking_params()
+        queries = list(queries)
+        counts = Counter(word for query in queries for word in set(self.parse_query(query)[0]))
+        source = _SharedSource(self._source(), {word for word, count in counts.items() if count > 1})
+        for query in queries:
+            yield self._cached_search(source, query, limit, params)
+
+    def search_page(self, query=None, limit=10, params=None, cursor=None):
+        """
+        (results, next_cursor): the first limit results of query, or the
+        next limit of the search cursor came from, and the cursor for the
+        page after them, None after the last page. The first page is
+        search()'s. The first request for a later page ranks
+        SEARCH_CURSOR_DEPTH results once, the first page's kept at the
+        head, and the list is kept for SEARCH_CURSOR_TTL under an id the
+        cursors carry, so paging neither ranks again nor shifts as the
+        index changes. If the list has been dropped meanwhile, it is
+        ranked again. Raises ValueError for a cursor this didn't make.
+        """
+        if cursor is None:
+            params = params or ranking_params()
+            results = self.search(query, limit=limit, params=params)
+            state = {'query': query, 'params': params, 'first': limit, 'offset': limit, 'ranking': None}
+            return results, encode_cursor(state) if len(results) == limit else None
+
+        state = decode_cursor(cursor)
+        source = self._source()
+        tokens, phrases = self.parse_query(state['query'])
+        key = (state['ranking'], state['query'], tuple(sorted(state['params'].items())))
+        ranked = self.rankings.get(key) if state['ranking'] else None
+        if ranked is None:
+            ranked = self._deep_ranking(source, tokens, phrases, state['first'], state['params'])
+            state['ranking'] = uuid.uuid4().hex
+            key = (state['ranking'], *key[1:])
+            self.rankings.put(key, ranked, self.rankings.generation)
+        page = ranked[state['offset']:state['offset'] + limit]
+        results = self._render(source, tokens, page)
+        state['offset'] += len(page)
+        return results, encode_cursor(state) if state['offset'] < len(ranked) else None
+
+    def _deep_ranking(self, source, tokens, phrases, first, params):
+        """The top SEARCH_CURSOR_DEPTH, headed by the first page as search() ranked it."""
+        if not tokens:
+            return []
+        head = self._rank(source, tokens, phrases, first, params)
+        shown = {doc_id for doc_id, *_ in head}
+        deep = self._rank(source, tokens, phrases, max(config.SEARCH_CURSOR_DEPTH, first), params)
+        return head + [entry for entry in deep if entry[0] not in shown]
+
+    def _cached_search(self, source, query, limit, params):
+        start = time.perf_counter()
+        tokens, phrases = self.parse_query(query)
         if not tokens:
             return []
-        N = self.db.get_document_count()
+
+        key = (tuple(tokens), phrases, limit, tuple(sorted(params.items())))
+        generation = self.cache.generation
+        results = self.cache.get(key)
+        hit = results is not None
+        if not hit:
+            results = self._search(source, tokens, phrases, limit, params)
+            self.cache.put(key, results, generation)
+        _search_metrics[hit].observe(time.perf_counter() - start)
+        return results
+
+    def vocabulary(self):
+        """(word, df) of every indexed word, in word order, from wherever searches read postings."""
+        return self._source().get_vocabulary()
+
+    def _source(self):
+        """
+        Where this search reads postings from. A segment view is taken once
+        per search, so every read in it sees the same index generation.
+        """
+        if self.segments:
+            view = self.segments.current()
+            if view.generation != self._view_generation:
+                self._view_generation = view.generation
+                self.cache.bump_generation()
+            return view
+        if self.posting_index:
+            self._refresh_posting_index()
+            return self.posting_index
+        return self.db
+
+    def _search(self, source, tokens, phrases, limit, params):
+        return self._render(source, tokens, self._rank(source, tokens, phrases, limit, params))
+
+    def _rank(self, source, tokens, phrases, limit, params):
+        """The top limit as (doc_id, score, pagerank, snippet offset), best first."""
+        clock = time.perf_counter()
+        stats = source.get_collection_stats()
+        N = stats.get('num_docs', 0)
         if N == 0:
             return []
 
-        doc_scores = defaultdict(float)
-        candidates = {} # doc_id -> basic info
+        query_terms = Counter(tokens)  # repeated query words count repeatedly
+        words = list(query_terms)
+        proximity_weight = params['proximity_weight'] * params['text_weight']
+        rerank = proximity_weight and len(words) > 1
+        depth = limit * config.PROXIMITY_RERANK_DEPTH if rerank else limit
 
-        for term in tokens:
-            df = self.db.get_doc_frequency(term)
-            if df == 0:
-                continue
-            
-            idf = log(N / df)
-            docs = self.db.get_documents_with_word(term)
-            
-            for doc in docs:
-                doc_id = doc['doc_id']
-                tf = doc['term_frequency']
-                tf_idf = tf * idf
-                
-                doc_scores[doc_id] += (tf_idf * config.TFIDF_WEIGHT)
-                
-                if doc_id not in candidates:
-                    candidates[doc_id] = {
-                        'url': doc['url'],
-                        'title': doc['title'],
-                        'pagerank': doc['pagerank'],
-                        'text': doc['cleaned_text'] # Needed for snippet?
-                    }
+        # Phrase filtering comes after scoring, so documents it drops could
+        # set the pruning threshold; phrase queries are scored in full.
+        # Whatever the proximity rerank could lift into the top limit is kept
+        pruned = None
+        if config.TOP_K_PRUNING and not phrases:
+            pruned = self._pruned_scores(source, query_terms, stats, params, limit,
+                                         proximity_weight if rerank else 0.0)
+        if pruned is None:
+            # In word order, as pruned searches add theirs up
+            postings = source.get_postings(sorted(query_terms))
+            clock = self._lap("postings", clock)
+            doc_scores = defaultdict(float)
+            pageranks = {}
+            self._score(postings, query_terms, stats, params, doc_scores, pageranks)
+            scored_postings, skipped = len(postings), 0
+        else:
+            # Scored as they were read
+            doc_scores, pageranks, scored_postings, skipped = pruned
+            clock = self._lap("postings", clock)
+        metrics.SEARCH_POSTINGS_SCORED.inc(scored_postings)
+        metrics.SEARCH_POSTINGS_SKIPPED.inc(skipped)
+
+        phrase_offsets, phrase_time = {}, 0.0
+        if phrases:
+            phrase_start = time.perf_counter()
+            phrase_offsets = self._match_phrases(source, phrases, postings, doc_scores)
+            phrase_time = self._lap("phrases", phrase_start) - phrase_start
+
+        text_weight, pagerank_weight = params['text_weight'], params['pagerank_weight']
+        scored = {doc_id: score * text_weight + pageranks[doc_id] * pagerank_weight
+                  for doc_id, score in doc_scores.items()}
+        rank_key = lambda item: (item[1], -item[0])
+        top = heapq.nlargest(depth, scored.items(), key=rank_key)
+        clock = self._lap("scoring", clock + phrase_time)  # scoring is either side of phrase matching
+
+        # Positions are only read for the documents that can still make the cut
+        windows = self._windows(source, words, [doc_id for doc_id, _ in top])
+        if rerank:
+            boost = lambda doc_id: proximity_weight * self._proximity(windows[doc_id])
+            boosted = [(doc_id, score + boost(doc_id)) for doc_id, score in top]
+            top = heapq.nlargest(limit, boosted, key=rank_key)
+            if len(scored) > depth and top:
+                # A boost is at most proximity_weight, so a document below the
+                # rerank depth can overtake the limit-th only from within that
+                cut = top[-1][1] - proximity_weight
+                cut -= abs(cut) * BOUND_SLACK
+                rest = [(doc_id, score) for doc_id, score in scored.items()
+                        if score >= cut and doc_id not in windows]
+                if rest:
+                    windows.update(self._windows(source, words, [doc_id for doc_id, _ in rest]))
+                    boosted.extend((doc_id, score + boost(doc_id)) for doc_id, score in rest)
+                    top = heapq.nlargest(limit, boosted, key=rank_key)
+        self._lap("proximity", clock)
+
+        ranked = []
+        for doc_id, final_score in top:
+            if doc_id in phrase_offsets:
+                offset = phrase_offsets[doc_id]
+            else:
+                offset = windows[doc_id][2] if windows[doc_id] else None
+            ranked.append((doc_id, final_score, pageranks[doc_id], offset))
+        return ranked
+
+    def _windows(self, source, words, doc_ids):
+        """{doc_id: best window} of the query words, for proximity and snippets."""
+        positions = source.get_positions(words, doc_ids)
+        return {doc_id: self._best_window(words, doc_id, positions) for doc_id in doc_ids}
+
+    def _render(self, source, tokens, ranked):
+        """Results for _rank() entries; text is only fetched, and snippets only built, for these."""
+        clock = time.perf_counter()
+        page_source = source if getattr(source, 'has_pages', False) else self.db
+        pages = page_source.get_pages([doc_id for doc_id, *_ in ranked])
         results = []
-        for doc_id, score in doc_scores.items():
-            final_score = score + (candidates[doc_id]['pagerank'] * config.PAGERANK_WEIGHT)
-            
-            snippet = self._generate_snippet(candidates[doc_id]['text'], tokens)
-            
+        for doc_id, final_score, pagerank, offset in ranked:
+            page = pages.get(doc_id)
+            if page is None:
+                continue  # removed since it was ranked
             results.append({
-                'url': candidates[doc_id]['url'],
-                'title': candidates[doc_id]['title'],
-                'snippet': snippet,
+                'url': page['url'],
+                'title': page['title'],
+                'snippet': self._generate_snippet(page['cleaned_text'], tokens, offset=offset),
                 'score': final_score,
-                'pagerank': candidates[doc_id]['pagerank']
+                'pagerank': pagerank
             })
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:10] # Top 10
+        self._lap("snippets", clock)
+        return results
+
+    def _lap(self, stage, since):
+        """Records the time since `since` against a search stage; returns now."""
+        now = time.perf_counter()
+        _stage_metrics[stage].observe(now - since)
+        return now
+
+    def _pruned_scores(self, source, query_terms, stats, params, k, margin=0.0):
+        """
+        MaxScore: query words are read in full in order of their score
+        bound, highest first, while tracking the k-th best score that
+        documents read so far are sure to reach, less margin. Once the
+        words left could not lift a document none of the read words
+        contain to that threshold, no such document can come within margin
+        of the top k, and the other words are only read for the documents
+        already seen whose best case still reaches it. PageRank's share is
+        bounded by the highest PageRank.
+
+        Each posting is scored once, as it is read, and kept per word, so
+        a document's text score is added up in the word order of a full
+        read and comes out exactly as it would there. Returns (doc_scores,
+        pageranks, postings scored, postings never read) for every
+        document that can come within margin of the top k; or None without
+        bounds to prune with.
+        """
+        text_weight, pagerank_weight = params['text_weight'], params['pagerank_weight']
+        if len(query_terms) < 2 or text_weight <= 0 or stats.get('max_pagerank') is None:
+            return None
+        bounds = self._term_bounds(source, query_terms, stats, params)
+        if bounds is None or len(bounds) < 2:
+            return None
+        pagerank_bound = max(0.0, stats['max_pagerank'] * pagerank_weight)
+        order = sorted(bounds, key=lambda word: (-bounds[word][0], word))
 
-    def _generate_snippet(self, text, keywords, length=150):
+        # Contributions are never negative, so partial scores are lower bounds
+        word_scores, scores, pageranks, scored = {}, defaultdict(float), {}, 0
+        threshold, candidates = float('-inf'), None
+        for i, word in enumerate(order):
+            rest = sum(bounds[unread][0] for unread in order[i:]) * text_weight
+            if rest + pagerank_bound < threshold:
+                candidates = {doc_id for doc_id, score in scores.items()
+                              if score * text_weight + pageranks[doc_id] * pagerank_weight + rest >= threshold}
+                break
+            if i == len(order) - 1:
+                break  # reading the last word here would skip nothing
+            rows = source.get_postings([word])
+            word_scores[word] = defaultdict(float)
+            self._score(rows, query_terms, stats, params, word_scores[word], pageranks)
+            scored += len(rows)
+            for doc_id, score in word_scores[word].items():
+                scores[doc_id] += score
+            if len(scores) >= k:
+                kth = heapq.nlargest(k, (score * text_weight + pageranks[doc_id] * pagerank_weight
+                                         for doc_id, score in scores.items()))[-1] - margin
+                threshold = kth - abs(kth) * BOUND_SLACK
+        unread = order[i:]
+
+        fetched = defaultdict(list)
+        for row in source.get_postings(sorted(unread), candidates):
+            fetched[row[0]].append(row)
+        for word in unread:
+            word_scores[word] = defaultdict(float)
+            self._score(fetched[word], query_terms, stats, params, word_scores[word], pageranks)
+        fetched_count = sum(map(len, fetched.values()))
+        scored += fetched_count
+
+        doc_scores = defaultdict(float)
+        for word in sorted(query_terms):
+            for doc_id, score in word_scores.get(word, {}).items():
+                if candidates is None or doc_id in candidates:
+                    doc_scores[doc_id] += score
+        skipped = 0
+        if candidates is not None:
+            skipped = max(0, sum(bounds[word][1] for word in unread) - fetched_count)
+        return doc_scores, pageranks, scored, skipped
+
+    def _term_bounds(self, source, query_terms, stats, params):
+        """
+        {word: (bound, df)}: the most each query word with postings can add
+        to a document's text score, from the maxima stored at index time;
+        None if the source has none. BM25F saturation grows with the
+        weighted frequency, and a length norm 1 - b + b * L / avg is never
+        below min(1, L / avg), so tf / norm is at most max(tf, tf / L * avg)
+        whatever b is. A df that undercounts only raises idf.
+        """
+        stored = source.get_term_bounds(query_terms)
+        if stored is None:
+            return None
+        N = stats['num_docs']
+        avg_length = stats.get('num_terms', 0) / N or 1.0
+        avg_title_length = stats.get('num_title_terms', 0) / N or 1.0
+        k1, boost = params['k1'], params['title_boost']
+        bounds = {}
+        for word, (df, max_tf, max_tf_ratio, max_title_tf, max_title_ratio) in stored.items():
+            if params['model'] == "bm25":
+                weight = (max(max_tf, max_tf_ratio * avg_length)
+                          + boost * max(max_title_tf, max_title_ratio * avg_title_length))
+                idf = log(1 + (N - df + 0.5) / (df + 0.5))
+                bound = idf * weight * (k1 + 1) / (weight + k1) if weight else 0.0
+            else:
+                bound = (max_tf + boost * max_title_tf) * log(N / df)
+            bounds[word] = (bound * query_terms[word] * (1 + BOUND_SLACK), df)
+        return bounds
+
+    def _score(self, postings, query_terms, stats, params, doc_scores, pageranks):
+        """Adds each posting's text score to doc_scores under the model in params."""
+        if params['model'] == "bm25":
+            self._score_bm25(postings, query_terms, stats, params, doc_scores, pageranks)
+        else:
+            self._score_tfidf(postings, query_terms, stats, params, doc_scores, pageranks)
+
+    def _score_tfidf(self, postings, query_terms, stats, params, doc_scores, pageranks):
+        N = stats['num_docs']
+        boost = params['title_boost']
+        for word, doc_id, tf, title_tf, df, _, _, pagerank in postings:
+            doc_scores[doc_id] += (tf + boost * title_tf) * log(N / df) * query_terms[word]
+            pageranks[doc_id] = pagerank
+
+    def _score_bm25(self, postings, query_terms, stats, params, doc_scores, pageranks):
+        """
+        BM25F: body and title frequencies are length-normalized per field,
+        the title weighted by title_boost, before BM25 saturation. Lengths
+        and averages were computed at index time.
+        """
+        N = stats['num_docs']
+        avg_length = stats.get('num_terms', 0) / N or 1.0
+        avg_title_length = stats.get('num_title_terms', 0) / N or 1.0
+        k1, b, boost = params['k1'], params['b'], params['title_boost']
+        for word, doc_id, tf, title_tf, df, doc_length, title_length, pagerank in postings:
+            # Pages indexed before lengths were stored count as average length
+            body_norm = 1 - b + b * (doc_length or avg_length) / avg_length
+            title_norm = 1 - b + b * (title_length or avg_title_length) / avg_title_length
+            weight = tf / body_norm + boost * title_tf / title_norm
+            idf = log(1 + (N - df + 0.5) / (df + 0.5))
+            doc_scores[doc_id] += idf * weight * (k1 + 1) / (weight + k1) * query_terms[word]
+            pageranks[doc_id] = pagerank
+
+    def _match_phrases(self, source, phrases, postings, doc_scores):
+        """
+        Drops documents from doc_scores that don't contain every phrase and
+        returns the offset of the first phrase match in those that do.
+        Documents indexed without positions are kept if they contain the
+        words, as there is nothing to check them against.
+        """
+        docs_with = defaultdict(set)
+        for row in postings:
+            docs_with[row[0]].add(row[1])
+
+        kept = set(doc_scores)
+        offsets = {}
+        for phrase in phrases:
+            words = {token for token, _ in phrase}
+            candidates = kept.intersection(*(docs_with[word] for word in words))
+            positions = source.get_positions(words, candidates)
+            matched = set()
+            for doc_id in candidates:
+                starts = self._phrase_starts(phrase, doc_id, positions)
+                if starts is None:
+                    matched.add(doc_id)
+                elif len(starts):
+                    matched.add(doc_id)
+                    first_offsets = decode_delta_list(positions[phrase[0][0], doc_id][1])
+                    offsets.setdefault(doc_id, first_offsets[starts[0]])
+            kept = matched
+
+        for doc_id in list(doc_scores):
+            if doc_id not in kept:
+                del doc_scores[doc_id]
+        return offsets
+
+    def _phrase_starts(self, phrase, doc_id, positions):
+        """
+        Indexes into the first token's occurrences where the phrase starts,
+        or None if the document's positions weren't stored.
+        """
+        blobs = [positions.get((token, doc_id), (None, None))[0] for token, _ in phrase]
+        if any(blob is None for blob in blobs):
+            return None
+        rest = [(set(decode_delta_list(blob)), gap) for blob, (_, gap) in zip(blobs[1:], phrase[1:])]
+        return [i for i, start in enumerate(decode_delta_list(blobs[0]))
+                if all(start + gap in word_positions for word_positions, gap in rest)]
+
+    def _best_window(self, words, doc_id, positions):
+        """
+        (terms, span, offset) of the shortest run of words covering every
+        query word the document contains in its body, offset being where the
+        run starts in the text; None without stored positions.
+        """
+        occurrences = []
+        for term, word in enumerate(words):
+            blobs = positions.get((word, doc_id))
+            if blobs and blobs[0]:
+                word_positions = decode_delta_list(blobs[0])
+                occurrences.extend(zip(word_positions, [term] * len(word_positions),
+                                       decode_delta_list(blobs[1])))
+        if not occurrences:
+            return None
+        occurrences.sort()
+        terms = len({term for _, term, _ in occurrences})
+
+        best = None
+        counts = defaultdict(int)
+        covered = left = 0
+        for position, term, _ in occurrences:
+            counts[term] += 1
+            covered += counts[term] == 1
+            while covered == terms:
+                start, left_term, offset = occurrences[left]
+                if best is None or position - start < best[1]:
+                    best = (terms, position - start, offset)
+                counts[left_term] -= 1
+                covered -= counts[left_term] == 0
+                left += 1
+        return best
+
+    def _proximity(self, window):
+        """1 when the query words are adjacent, falling off as they spread apart."""
+        if window is None or window[0] < 2:
+            return 0.0
+        terms, span, _ = window
+        return (terms - 1) / max(span, terms - 1)
+
+    def _generate_snippet(self, text, keywords, length=150, offset=None):
         if not text:
             return ""
-        lower_text = text.lower()
-        start_idx = -1
-        
-        for k in keywords:
-            idx = lower_text.find(k)
-            if idx != -1:
-                start_idx = idx
-                break
+        start_idx = -1 if offset is None else offset
+
+        if offset is None:
+            # No stored offsets for this page: look for the words in the text
+            lower_text = text.lower()
+            for k in keywords:
+                idx = lower_text.find(k)
+                if idx != -1:
+                    start_idx = idx
+                    break
         
         if start_idx == -1:
             return text[:length] + "..."
@@ -0,0 +1,460 @@
+import fcntl
+import heapq
+import json
+import os
+import threading
+import uuid
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import groupby
+from math import log
+from operator import itemgetter
+import numpy as np
+from ..storage.database import Database
+from .posting_index import PostingIndex
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+_NO_DOCS = np.zeros(0, dtype=np.int64)
+
+def _numbered_terms(n, segment):
+    """(word, n, term index) for every word of segment, in order."""
+    return ((word, n, i) for i, word in enumerate(segment.iter_terms()))
+
+
+class SegmentView:
+    """
+    The segments of one manifest generation, each paired with the sorted
+    doc ids it no longer serves. Collection statistics and document
+    frequencies are summed over live documents only, so scores match those
+    of a single index over the same pages. Implements the same calls as
+    PostingIndex and Database, so Ranker can score against it.
+    """
+    def __init__(self, generation, segments, pageranks=None):
+        self.generation = generation
+        self.segments = segments
+        self.deleted = [set(deleted.tolist()) for _, deleted in segments]
+        self.pagerank_ids, self.pagerank_values = pageranks if pageranks else (_NO_DOCS, np.zeros(0))
+        self.num_docs = self.num_tokens = self.num_title_tokens = 0
+        # Deleted documents only loosen this bound, as they do the segments' term bounds
+        self.max_pagerank = max([segment.max_pagerank for segment, _ in segments]
+                                + [float(self.pagerank_values.max()) if len(self.pagerank_values) else 0.0])
+        for segment, deleted in segments:
+            _, doc_lengths, title_lengths = segment.doc_table(deleted)
+            self.num_docs += len(segment.doc_ids) - len(deleted)
+            self.num_tokens += segment.header['num_tokens'] - int(doc_lengths.sum())
+            self.num_title_tokens += segment.header['num_title_tokens'] - int(title_lengths.sum())
+
+    def get_collection_stats(self):
+        return {'num_docs': self.num_docs, 'num_terms': self.num_tokens,
+                'num_title_terms': self.num_title_tokens, 'max_pagerank': self.max_pagerank}
+
+    def get_postings(self, words, doc_ids=None):
+        """
+        Rows shaped like Database.get_postings, gathered from every segment,
+        only those of doc_ids if given.
+        """
+        wanted = None if doc_ids is None else np.fromiter(doc_ids, dtype=np.int64)
+        rows = []
+        for word in words:
+            parts = []
+            for segment, deleted in self.segments:
+                doc_ids, tfs, title_tfs = segment.postings(word)
+                if len(deleted) and len(doc_ids):
+                    live = ~np.isin(doc_ids, deleted)
+                    doc_ids, tfs, title_tfs = doc_ids[live], tfs[live], title_tfs[live]
+                if len(doc_ids):
+                    parts.append((segment, doc_ids, tfs, title_tfs))
+            df = sum(len(doc_ids) for _, doc_ids, _, _ in parts)
+            for segment, doc_ids, tfs, title_tfs in parts:
+                if wanted is not None:
+                    kept = np.isin(doc_ids, wanted)
+                    doc_ids, tfs, title_tfs = doc_ids[kept], tfs[kept], title_tfs[kept]
+                pageranks, doc_lengths, title_lengths = segment.doc_table(doc_ids)
+                rows.extend(segment.posting_rows(word, df, doc_ids, tfs, title_tfs,
+                                                 self._pageranks(doc_ids, pageranks), doc_lengths, title_lengths))
+        return rows
+
+    def get_term_bounds(self, words):
+        """
+        Shaped like Database.get_term_bounds, each bound the largest over
+        the segments; None if any segment predates bounds. Live document
+        frequencies would take decoding the postings, so df is the least
+        the deletes leave, which only loosens the bound.
+        """
+        bounds = {}
+        for segment, deleted in self.segments:
+            segment_bounds = segment.get_term_bounds(words)
+            if segment_bounds is None:
+                return None
+            for word, (df, *maxima) in segment_bounds.items():
+                live = max(0, df - len(deleted))
+                if word in bounds:
+                    bounds[word] = (bounds[word][0] + live, *map(max, bounds[word][1:], maxima))
+                else:
+                    bounds[word] = (live, *maxima)
+        return {word: (max(df, 1), *maxima) for word, (df, *maxima) in bounds.items()}
+
+    def get_vocabulary(self):
+        """
+        Shaped like Database.get_vocabulary; dfs still count documents
+        deleted since their segment was written, until it is merged.
+        """
+        merged = heapq.merge(*(segment.get_vocabulary() for segment, _ in self.segments), key=itemgetter(0))
+        for word, group in groupby(merged, key=itemgetter(0)):
+            yield word, sum(df for _, df in group)
+
+    def get_positions(self, words, doc_ids):
+        positions = {}
+        for (segment, _), deleted in zip(self.segments, self.deleted):
+            live = [doc_id for doc_id in doc_ids if doc_id not in deleted] if deleted else doc_ids
+            positions.update(segment.get_positions(words, live))
+        return positions
+
+    def _pageranks(self, doc_ids, stored):
+        """Scores from the last published PageRank run, or those stored in the segment."""
+        if not len(self.pagerank_ids):
+            return stored
+        positions = np.minimum(np.searchsorted(self.pagerank_ids, doc_ids), len(self.pagerank_ids) - 1)
+        found = self.pagerank_ids[positions] == doc_ids
+        return np.where(found, self.pagerank_values[positions], stored)
+
+
+class SegmentedIndex:
+    """
+    An index made of immutable segment files, each a PostingIndex snapshot
+    of some of the pages, listed in a manifest together with the doc ids
+    every segment no longer serves. A build writes its segments first and
+    then publishes them, with the deletes they imply, in one manifest
+    update; a merge swaps several segments for one the same way. Readers
+    take a SegmentView of the current manifest, so they never wait on a
+    build and never see part of one.
+    """
+    def __init__(self, path=None):
+        self.path = path or config.SEGMENT_DIR
+        os.makedirs(self.path, exist_ok=True)
+        self.db = Database()
+        self.view = None
+        self._manifest_key = None
+        self._segments = {}  # name -> PostingIndex, shared by every view listing it
+        self._load_lock = threading.Lock()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _locked(self):
+        """Serializes manifest updates across threads and processes."""
+        with open(self._file('manifest.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_manifest(self):
+        try:
+            with open(self._file(MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'generation': 0, 'segments': [], 'pageranks': None}
+
+    def _write_manifest(self, manifest):
+        manifest['generation'] += 1
+        tmp_path = self._file(f"{MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._file(MANIFEST))
+
+    def _segment(self, name):
+        segment = self._segments.get(name)
+        if segment is None:
+            segment = self._segments[name] = PostingIndex(self._file(name))
+        return segment
+
+    def _unlink(self, names):
+        # Views still holding a segment keep its mapping after the unlink
+        for name in names:
+            self._segments.pop(name, None)
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+
+    def is_empty(self):
+        """True until the first build has been published."""
+        return self.read_manifest()['generation'] == 0
+
+    def current(self):
+        """SegmentView of the latest manifest, reloaded only when the manifest changed."""
+        try:
+            stat = os.stat(self._file(MANIFEST))
+            key = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            key = None
+        if self.view is None or key != self._manifest_key:
+            with self._load_lock:
+                if self.view is None or key != self._manifest_key:
+                    self.view = self._load_view()
+                    self._manifest_key = key
+        return self.view
+
+    def _load_view(self, attempts=3):
+        for attempt in range(attempts):
+            manifest = self.read_manifest()
+            try:
+                segments = [(self._segment(entry['name']), np.array(entry['deleted'], dtype=np.int64))
+                            for entry in manifest['segments']]
+                pageranks = None
+                if manifest['pageranks']:
+                    with np.load(self._file(manifest['pageranks'])) as data:
+                        pageranks = (data['ids'], data['ranks'])
+            except FileNotFoundError:
+                # A merge replaced a segment after we read the manifest; read the new one
+                if attempt == attempts - 1:
+                    raise
+                continue
+            live = {entry['name'] for entry in manifest['segments']}
+            for name in [name for name in list(self._segments) if name not in live]:
+                self._segments.pop(name, None)
+            return SegmentView(manifest['generation'], segments, pageranks)
+
+    def write_segment(self, docs):
+        """
+        Write docs, as _tokenize_page returns them, to a new segment and
+        return its name, or None if they hold no words. The segment is not
+        searchable until it is passed to commit().
+        """
+        docs = sorted((doc for doc in docs if doc[2] or doc[3]), key=itemgetter(0))
+        if not docs:
+            return None
+        pageranks = self.db.get_pageranks([doc[0] for doc in docs])
+        postings = defaultdict(list)
+        doc_rows = []
+        for doc_id, _, word_freqs, title_freqs, positions in docs:
+            for word in word_freqs.keys() | title_freqs.keys():
+                postings[word].append((doc_id, word_freqs.get(word, 0), title_freqs.get(word, 0),
+                                       positions.get(word)))
+            doc_rows.append((doc_id, pageranks.get(doc_id, 0.0), sum(word_freqs.values()),
+                             sum(title_freqs.values())))
+
+        def terms():
+            for word in sorted(postings):
+                rows = postings[word]
+                blobs = [row[3] for row in rows]
+                positional = all(blob is not None for blob in blobs)
+                yield (word, [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows],
+                       [blob[0] for blob in blobs] if positional else None,
+                       [blob[1] for blob in blobs] if positional else None)
+
+        stats = {'num_docs': len(doc_rows), 'num_terms': sum(row[2] for row in doc_rows),
+                 'num_title_terms': sum(row[3] for row in doc_rows)}
+        name = f"{uuid.uuid4().hex}.seg"
+        PostingIndex.write(self._file(name), stats, terms(), doc_rows)
+        return name
+
+    def commit(self, segments=(), deleted=()):
+        """
+        Publish new segments and remove the deleted doc ids, which must
+        include every document the new segments hold, from the existing
+        ones, in one manifest update. Segments left without a live
+        document are dropped.
+        """
+        deleted = np.unique(np.fromiter(deleted, dtype=np.int64))
+        with self._locked():
+            manifest = self.read_manifest()
+            for entry in manifest['segments']:
+                doc_ids = self._segment(entry['name']).doc_ids
+                gone = doc_ids[np.isin(doc_ids, deleted)].tolist()
+                if gone:
+                    entry['deleted'] = sorted(set(entry['deleted']).union(gone))
+            manifest['segments'].extend({'name': name, 'docs': len(self._segment(name).doc_ids), 'deleted': []}
+                                        for name in segments)
+            dropped = self._drop_empty(manifest)
+            self._write_manifest(manifest)
+        self._unlink(dropped)
+        logger.info(f"Published index generation {manifest['generation']}: {len(segments)} new segments, "
+                    f"{len(manifest['segments'])} in all")
+
+    def _drop_empty(self, manifest):
+        dropped = [entry['name'] for entry in manifest['segments'] if len(entry['deleted']) >= entry['docs']]
+        manifest['segments'] = [entry for entry in manifest['segments'] if entry['name'] not in dropped]
+        return dropped
+
+    def merge(self, names):
+        """
+        Rewrite the live documents of the named segments into one segment
+        and publish it in their place. Deletes that land while the merge
+        runs are carried over to the new segment. Returns False if the
+        segments changed under it (another merger got there first).
+        """
+        entries = {entry['name']: entry for entry in self.read_manifest()['segments']}
+        if not all(name in entries for name in names):
+            return False
+        sources = [(self._segment(name), np.array(entries[name]['deleted'], dtype=np.int64)) for name in names]
+        merged = self._write_merged(sources)
+
+        with self._locked():
+            manifest = self.read_manifest()
+            current = {entry['name']: entry for entry in manifest['segments']}
+            if not all(name in current for name in names):
+                self._unlink([merged] if merged else [])
+                return False
+            late = set()
+            for name in names:
+                late.update(set(current[name]['deleted']) - set(entries[name]['deleted']))
+            manifest['segments'] = [entry for entry in manifest['segments'] if entry['name'] not in names]
+            if merged:
+                manifest['segments'].append({'name': merged, 'docs': len(self._segment(merged).doc_ids),
+                                             'deleted': sorted(late)})
+            dropped = self._drop_empty(manifest)
+            self._write_manifest(manifest)
+        self._unlink(list(names) + dropped)
+        logger.info(f"Merged {len(names)} segments into {merged}")
+        return True
+
+    def export(self, path, pages=None, header=None):
+        """
+        Write the live documents of the current view to one snapshot at
+        path, atomically, with their latest PageRank scores; pages and
+        header as for PostingIndex.write.
+        """
+        view = self.current()
+        self._write_merged(view.segments, path, view._pageranks, pages=pages, header=header)
+
+    def _write_merged(self, sources, path=None, pageranks=None, **write_args):
+        """
+        Write the live postings of sources, (PostingIndex, deleted) pairs,
+        to path, or to a new segment whose name is returned. pageranks(ids,
+        stored) may replace the scores stored in the sources.
+        """
+        doc_rows = []
+        for segment, deleted in sources:
+            live = ~np.isin(segment.doc_ids, deleted)
+            ranks = segment.pageranks[live]
+            if pageranks is not None:
+                ranks = pageranks(segment.doc_ids[live], ranks)
+            doc_rows.extend(zip(segment.doc_ids[live].tolist(), ranks.tolist(),
+                                segment.doc_lengths[live].tolist(), segment.title_lengths[live].tolist()))
+        if not doc_rows and path is None:
+            return None
+        doc_rows.sort()
+        positional = all(segment.positional for segment, _ in sources)
+
+        def terms():
+            numbered = [_numbered_terms(n, segment) for n, (segment, _) in enumerate(sources)]
+            for word, group in groupby(heapq.merge(*numbered), key=itemgetter(0)):
+                doc_ids, tfs, title_tfs, blobs = [], [], [], []
+                for _, n, i in group:
+                    segment, deleted = sources[n]
+                    term_doc_ids, term_tfs, term_title_tfs = segment.term_postings(i)
+                    live = np.flatnonzero(~np.isin(term_doc_ids, deleted))
+                    doc_ids.append(term_doc_ids[live])
+                    tfs.append(term_tfs[live])
+                    title_tfs.append(term_title_tfs[live])
+                    if positional:
+                        blobs.extend(segment.term_positions(i, live.tolist()))
+                doc_ids = np.concatenate(doc_ids)
+                if not len(doc_ids):
+                    continue
+                # Each document is live in one segment only, so ids don't repeat
+                order = np.argsort(doc_ids, kind='stable')
+                yield (word, doc_ids[order].tolist(), np.concatenate(tfs)[order].tolist(),
+                       np.concatenate(title_tfs)[order].tolist(),
+                       [blobs[j][0] for j in order] if positional else None,
+                       [blobs[j][1] for j in order] if positional else None)
+
+        stats = {'num_docs': len(doc_rows), 'num_terms': sum(row[2] for row in doc_rows),
+                 'num_title_terms': sum(row[3] for row in doc_rows)}
+        name = f"{uuid.uuid4().hex}.seg"
+        PostingIndex.write(path or self._file(name), stats, terms(), doc_rows, **write_args)
+        return name
+
+    def _pick_merge(self, manifest):
+        """
+        Names of the segments to merge next: one whose deleted share is over
+        SEGMENT_MAX_DELETED_RATIO, rewritten on its own, or else the
+        SEGMENT_MERGE_FACTOR smallest segments of the smallest size tier
+        (live documents, in powers of the factor) that has that many.
+        """
+        factor = config.SEGMENT_MERGE_FACTOR
+        tiers = defaultdict(list)
+        for entry in manifest['segments']:
+            if len(entry['deleted']) > entry['docs'] * config.SEGMENT_MAX_DELETED_RATIO:
+                return [entry['name']]
+            live = entry['docs'] - len(entry['deleted'])
+            tiers[int(log(max(live, 1), factor))].append((live, entry['name']))
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= factor:
+                return [name for _, name in sorted(tiers[tier])[:factor]]
+        return None
+
+    def maybe_merge(self):
+        """Merge until the policy finds nothing to do; returns the number of merges."""
+        merges = 0
+        while True:
+            names = self._pick_merge(self.read_manifest())
+            if not names or not self.merge(names):
+                return merges
+            merges += 1
+
+    def update_pageranks(self):
+        """Publish the pages' current PageRank scores, which views use over those stored in segments."""
+        rows = self.db.get_all_pageranks()
+        name = f"{uuid.uuid4().hex}.pagerank"
+        with open(self._file(name), 'wb') as f:
+            np.savez(f, ids=np.array([row[0] for row in rows], dtype=np.int64),
+                     ranks=np.array([row[1] for row in rows], dtype=np.float64))
+        with self._locked():
+            manifest = self.read_manifest()
+            previous = manifest['pageranks']
+            manifest['pageranks'] = name
+            self._write_manifest(manifest)
+        if previous:
+            self._unlink([previous])
+
+    def stats(self):
+        manifest = self.read_manifest()
+        return {'generation': manifest['generation'],
+                'segments': [{'name': entry['name'], 'docs': entry['docs'], 'deleted': len(entry['deleted'])}
+                             for entry in manifest['segments']]}
+
+
+class SegmentMerger(threading.Thread):
+    """
+    Background merging for a SegmentedIndex: checks the merge policy every
+    SEGMENT_MERGE_INTERVAL seconds, or as soon as it is woken after a build.
+    """
+    def __init__(self, index=None, interval=None):
+        super().__init__()
+        self.index = index or SegmentedIndex()
+        self.interval = interval or config.SEGMENT_MERGE_INTERVAL
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.merges = 0
+        self.daemon = True
+
+    def wake(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        while not self.stopped:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.stopped:
+                break
+            try:
+                self.merges += self.index.maybe_merge()
+            except Exception as e:
+                logger.error(f"Segment merge failed: {e}")
@@ -0,0 +1,89 @@
+"""
+Replica snapshots: one read-only PostingIndex file with everything a
+search reads, postings, term statistics, PageRank scores and each
+indexed page's url, title and text, so a replica serves results from it
+without a database or an index build. Sections are column arrays and
+blobs that are memory-mapped as they are, so loading one costs a
+checksum pass at most. Replacing the file is atomic, and a replica
+serving it swaps the new one in without dropping searches.
+
+Run from the repository root:
+    python -m search_engine.indexer.snapshot export [path]
+    python -m search_engine.indexer.snapshot verify path
+"""
+import json
+import sys
+import time
+import logging
+from ..storage.database import Database
+from .posting_index import PostingIndex
+from .segments import SegmentedIndex
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def export_snapshot(path=None, db=None, segments=None):
+    """
+    Write a replica snapshot of the index to path, atomically, from the
+    keywords table or, if given, a SegmentedIndex's current view. The
+    database is read in one transaction, so postings, PageRank and pages
+    all come from the same commit. Returns describe() of it.
+    """
+    path = path or config.SNAPSHOT_EXPORT_PATH
+    db = db or Database()
+    start = time.perf_counter()
+    header = {'snapshot': {'version': SNAPSHOT_VERSION, 'backend': "segments" if segments else "sqlite"}}
+    with db.read_transaction():
+        if segments is not None:
+            segments.export(path, db.iter_indexed_pages(), header)
+        else:
+            PostingIndex.build(db, path, db.iter_indexed_pages(), header)
+    seconds = time.perf_counter() - start
+    summary = {**describe(open_snapshot(path, verify=False)), 'seconds': seconds}
+    logger.info(f"Exported snapshot {path}: {summary['pages']} pages, {summary['bytes']} bytes in {seconds:.2f}s")
+    return summary
+
+
+def open_snapshot(path, verify=None):
+    """
+    The PostingIndex at path, if it is a replica snapshot this version
+    serves; its checksums are checked first when verify is true, which
+    defaults to SNAPSHOT_VERIFY. Raises ValueError otherwise.
+    """
+    index = PostingIndex(path)
+    version = index.header.get('snapshot', {}).get('version')
+    if version != SNAPSHOT_VERSION or not index.has_pages:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} replica snapshot")
+    if config.SNAPSHOT_VERIFY if verify is None else verify:
+        index.verify()
+    return index
+
+
+def describe(index):
+    return {'path': index.path, 'version': index.header['snapshot']['version'],
+            'backend': index.header['snapshot']['backend'], 'created_at': index.header['created_at'],
+            'bytes': index.stat.st_size, 'pages': len(index.page_ids),
+            'docs': int(index.header['num_docs']), 'terms': index.num_terms}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] not in ("export", "verify") or (sys.argv[1] == "verify" and len(sys.argv) < 3):
+        sys.exit(__doc__)
+    path = sys.argv[2] if len(sys.argv) > 2 else None
+    if sys.argv[1] == "export":
+        segments = SegmentedIndex() if config.INDEX_BACKEND == "segments" else None
+        summary = export_snapshot(path, segments=segments)
+    else:
+        try:
+            summary = describe(open_snapshot(path, verify=True))
+        except ValueError as e:
+            sys.exit(str(e))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
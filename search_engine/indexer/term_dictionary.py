@@ -0,0 +1,119 @@
+from array import array
+from bisect import bisect_left
+import numpy as np
+from .text_processor import TextProcessor
+from .. import config
+
+_LAST_CHAR = '\U0010ffff'
+
+
+class TermDictionary:
+    """
+    Immutable prefix-completion dictionary of the index vocabulary. Words
+    are kept sorted in one UTF-8 blob with an offset array, next to their
+    document frequencies, so a million words take tens of megabytes
+    rather than the hundreds Python strings would. Words sharing a prefix
+    are a contiguous run found by two binary searches. Short runs are
+    ranked on the fly; every prefix shared by more than SUGGEST_SCAN_LIMIT
+    words has its top SUGGEST_MAX_RESULTS completions precomputed, so no
+    lookup looks at more than that many frequencies.
+    """
+    def __init__(self, vocabulary, scan_limit=None, max_results=None):
+        """vocabulary: (word, df) pairs in word order, as Ranker.vocabulary() yields them."""
+        self.processor = TextProcessor()
+        self.scan_limit = scan_limit or config.SUGGEST_SCAN_LIMIT
+        self.max_results = max_results or config.SUGGEST_MAX_RESULTS
+        blob = bytearray()
+        self.offsets = array('Q', [0])
+        words, dfs = [], []
+        for word, df in vocabulary:
+            blob.extend(word.encode('utf-8'))
+            self.offsets.append(len(blob))
+            words.append(word)
+            dfs.append(df)
+        self.blob = bytes(blob)
+        self.dfs = np.array(dfs, dtype=np.int64)
+        self.tops = self._precompute(words)
+
+    def __len__(self):
+        return len(self.dfs)
+
+    def _precompute(self, words):
+        """{prefix: indices of its top completions} for every prefix of more than scan_limit words."""
+        tops = {}
+        stack = ['']
+        while stack:
+            prefix = stack.pop()
+            lo = bisect_left(words, prefix)
+            hi = bisect_left(words, prefix + _LAST_CHAR, lo)
+            if hi - lo <= self.scan_limit:
+                continue
+            tops[prefix] = self._top(lo, hi, self.max_results)
+            # One level down: the runs of words sharing their next character
+            i = lo + (words[lo] == prefix)
+            while i < hi:
+                child = words[i][:len(prefix) + 1]
+                stack.append(child)
+                i = bisect_left(words, child + _LAST_CHAR, i, hi)
+        return tops
+
+    def _top(self, lo, hi, limit):
+        """Indices of the limit most frequent words in lo..hi, ties in word order."""
+        return lo + np.argsort(-self.dfs[lo:hi], kind='stable')[:limit]
+
+    def _word(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    def _bisect(self, target, lo=0):
+        """Index of the first word from lo on not below target, comparing UTF-8 bytes."""
+        blob, offsets = self.blob, self.offsets
+        hi = len(self.dfs)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid]:offsets[mid + 1]] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def complete(self, prefix, limit=None):
+        """
+        (word, df) of the limit most frequent words starting with prefix,
+        taken as it is; at most max_results.
+        """
+        limit = min(limit or config.SUGGEST_LIMIT, self.max_results)
+        if prefix in self.tops:
+            indices = self.tops[prefix][:limit]
+        else:
+            target = prefix.encode('utf-8')
+            # No word holds a 0xff byte, so this sorts after all of prefix's completions
+            lo = self._bisect(target)
+            hi = self._bisect(target + b'\xff', lo)
+            indices = self._top(lo, hi, limit)
+        return [(self._word(i), int(self.dfs[i])) for i in indices.tolist()]
+
+    def suggest(self, text, limit=None):
+        """
+        Completions of the last word of text as typed in a search box,
+        normalized like indexed text. If that word is complete and indexed
+        only as its stem, the stem's completions are given. Each comes with
+        the query it makes, the earlier words kept. Text ending in a space
+        has no word to complete.
+        """
+        words = self.processor.normalize(text).split()
+        if not words or text[-1].isspace():
+            return []
+        prefix = words[-1]
+        completions = self.complete(prefix, limit)
+        if not completions:
+            stem = self.processor.stem(prefix)
+            if stem != prefix:
+                completions = self.complete(stem, limit)
+        head = ' '.join(words[:-1])
+        return [{'term': word, 'df': df, 'query': f"{head} {word}" if head else word}
+                for word, df in completions]
+
+    def stats(self):
+        top_bytes = sum(indices.nbytes for indices in self.tops.values())
+        return {'terms': len(self.dfs), 'precomputed_prefixes': len(self.tops),
+                'bytes': len(self.blob) + self.offsets.itemsize * len(self.offsets) + self.dfs.nbytes + top_bytes}
@@ -2,6 +2,9 @@ import re
 import string
 from .. import config
 
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+WORD_PATTERN = re.compile(r'\S+')
+
 class TextProcessor:
     def __init__(self):
         self.stopwords = {
@@ -15,15 +18,39 @@ class TextProcessor:
     def process_text(self, text):
         if not text:
             return []
-        text = text.lower()
-        text = text.translate(str.maketrans("", "", string.punctuation))
-        tokens = text.split()
+        tokens = self.normalize(text).split()
         tokens = [t for t in tokens if t not in self.stopwords and len(t) > 1]
         if config.USE_STEMMING:
             tokens = [self._simple_stem(t) for t in tokens]
             
         return tokens
 
+    def normalize(self, text):
+        """text lowercased and without punctuation, as words are before stopwords and stemming."""
+        return text.lower().translate(PUNCTUATION_TABLE)
+
+    def stem(self, token):
+        """A normalized token as it is indexed: stemmed if USE_STEMMING is on."""
+        return self._simple_stem(token) if config.USE_STEMMING else token
+
+    def tokenize(self, text):
+        """
+        The tokens of process_text as (token, position, offset) triples.
+        position counts every word of the text, stopwords included, so
+        phrase gaps are kept; offset is where the word starts in text.
+        """
+        if not text:
+            return []
+        tokens = []
+        for position, match in enumerate(WORD_PATTERN.finditer(text)):
+            token = self.normalize(match.group())
+            if token in self.stopwords or len(token) <= 1:
+                continue
+            if config.USE_STEMMING:
+                token = self._simple_stem(token)
+            tokens.append((token, position, match.start()))
+        return tokens
+
     def _simple_stem(self, word):
         if word.endswith("ing"): return word[:-3]
         if word.endswith("ed"): return word[:-2]
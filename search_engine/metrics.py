@@ -0,0 +1,209 @@
+"""
+Process-wide pipeline metrics, rendered in the Prometheus text format by
+the API's /metrics endpoint. Updates are a dict lookup and a short
+uncontended lock, cheap enough for every fetch, write and search stage;
+values that already live elsewhere (queue sizes, pool stats) are read
+through callbacks at scrape time instead of being kept up to date.
+"""
+import threading
+from bisect import bisect_left
+from . import config
+
+_metrics = []
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._function = None
+        _metrics.append(self)
+
+    def labels(self, *values):
+        """The child for one combination of label values, created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def set_function(self, function):
+        """
+        Read the value from function() at scrape time: a number, or a dict
+        of label value tuples to numbers for a labelled metric. None clears it.
+        """
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            value = self._function()
+            values = value if isinstance(value, dict) else {(): value}
+            return [(self.name, labels, (), sample) for labels, sample in values.items()]
+        if not self.labelnames:
+            self.labels()  # an unlabelled metric is shown before its first update too
+        return [sample for labels, child in list(self._children.items())
+                for sample in child.samples(self.name, labels)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if config.METRICS_ENABLED:
+            with self.lock:
+                self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        return [(name, labels, (), self.value)]
+
+
+class _Buckets:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket, the last one +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        if config.METRICS_ENABLED:
+            i = bisect_left(self.bounds, value)
+            with self.lock:
+                self.counts[i] += 1
+                self.sum += value
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip((*self.bounds, float('inf')), counts):
+            cumulative += count
+            samples.append((f"{name}_bucket", labels, (('le', _format_value(float(bound))),), cumulative))
+        samples.append((f"{name}_sum", labels, (), total))
+        samples.append((f"{name}_count", labels, (), cumulative))
+        return samples
+
+
+class Counter(_Metric):
+    """A total that only goes up."""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that is set rather than accumulated."""
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    """Observations counted into buckets with upper bounds, plus their sum."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        self.buckets = tuple(sorted(buckets or config.METRICS_LATENCY_BUCKETS))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+_hosts = set()
+_hosts_lock = threading.Lock()
+
+def host_label(host):
+    """
+    host as a label value, for at most METRICS_MAX_HOSTS distinct hosts;
+    later ones share "other", so a wide crawl can't grow /metrics without
+    bound.
+    """
+    if host in _hosts:
+        return host
+    with _hosts_lock:
+        if len(_hosts) < config.METRICS_MAX_HOSTS:
+            _hosts.add(host)
+            return host
+    return 'other'
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    return '\n'.join(metric.render() for metric in _metrics) + '\n'
+
+
+# Crawler
+FETCH_SECONDS = Histogram('crawler_fetch_seconds', 'Time to fetch a page, per host', ['host'])
+FETCH_BYTES = Counter('crawler_fetch_bytes_total', 'Response body bytes fetched, per host', ['host'])
+FETCHES = Counter('crawler_fetches_total', 'Fetch attempts by host and outcome (status code or "error")',
+                  ['host', 'status'])
+PARSE_SECONDS = Histogram('crawler_parse_seconds', 'Time to parse a fetched page')
+DUPLICATES = Counter('crawler_near_duplicates_total', 'Fetched pages stored as near-duplicates of another')
+FRONTIER_SIZE = Gauge('crawler_frontier_size', 'URLs waiting in the frontier of the running crawl')
+WRITER_QUEUE_DEPTH = Gauge('crawler_writer_queue_depth', 'Parsed pages waiting for the page writer')
+PAGES_WRITTEN = Counter('crawler_pages_written_total', 'Pages written by the page writer')
+
+# Storage
+DB_WRITE_SECONDS = Histogram('db_write_seconds', 'Duration of write transactions, lock wait and commit included',
+                             ['operation'])
+DB_LOCK_WAIT_SECONDS = Histogram('db_lock_wait_seconds', 'Time spent waiting for the database write lock',
+                                 ['operation'])
+
+# Indexer
+INDEX_DOCS = Counter('indexer_docs_total', 'Documents indexed')
+INDEX_BUILD_SECONDS = Gauge('indexer_last_build_seconds', 'Duration of the last index build')
+INDEX_DOCS_PER_SECOND = Gauge('indexer_last_build_docs_per_second', 'Indexing rate of the last index build')
+PAGERANK_ITERATIONS = Gauge('pagerank_last_iterations', 'Power iterations of the last PageRank run')
+PAGERANK_RESIDUAL = Gauge('pagerank_last_residual', 'L1 change in the last iteration of the last PageRank run')
+PAGERANK_SECONDS = Gauge('pagerank_last_seconds', 'Duration of the last PageRank run')
+
+# Search
+SEARCH_SECONDS = Histogram('search_seconds', 'Ranker.search latency, by whether the result cache answered',
+                           ['cache'])
+SEARCH_STAGE_SECONDS = Histogram('search_stage_seconds', 'Time per stage of searches that missed the cache',
+                                 ['stage'])
+SEARCH_POSTINGS_SCORED = Counter('search_postings_scored_total', 'Postings read and scored by searches')
+SEARCH_POSTINGS_SKIPPED = Counter('search_postings_skipped_total',
+                                  'Postings of query words that top-k pruning never read')
@@ -1,11 +1,64 @@
 import sqlite3
 import threading
+import hashlib
+import time
+import zlib
+from collections import defaultdict
 from contextlib import contextmanager
-from . import config
+from .. import config, metrics
 import logging
+try:
+    import zstandard
+except ImportError:  # zstd compression falls back to zlib
+    zstandard = None
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+UPSERT_PAGE_SQL = '''
+    INSERT INTO pages (url, title, content, cleaned_text, content_hash, simhash)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        title=excluded.title,
+        content=excluded.content,
+        cleaned_text=excluded.cleaned_text,
+        content_hash=excluded.content_hash,
+        simhash=excluded.simhash,
+        duplicate_of=NULL,
+        crawled_at=CURRENT_TIMESTAMP
+'''
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest() if text else None
+
+def document_hash(title, text):
+    """Hash of the indexed fields; pages are re-indexed when it changes."""
+    return content_hash(f"{title or ''}\n{text}") if text else None
+
+def to_signed64(value):
+    """SQLite integers are signed; fingerprints are stored in two's complement."""
+    return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+def from_signed64(value):
+    return value + (1 << 64) if value is not None and value < 0 else value
+
+def compress_content(html):
+    """Raw HTML as stored in pages.content, per RAW_HTML_COMPRESSION."""
+    if html is None or not config.RAW_HTML_COMPRESSION:
+        return html
+    data = html.encode('utf-8')
+    if config.RAW_HTML_COMPRESSION == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor().compress(data)
+    return zlib.compress(data)
+
+def decompress_content(value):
+    if value is None or isinstance(value, str): # uncompressed or legacy rows
+        return value
+    if value[:4] == ZSTD_MAGIC:
+        return zstandard.ZstdDecompressor().decompress(value).decode('utf-8')
+    return zlib.decompress(value).decode('utf-8')
+
 class Database:
     _instance = None
     _lock = threading.Lock()
@@ -15,25 +68,126 @@ class Database:
             with cls._lock:
                 if cls._instance is None:
                     cls._instance = super(Database, cls).__new__(cls)
+                    cls._instance._init_pool()
                     cls._instance.init_db()
         return cls._instance
 
     def __init__(self):
         pass
 
+    def _init_pool(self):
+        # One long-lived connection per thread, so sqlite3's statement cache
+        # and the pragmas below survive across calls.
+        self._local = threading.local()
+        self._connections = {}  # thread -> connection
+        self._pool_lock = threading.Lock()
+        self._pool_generation = 0
+        self.stats = {'connections_opened': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(config.DATABASE_PATH, check_same_thread=False,
+                               timeout=config.DB_BUSY_TIMEOUT,
+                               cached_statements=config.DB_STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row  # Access columns by name
+        conn.execute(f'PRAGMA journal_mode={config.DB_JOURNAL_MODE}')
+        conn.execute(f'PRAGMA synchronous={config.DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size=-{config.DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={config.DB_MMAP_SIZE}')
+        with self._pool_lock:
+            self.stats['connections_opened'] += 1
+        return conn
+
+    def _thread_connection(self):
+        local = self._local
+        if getattr(local, 'generation', None) != self._pool_generation:
+            conn = self._connect()
+            with self._pool_lock:
+                # Threads that have exited can't reuse their connection; close it.
+                for thread in [t for t in self._connections if not t.is_alive()]:
+                    self._connections.pop(thread).close()
+                self._connections[threading.current_thread()] = conn
+                local.generation = self._pool_generation
+            local.conn = conn
+            local.depth = 0
+        return local.conn
+
+    def close_all(self):
+        """Close every pooled connection; threads reconnect on next use."""
+        with self._pool_lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._pool_generation += 1
+
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(config.DATABASE_PATH, check_same_thread=False)
-        conn.row_factory = sqlite3.Row  # Access columns by name
+        if not config.DB_POOL_CONNECTIONS:
+            reading = getattr(self._local, 'read_conn', None)
+            if reading is not None:
+                yield reading  # read_transaction() on this thread owns it
+                return
+            conn = self._connect()
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Database error: {e}")
+                raise
+            finally:
+                conn.close()
+            return
+
+        # Nested get_connection() calls on the same thread share the
+        # outermost transaction; only the outermost block commits.
+        conn = self._thread_connection()
+        local = self._local
+        local.depth += 1
         try:
             yield conn
-            conn.commit()
+            if local.depth == 1:
+                conn.commit()
         except Exception as e:
-            conn.rollback()
-            logger.error(f"Database error: {e}")
+            if local.depth == 1:
+                conn.rollback()
+                logger.error(f"Database error: {e}")
             raise
         finally:
-            conn.close()
+            local.depth -= 1
+
+    @contextmanager
+    def write_transaction(self, operation):
+        """
+        get_connection() for a write, taking the write lock up front so the
+        wait for it and the whole transaction are timed per operation.
+        """
+        start = time.perf_counter()
+        with self.get_connection() as conn:
+            if not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE')
+            metrics.DB_LOCK_WAIT_SECONDS.labels(operation).observe(time.perf_counter() - start)
+            yield conn
+        metrics.DB_WRITE_SECONDS.labels(operation).observe(time.perf_counter() - start)
+
+    @contextmanager
+    def read_transaction(self):
+        """
+        get_connection() inside one read transaction. Under WAL every read
+        in it, including get_connection() calls on this thread while it is
+        open, sees the database as of its first read, whatever commits
+        meanwhile.
+        """
+        with self.get_connection() as conn:
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            pin = not config.DB_POOL_CONNECTIONS and getattr(self._local, 'read_conn', None) is None
+            if pin:
+                self._local.read_conn = conn
+            try:
+                yield conn
+            finally:
+                if pin:
+                    self._local.read_conn = None
 
     def init_db(self):
         """Initialize the database schema."""
@@ -47,9 +201,24 @@ class Database:
                     content TEXT,
                     cleaned_text TEXT,
                     pagerank REAL DEFAULT 0.0,
-                    crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    content_hash TEXT,
+                    indexed_hash TEXT,
+                    doc_length INTEGER,
+                    title_length INTEGER,
+                    simhash INTEGER,
+                    duplicate_of INTEGER
                 )
             ''')
+            # Databases created before incremental indexing lack these columns
+            self._ensure_column(cursor, 'pages', 'content_hash', 'TEXT')
+            self._ensure_column(cursor, 'pages', 'indexed_hash', 'TEXT')
+            if self._ensure_column(cursor, 'pages', 'doc_length', 'INTEGER'):
+                # Length norms and title postings need every page re-indexed
+                cursor.execute('UPDATE pages SET content_hash = NULL, indexed_hash = NULL')
+            self._ensure_column(cursor, 'pages', 'title_length', 'INTEGER')
+            self._ensure_column(cursor, 'pages', 'simhash', 'INTEGER')
+            self._ensure_column(cursor, 'pages', 'duplicate_of', 'INTEGER')
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS links (
                     source_id INTEGER,
@@ -64,33 +233,211 @@ class Database:
                     word TEXT,
                     doc_id INTEGER,
                     term_frequency INTEGER,
+                    title_frequency INTEGER DEFAULT 0,
+                    positions BLOB,
+                    offsets BLOB,
                     PRIMARY KEY (word, doc_id),
                     FOREIGN KEY(doc_id) REFERENCES pages(id)
                 )
             ''')
+            self._ensure_column(cursor, 'keywords', 'title_frequency', 'INTEGER DEFAULT 0')
+            if self._ensure_column(cursor, 'keywords', 'positions', 'BLOB'):
+                # Positional postings need every page re-indexed
+                cursor.execute('UPDATE pages SET content_hash = NULL, indexed_hash = NULL')
+            self._ensure_column(cursor, 'keywords', 'offsets', 'BLOB')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fetch_meta (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_length INTEGER,
+                    body_hash TEXT,
+                    fetched_at REAL,
+                    changed_at REAL,
+                    fetch_count INTEGER DEFAULT 0,
+                    change_count INTEGER DEFAULT 0,
+                    refresh_interval REAL,
+                    next_fetch_at REAL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS robots (
+                    host TEXT PRIMARY KEY,
+                    status INTEGER,
+                    body TEXT,
+                    expires_at REAL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS term_stats (
+                    word TEXT PRIMARY KEY,
+                    df INTEGER,
+                    cf INTEGER,
+                    max_tf INTEGER DEFAULT 0,
+                    max_tf_ratio REAL DEFAULT 0,
+                    max_title_tf INTEGER DEFAULT 0,
+                    max_title_ratio REAL DEFAULT 0
+                )
+            ''')
+            # Score bounds for top-k pruning; older databases get them from a rebuild
+            rebuild_stats = False
+            for column, declaration in (('max_tf', 'INTEGER DEFAULT 0'), ('max_tf_ratio', 'REAL DEFAULT 0'),
+                                        ('max_title_tf', 'INTEGER DEFAULT 0'), ('max_title_ratio', 'REAL DEFAULT 0')):
+                rebuild_stats = self._ensure_column(cursor, 'term_stats', column, declaration) or rebuild_stats
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS collection_stats (
+                    key TEXT PRIMARY KEY,
+                    value REAL
+                )
+            ''')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_keywords_word ON keywords(word)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_keywords_doc ON keywords(doc_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_pages_url ON pages(url)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_pages_duplicate_of ON pages(duplicate_of)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_fetch_meta_due ON fetch_meta(next_fetch_at)')
+
+            cursor.execute('SELECT EXISTS(SELECT 1 FROM term_stats), EXISTS(SELECT 1 FROM keywords)')
+            has_stats, has_postings = cursor.fetchone()
+            if has_postings and (rebuild_stats or not has_stats):
+                # Index built before term statistics, or their score bounds, were tracked
+                self.rebuild_term_stats()
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM collection_stats WHERE key = 'max_pagerank')")
+            if has_postings and not cursor.fetchone()[0]:
+                self._store_max_pagerank(cursor)
 
             logger.info("Database initialized successfully.")
 
+    def _ensure_column(self, cursor, table, column, declaration):
+        """Adds column if missing; returns True if it had to."""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row['name'] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+            return True
+        return False
+
     def add_page(self, url, title, content, cleaned_text):
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO pages (url, title, content, cleaned_text) 
-                    VALUES (?, ?, ?, ?)
-                    ON CONFLICT(url) DO UPDATE SET
-                        title=excluded.title,
-                        content=excluded.content,
-                        cleaned_text=excluded.cleaned_text,
-                        crawled_at=CURRENT_TIMESTAMP
-                ''', (url, title, content, cleaned_text))
-                return cursor.lastrowid
+                cursor.execute(UPSERT_PAGE_SQL, (url, title, compress_content(content), cleaned_text,
+                                                 document_hash(title, cleaned_text), None))
+                # lastrowid is stale after the UPDATE branch on a reused connection
+                cursor.execute('SELECT id FROM pages WHERE url = ?', (url,))
+                return cursor.fetchone()['id']
         except Exception as e:
             logger.error(f"Error adding page {url}: {e}")
             return None
 
+    def save_crawl_batch(self, pages, fetch_meta=(), duplicates=()):
+        """
+        pages: list of dicts with url, title, content, text and links, and
+        optionally their simhash.
+        fetch_meta: fetch_meta rows as built by FreshnessScheduler.record.
+        duplicates: (url, canonical_url, simhash) of near-duplicate pages.
+        Upserts the pages, inserts stub pages for their outlinks and the
+        link rows, records fetch metadata and collapses duplicates onto
+        their canonical pages, all in one transaction.
+        """
+        if not pages and not fetch_meta and not duplicates:
+            return
+
+        page_rows = [(p['url'], p['title'], compress_content(p['content']), p['text'],
+                      document_hash(p['title'], p['text']), to_signed64(p.get('simhash')))
+                     for p in pages]
+        stub_rows = [(link,) for p in pages for link in p['links']]
+        link_rows = [(p['url'], link) for p in pages for link in p['links']]
+
+        with self.write_transaction('crawl_batch') as conn:
+            cursor = conn.cursor()
+            cursor.executemany(UPSERT_PAGE_SQL, page_rows)
+            cursor.executemany('INSERT OR IGNORE INTO pages (url) VALUES (?)', stub_rows)
+            # Resolve both ends by url inside SQLite instead of a lookup per
+            # link; a link to a known duplicate counts for its canonical page
+            cursor.executemany('''
+                INSERT OR IGNORE INTO links (source_id, target_id)
+                SELECT s.id, COALESCE(t.duplicate_of, t.id) FROM pages s, pages t
+                WHERE s.url = ? AND t.url = ? AND s.id != COALESCE(t.duplicate_of, t.id)
+            ''', link_rows)
+            cursor.executemany('''
+                INSERT OR REPLACE INTO fetch_meta
+                    (url, etag, last_modified, content_length, body_hash, fetched_at, changed_at,
+                     fetch_count, change_count, refresh_interval, next_fetch_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', fetch_meta)
+            for url, canonical_url, fingerprint in duplicates:
+                self._collapse_duplicate(cursor, url, canonical_url, fingerprint)
+
+    def _collapse_duplicate(self, cursor, url, canonical_url, fingerprint):
+        """
+        Turns url's page into an alias of canonical_url's: its text goes
+        (so the next index build drops its postings), its links move to the
+        canonical page, and pages that were its duplicates follow it.
+        """
+        cursor.executemany('INSERT OR IGNORE INTO pages (url) VALUES (?)', [(canonical_url,), (url,)])
+        cursor.execute('SELECT COALESCE(duplicate_of, id) FROM pages WHERE url = ?', (canonical_url,))
+        canonical_id = cursor.fetchone()[0]
+        cursor.execute('SELECT id FROM pages WHERE url = ?', (url,))
+        page_id = cursor.fetchone()[0]
+        if page_id == canonical_id:
+            return
+        cursor.execute('''
+            UPDATE pages SET title = NULL, content = NULL, cleaned_text = NULL, content_hash = NULL,
+                             simhash = ?, duplicate_of = ?
+            WHERE id = ?
+        ''', (to_signed64(fingerprint), canonical_id, page_id))
+        cursor.execute('UPDATE pages SET duplicate_of = ? WHERE duplicate_of = ?', (canonical_id, page_id))
+        cursor.execute('''
+            INSERT OR IGNORE INTO links (source_id, target_id)
+            SELECT source_id, ? FROM links WHERE target_id = ? AND source_id != ?
+        ''', (canonical_id, page_id, canonical_id))
+        cursor.execute('''
+            INSERT OR IGNORE INTO links (source_id, target_id)
+            SELECT ?, target_id FROM links WHERE source_id = ? AND target_id != ?
+        ''', (canonical_id, page_id, canonical_id))
+        cursor.execute('DELETE FROM links WHERE source_id = ? OR target_id = ?', (page_id, page_id))
+
+    def get_fingerprints(self):
+        """(url, simhash) of every canonical page that has a fingerprint."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT url, simhash FROM pages WHERE simhash IS NOT NULL AND duplicate_of IS NULL')
+            return [(row[0], from_signed64(row[1])) for row in cursor.fetchall()]
+
+    def get_fetch_meta(self, url):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM fetch_meta WHERE url = ?', (url,))
+            return cursor.fetchone()
+
+    def get_due_urls(self, now, limit):
+        """URLs whose next re-crawl time has passed, most overdue first."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT url FROM fetch_meta WHERE next_fetch_at <= ?
+                ORDER BY next_fetch_at LIMIT ?
+            ''', (now, limit))
+            return [row['url'] for row in cursor.fetchall()]
+
+    def get_robots(self, host):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT status, body, expires_at FROM robots WHERE host = ?', (host,))
+            return cursor.fetchone()
+
+    def save_robots(self, host, status, body, expires_at):
+        with self.get_connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO robots (host, status, body, expires_at) VALUES (?, ?, ?, ?)',
+                         (host, status, body, expires_at))
+
+    def get_page_content(self, page_id):
+        """The stored raw HTML of a page, decompressed; None if not kept."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT content FROM pages WHERE id = ?', (page_id,))
+            row = cursor.fetchone()
+            return decompress_content(row['content']) if row else None
+
     def get_page_id(self, url):
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -112,9 +459,10 @@ class Database:
             ''', (source_id, target_id))
 
     def get_all_pages(self):
+        """Every page except known duplicates, which only stand in for their canonical page."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT id, url FROM pages')
+            cursor.execute('SELECT id, url FROM pages WHERE duplicate_of IS NULL')
             return cursor.fetchall()
             
     def get_links_count(self):
@@ -127,22 +475,289 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('UPDATE pages SET pagerank = ? WHERE id = ?', (rank, page_id))
+            cursor.execute('''
+                INSERT INTO collection_stats (key, value) VALUES ('max_pagerank', ?)
+                ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+            ''', (rank,))
+
+    def update_pageranks(self, scores):
+        """scores: iterable of (page_id, rank), written in one transaction."""
+        with self.write_transaction('pageranks') as conn:
+            cursor = conn.cursor()
+            cursor.executemany('UPDATE pages SET pagerank = ? WHERE id = ?',
+                               ((rank, page_id) for page_id, rank in scores))
+            self._store_max_pagerank(cursor)
+
+    def _store_max_pagerank(self, cursor):
+        """The highest PageRank of any page, which bounds its share of a score for top-k pruning."""
+        cursor.execute('''
+            INSERT OR REPLACE INTO collection_stats (key, value)
+            SELECT 'max_pagerank', COALESCE(MAX(pagerank), 0) FROM pages
+        ''')
 
-    def save_keywords(self, doc_id, word_freqs):
+    def iter_pages_to_index(self, batch_size, full=False):
         """
-        word_freqs: dict of word -> frequency
+        Yields batches of pages whose text changed since they were last
+        indexed (every page with text when full=True). Pages that lost
+        their text have their postings dropped first.
         """
-        if not word_freqs:
-            return
-            
-        data = [(word, doc_id, freq) for word, freq in word_freqs.items()]
-        
+        self.replace_keywords([(page_id, None, {}, {}, {}) for page_id in self.get_lost_pages()])
+
+        stale = '' if full else 'AND (indexed_hash IS NULL OR content_hash IS NULL OR indexed_hash != content_hash)'
+        last_id = 0
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT id, title, cleaned_text, content_hash FROM pages
+                    WHERE id > ? AND cleaned_text IS NOT NULL {stale}
+                    ORDER BY id LIMIT ?
+                ''', (last_id, batch_size))
+                rows = cursor.fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]['id']
+
+    def get_lost_pages(self):
+        """Ids of indexed pages that no longer have any text."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute('SELECT id FROM pages WHERE cleaned_text IS NULL AND indexed_hash IS NOT NULL')
+            return [row['id'] for row in cursor.fetchall()]
+
+    def mark_indexed(self, rows):
+        """
+        rows: (doc_id, content_hash, doc_length, title_length). Records
+        field lengths and marks pages indexed at content_hash, for indexes
+        kept outside the keywords table.
+        """
+        with self.write_transaction('mark_indexed') as conn:
+            conn.executemany('''
+                UPDATE pages SET content_hash = ?, indexed_hash = ?, doc_length = ?, title_length = ?
+                WHERE id = ?
+            ''', [(text_hash, text_hash, doc_length, title_length, doc_id)
+                  for doc_id, text_hash, doc_length, title_length in rows])
+
+    def replace_keywords(self, docs):
+        """
+        docs: list of (doc_id, content_hash, word_freqs, title_freqs,
+        positions), positions mapping body words to their (positions,
+        offsets) blobs. Brings each document's postings in line with them,
+        deleting words it no longer contains, records its field lengths,
+        marks it indexed at content_hash and applies the resulting changes
+        to term_stats and collection_stats.
+        """
+        term_deltas = defaultdict(lambda: [0, 0, 0, 0.0, 0, 0.0])  # word -> [df, cf, score bounds]
+        num_docs = num_terms = num_title_terms = 0
+        with self.write_transaction('keywords') as conn:
+            cursor = conn.cursor()
+            for doc_id, text_hash, word_freqs, title_freqs, positions in docs:
+                cursor.execute('''
+                    SELECT word, term_frequency, title_frequency, positions, offsets
+                    FROM keywords WHERE doc_id = ?
+                ''', (doc_id,))
+                old = {row['word']: (row['term_frequency'], row['title_frequency'] or 0,
+                                     row['positions'], row['offsets'])
+                       for row in cursor.fetchall()}
+                new = {word: (word_freqs.get(word, 0), title_freqs.get(word, 0),
+                              *positions.get(word, (None, None)))
+                       for word in word_freqs.keys() | title_freqs.keys()}
+                removed = old.keys() - new.keys()
+                changed = [(word, freqs) for word, freqs in new.items() if old.get(word) != freqs]
+
+                cursor.executemany('DELETE FROM keywords WHERE word = ? AND doc_id = ?',
+                                   [(word, doc_id) for word in removed])
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO keywords
+                        (word, doc_id, term_frequency, title_frequency, positions, offsets)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(word, doc_id, *postings) for word, postings in changed])
+                doc_length, title_length = sum(word_freqs.values()), sum(title_freqs.values())
+                cursor.execute('''
+                    UPDATE pages SET content_hash = ?, indexed_hash = ?, doc_length = ?, title_length = ?
+                    WHERE id = ?
+                ''', (text_hash, text_hash, doc_length if new else None, title_length if new else None, doc_id))
+
+                for word in removed:
+                    term_deltas[word][0] -= 1
+                    term_deltas[word][1] -= old[word][0]
+                for word, (tf, *_) in changed:
+                    term_deltas[word][0] += word not in old
+                    term_deltas[word][1] += tf - (old[word][0] if word in old else 0)
+                # A new length changes the ratios of unchanged words too. Bounds
+                # only ever grow here; rebuild_term_stats() tightens them again
+                for word, (tf, title_tf, *_) in new.items():
+                    bounds = term_deltas[word]
+                    bounds[2] = max(bounds[2], tf)
+                    bounds[3] = max(bounds[3], tf / doc_length if doc_length else 0.0)
+                    bounds[4] = max(bounds[4], title_tf)
+                    bounds[5] = max(bounds[5], title_tf / title_length if title_length else 0.0)
+                num_docs += bool(new) - bool(old)
+                num_terms += doc_length - sum(postings[0] for postings in old.values())
+                num_title_terms += title_length - sum(postings[1] for postings in old.values())
+
+            cursor.executemany('''
+                INSERT INTO term_stats (word, df, cf, max_tf, max_tf_ratio, max_title_tf, max_title_ratio)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(word) DO UPDATE SET
+                    df = df + excluded.df, cf = cf + excluded.cf,
+                    max_tf = MAX(max_tf, excluded.max_tf), max_tf_ratio = MAX(max_tf_ratio, excluded.max_tf_ratio),
+                    max_title_tf = MAX(max_title_tf, excluded.max_title_tf),
+                    max_title_ratio = MAX(max_title_ratio, excluded.max_title_ratio)
+            ''', [(word, *deltas) for word, deltas in term_deltas.items()])
+            cursor.executemany('DELETE FROM term_stats WHERE word = ? AND df <= 0',
+                               [(word,) for word, (df, *_) in term_deltas.items() if df < 0])
             cursor.executemany('''
-                INSERT OR REPLACE INTO keywords (word, doc_id, term_frequency)
-                VALUES (?, ?, ?)
-            ''', data)
+                INSERT INTO collection_stats (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = value + excluded.value
+            ''', [('num_docs', num_docs), ('num_terms', num_terms), ('num_title_terms', num_title_terms)])
+
+    def rebuild_term_stats(self):
+        """Recompute term_stats and collection_stats from the keywords table."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM term_stats')
+            cursor.execute('''
+                INSERT INTO term_stats (word, df, cf, max_tf, max_tf_ratio, max_title_tf, max_title_ratio)
+                SELECT k.word, COUNT(*), SUM(k.term_frequency), MAX(k.term_frequency),
+                       COALESCE(MAX(k.term_frequency * 1.0 / p.doc_length), 0),
+                       COALESCE(MAX(k.title_frequency), 0),
+                       COALESCE(MAX(k.title_frequency * 1.0 / p.title_length), 0)
+                FROM keywords k JOIN pages p ON p.id = k.doc_id
+                GROUP BY k.word
+            ''')
+            cursor.execute('DELETE FROM collection_stats')
+            cursor.execute('''
+                INSERT INTO collection_stats (key, value)
+                SELECT 'num_docs', COUNT(DISTINCT doc_id) FROM keywords
+                UNION ALL
+                SELECT 'num_terms', COALESCE(SUM(term_frequency), 0) FROM keywords
+                UNION ALL
+                SELECT 'num_title_terms', COALESCE(SUM(title_frequency), 0) FROM keywords
+            ''')
+            self._store_max_pagerank(cursor)
+        logger.info("Rebuilt term statistics from postings.")
+
+    def get_collection_stats(self):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT key, value FROM collection_stats')
+            return {row['key']: row['value'] for row in cursor.fetchall()}
+
+    def get_postings(self, words, doc_ids=None):
+        """
+        All postings for words in one query as (word, doc_id,
+        term_frequency, title_frequency, df, doc_length, title_length,
+        pagerank) rows, only those of doc_ids if given. Rows come in word
+        order either way, so a document's scores add up in the same order.
+        """
+        if not words:
+            return []
+        placeholders = ','.join('?' * len(words))
+        sql = f'''
+            SELECT k.word, k.doc_id, k.term_frequency, k.title_frequency, t.df,
+                   p.doc_length, p.title_length, p.pagerank
+            FROM keywords k
+            JOIN term_stats t ON t.word = k.word
+            JOIN pages p ON p.id = k.doc_id
+            WHERE k.word IN ({placeholders}) {{}}
+            ORDER BY k.word
+        '''
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if doc_ids is None:
+                cursor.execute(sql.format(''), list(words))
+                return cursor.fetchall()
+            doc_ids = list(doc_ids)
+            rows = []
+            for start in range(0, len(doc_ids), 500):
+                chunk = doc_ids[start:start + 500]
+                cursor.execute(sql.format(f"AND k.doc_id IN ({','.join('?' * len(chunk))})"), [*words, *chunk])
+                rows.extend(cursor.fetchall())
+            return rows
+
+    def get_term_bounds(self, words):
+        """
+        {word: (df, max_tf, max_tf_ratio, max_title_tf, max_title_ratio)}
+        for the words with postings: the largest body and title frequency
+        of each word, and of each relative to its field's length. They
+        bound the word's score in any document; see Ranker._term_bounds.
+        """
+        if not words:
+            return {}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT word, df, max_tf, max_tf_ratio, max_title_tf, max_title_ratio
+                FROM term_stats WHERE word IN ({','.join('?' * len(words))})
+            ''', list(words))
+            return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+    def get_vocabulary(self):
+        """(word, df) of every indexed word, in word order."""
+        with self.get_connection() as conn:
+            yield from conn.execute('SELECT word, df FROM term_stats ORDER BY word')
+
+    def get_positions(self, words, doc_ids):
+        """
+        {(word, doc_id): (positions, offsets)} blobs for the given words in
+        the given documents; None blobs for postings indexed without them.
+        """
+        positions = {}
+        if not words or not doc_ids:
+            return positions
+        doc_ids = list(doc_ids)
+        word_placeholders = ','.join('?' * len(words))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(doc_ids), 500):
+                chunk = doc_ids[start:start + 500]
+                cursor.execute(f'''
+                    SELECT word, doc_id, positions, offsets FROM keywords
+                    WHERE word IN ({word_placeholders}) AND doc_id IN ({','.join('?' * len(chunk))})
+                ''', [*words, *chunk])
+                for row in cursor:
+                    positions[row[0], row[1]] = (row[2], row[3])
+        return positions
+
+    def get_pageranks(self, page_ids):
+        """{id: pagerank} for page_ids."""
+        page_ids = list(page_ids)
+        pageranks = {}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(page_ids), 500):
+                chunk = page_ids[start:start + 500]
+                cursor.execute(f'SELECT id, pagerank FROM pages WHERE id IN ({",".join("?" * len(chunk))})', chunk)
+                pageranks.update((row[0], row[1]) for row in cursor)
+        return pageranks
+
+    def get_all_pageranks(self):
+        """(id, pagerank) of every page, in id order."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, pagerank FROM pages ORDER BY id')
+            return cursor.fetchall()
+
+    def get_pages(self, page_ids):
+        """url, title and cleaned_text for page_ids, keyed by id."""
+        if not page_ids:
+            return {}
+        placeholders = ','.join('?' * len(page_ids))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT id, url, title, cleaned_text FROM pages WHERE id IN ({placeholders})',
+                           list(page_ids))
+            return {row['id']: row for row in cursor.fetchall()}
+
+    def iter_indexed_pages(self):
+        """(id, url, title, cleaned_text) of every indexed page, in id order."""
+        with self.get_connection() as conn:
+            yield from conn.execute('''
+                SELECT id, url, title, cleaned_text FROM pages
+                WHERE indexed_hash IS NOT NULL ORDER BY id
+            ''')
 
     def get_document_count(self):
         with self.get_connection() as conn: